@@ -0,0 +1,107 @@
+"""
+Simulation of a client calling an overloaded backend through a
+:class:`poll.Bulkhead` with various fixed limits, and through an
+:class:`poll.AdaptiveLimit`.
+
+The backend has a number of workers and a queue; calls which
+arrive while every worker is busy wait their turn. Half way through,
+half of the workers are lost. Calls arrive faster than the backend can
+serve them, and the client gives up on any call which takes longer
+than its timeout (though the backend still does the work).
+A good limit keeps the backend's workers busy without letting a queue
+build up, so that admitted calls are fast and the excess is rejected
+straight away.
+
+The simulation runs in virtual time, so it finishes in a few seconds.
+
+    $ python benchmarks/adaptive_limit.py
+"""
+import heapq
+import random
+
+from poll import AdaptiveLimit, Bulkhead
+
+
+WORKERS = 20
+WORKERS_AFTER_FAILURE = 10
+SERVICE_TIME = 0.05
+ARRIVALS_PER_SECOND = 600
+CLIENT_TIMEOUT = 1.0
+DURATION = 60.0
+SAMPLE_EVERY = 5.0
+
+LIMITERS = [
+    ("no limit", lambda: Bulkhead(10 ** 9)),
+    ("fixed 10", lambda: Bulkhead(10)),
+    ("fixed 20", lambda: Bulkhead(20)),
+    ("fixed 100", lambda: Bulkhead(100)),
+    ("adaptive", lambda: AdaptiveLimit()),
+]
+
+
+def simulate(limiter, seed=0):
+    rand = random.Random(seed)
+    worker_free_at = [0.0] * WORKERS
+    releases = []
+    latencies = []
+    results = {"ok": 0, "rejected": 0, "timed_out": 0}
+    samples = []
+    next_sample = 0.0
+    failed_over = False
+
+    now = 0.0
+    while now < DURATION:
+        now += rand.expovariate(ARRIVALS_PER_SECOND)
+        if not failed_over and now >= DURATION / 2:
+            worker_free_at = sorted(worker_free_at)[:WORKERS_AFTER_FAILURE]
+            failed_over = True
+        while releases and releases[0][0] <= now:
+            _, latency, failed = heapq.heappop(releases)
+            limiter._release(latency, failed)
+        while now >= next_sample:
+            samples.append((next_sample, getattr(limiter, "limit", limiter.max_calls)))
+            next_sample += SAMPLE_EVERY
+
+        if not limiter._try_acquire():
+            results["rejected"] += 1
+            continue
+        start = max(now, heapq.heappop(worker_free_at))
+        finish = start + rand.expovariate(1 / SERVICE_TIME)
+        heapq.heappush(worker_free_at, finish)
+        failed = finish - now > CLIENT_TIMEOUT
+        latency = CLIENT_TIMEOUT if failed else finish - now
+        heapq.heappush(releases, (now + latency, latency, failed))
+        latencies.append(latency)
+        results["timed_out" if failed else "ok"] += 1
+
+    latencies.sort()
+    results["p50"] = latencies[len(latencies) // 2]
+    results["p99"] = latencies[len(latencies) * 99 // 100]
+    results["samples"] = samples
+    return results
+
+
+def main():
+    print("backend capacity {:.0f} calls/s, then {:.0f} calls/s; offered load {} calls/s".format(
+        WORKERS / SERVICE_TIME, WORKERS_AFTER_FAILURE / SERVICE_TIME, ARRIVALS_PER_SECOND
+    ))
+    print()
+    columns = ["limiter", "ok/s", "timed out/s", "rejected/s", "p50 (ms)", "p99 (ms)"]
+    print("{:<12} {:>8} {:>12} {:>11} {:>9} {:>9}".format(*columns))
+    adaptive_samples = None
+    for name, make_limiter in LIMITERS:
+        r = simulate(make_limiter())
+        print("{:<12} {:>8.0f} {:>12.0f} {:>11.0f} {:>9.0f} {:>9.0f}".format(
+            name, r["ok"] / DURATION, r["timed_out"] / DURATION, r["rejected"] / DURATION, r["p50"] * 1000, r["p99"] * 1000
+        ))
+        if name == "adaptive":
+            adaptive_samples = r["samples"]
+
+    print()
+    print("adaptive limit over time (the backend has {} workers, then {}):".format(WORKERS, WORKERS_AFTER_FAILURE))
+    for t, limit in adaptive_samples:
+        print("{:>6.0f}s {:>7.1f}".format(t, limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Simulation of a 'thundering herd' of clients retrying against
+a backend which is recovering from an outage, under each of the
+strategies in :mod:`poll.backoff`.
+
+Every client makes one call at the start of the simulation, while the
+backend is down, and retries until it succeeds. Once the backend is up
+it can serve a fixed number of calls per time slot; calls beyond that
+fail as if the backend had been knocked over again.
+
+    $ python benchmarks/backoff_herd.py
+"""
+import heapq
+import random
+
+from poll.backoff import Constant, Linear, Exponential, FullJitter, EqualJitter, DecorrelatedJitter
+
+
+CLIENTS = 1000
+RECOVERY_TIME = 5.0
+SLOT = 0.1
+CAPACITY_PER_SLOT = 50
+MAX_ATTEMPTS = 100
+
+STRATEGIES = [
+    ("constant", lambda seed: Constant(1)),
+    ("linear", lambda seed: Linear(0.5, 0.5, maximum=10)),
+    ("exponential", lambda seed: Exponential(0.1, 2, maximum=10)),
+    ("full jitter", lambda seed: FullJitter(0.1, 2, maximum=10, seed=seed)),
+    ("equal jitter", lambda seed: EqualJitter(0.1, 2, maximum=10, seed=seed)),
+    ("decorrelated jitter", lambda seed: DecorrelatedJitter(0.1, maximum=10, seed=seed)),
+]
+
+
+def simulate(make_strategy, seed=0):
+    start_times = random.Random(seed)
+    calls = []
+    for client in range(CLIENTS):
+        heapq.heappush(calls, (start_times.uniform(0, SLOT), client, iter(make_strategy(client)), 1))
+
+    load = {}
+    finish_times = []
+    total_calls = 0
+    while calls:
+        now, client, delays, attempt = heapq.heappop(calls)
+        total_calls += 1
+        slot = int(now / SLOT)
+        load[slot] = load.get(slot, 0) + 1
+        if now >= RECOVERY_TIME and load[slot] <= CAPACITY_PER_SLOT:
+            finish_times.append(now)
+        elif attempt < MAX_ATTEMPTS:
+            heapq.heappush(calls, (now + next(delays), client, delays, attempt + 1))
+
+    recovered = [n for slot, n in load.items() if slot * SLOT >= RECOVERY_TIME]
+    finish_times.sort()
+    return {
+        "calls": total_calls,
+        "succeeded": len(finish_times),
+        "peak_load": max(recovered) / CAPACITY_PER_SLOT if recovered else 0,
+        "p50_finish": finish_times[len(finish_times) // 2] if finish_times else float("inf"),
+        "last_finish": finish_times[-1] if finish_times else float("inf"),
+    }
+
+
+def main():
+    columns = ["strategy", "calls", "succeeded", "peak load", "p50 done (s)", "all done (s)"]
+    print("{:<20} {:>8} {:>10} {:>10} {:>13} {:>13}".format(*columns))
+    for name, make_strategy in STRATEGIES:
+        r = simulate(make_strategy)
+        print("{:<20} {:>8} {:>10} {:>9.1f}x {:>13.2f} {:>13.2f}".format(
+            name, r["calls"], r["succeeded"], r["peak_load"], r["p50_finish"], r["last_finish"]
+        ))
+    print()
+    print("peak load is the busiest post-recovery time slot as a multiple of the backend's capacity")
+
+
+if __name__ == "__main__":
+    main()
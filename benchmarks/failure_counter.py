@@ -0,0 +1,66 @@
+"""
+Throughput of the circuit breaker's failure counter.
+
+Compares the ring buffer used by ``_FailureCounter`` with the
+unbounded deque (and eviction ``print``) used by poll 1.0,
+during a failure storm where old failures are constantly evicted.
+
+    $ python benchmarks/failure_counter.py
+"""
+import collections
+import contextlib
+import os
+import time
+import timeit
+
+from poll import _FailureCounter
+
+
+class DequeFailureCounter(object):
+    def __init__(self, threshold, timeout):
+        self._failure_times = collections.deque()
+        self._threshold = threshold
+        self._timeout = timeout
+        self._broken_time = None
+
+    def add_failure(self):
+        self._update_failures()
+        self._failure_times.append(time.perf_counter())
+        if len(self._failure_times) >= self._threshold or self._is_halfbroken():
+            self._broken_time = time.perf_counter()
+
+    def add_success(self):
+        if self._is_halfbroken():
+            self._failure_times = collections.deque()
+        self._update_failures()
+        self._broken_time = None
+
+    def _is_halfbroken(self):
+        return self._broken_time is not None and time.perf_counter() - self._broken_time >= self._timeout
+
+    def _update_failures(self):
+        current_time = time.perf_counter()
+        while self._failure_times and self._failure_times[0] < (current_time - self._timeout):
+            result = self._failure_times.popleft()
+            print(result, self._failure_times[0] if self._failure_times else None)
+
+
+def measure(counter_class, method, number):
+    # a tiny timeout means almost every failure evicts an older one
+    counter = counter_class(threshold=5, timeout=1e-6)
+    return timeit.timeit(getattr(counter, method), number=number)
+
+
+def main(number=200000):
+    print("{:<14} {:>16} {:>16}".format("operation", "deque (ops/s)", "ring (ops/s)"))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = [
+            (method, measure(DequeFailureCounter, method, number), measure(_FailureCounter, method, number))
+            for method in ("add_failure", "add_success")
+        ]
+    for method, before, after in results:
+        print("{:<14} {:>16,.0f} {:>16,.0f}".format(method, number / before, number / after))
+
+
+if __name__ == "__main__":
+    main()
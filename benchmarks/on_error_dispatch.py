@@ -0,0 +1,63 @@
+"""
+Microbenchmark for the per-failure cost of dispatching ``on_error``.
+
+Compares inspecting the callback's signature on every failure
+(the behaviour of poll 1.0) with working out its arity once
+and reusing an adapter.
+
+    $ python benchmarks/on_error_dispatch.py
+"""
+import functools
+import inspect
+import timeit
+
+from poll import _adapt_callback
+
+
+def call_with_correct_number_of_args(f, args):
+    arg_count = len(inspect.signature(f).parameters)
+    return f(*args[:arg_count])
+
+
+class Logger:
+    def log(self, ex):
+        pass
+
+
+def no_args():
+    pass
+
+
+def one_arg(ex):
+    pass
+
+
+def two_args(ex, count):
+    pass
+
+
+def tagged(tag, ex, count):
+    pass
+
+
+CALLBACKS = [
+    ("no params", no_args),
+    ("one param", one_arg),
+    ("two params", two_args),
+    ("bound method", Logger().log),
+    ("functools.partial", functools.partial(tagged, "tag")),
+]
+
+
+def main(number=100000):
+    ex = ValueError()
+    print("{:<20} {:>12} {:>12}".format("callback", "before (us)", "after (us)"))
+    for name, callback in CALLBACKS:
+        before = timeit.timeit(lambda: call_with_correct_number_of_args(callback, (ex, 1)), number=number)
+        adapted = _adapt_callback(callback, 2)
+        after = timeit.timeit(lambda: adapted(ex, 1), number=number)
+        print("{:<20} {:>12.3f} {:>12.3f}".format(name, before / number * 1e6, after / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
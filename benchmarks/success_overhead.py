@@ -0,0 +1,58 @@
+"""
+Microbenchmark for the per-call overhead of :func:`poll.retry` and
+:func:`poll.poll` when the decorated function succeeds first time,
+compared with calling the function directly.
+
+    $ python benchmarks/success_overhead.py
+
+The decorators aim to add less than ``BUDGET`` microseconds to a call
+which succeeds first time, untraced; decorated calls over the budget
+are marked, and make the exit status 1. This is a wall-clock figure, so it is
+checked here rather than in the tests.
+"""
+import sys
+import timeit
+
+from poll import poll, retry, retry_
+
+
+# microseconds
+BUDGET = 3
+
+
+def succeed():
+    return 1
+
+
+# name, function, whether it's held to the budget. retry_ builds
+# a new wrapper on every call, so it's only shown for comparison
+CALLS = [
+    ("bare function", succeed, False),
+    ("@retry", retry(ValueError, times=3, interval=1)(succeed), True),
+    ("@poll", poll(lambda x: x == 1, timeout=15, interval=1)(succeed), True),
+    ("@poll (no timeout)", poll(lambda x: x == 1, timeout=float("inf"), interval=1)(succeed), True),
+    ("retry_", lambda: retry_(succeed, ValueError, times=3, interval=1), False),
+]
+
+
+def per_call(f, number, repeat=5):
+    """
+    :return: The fastest of ``repeat`` timings of one call to ``f``, in microseconds.
+    """
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number * 1e6
+
+
+def main(number=200000):
+    bare = per_call(succeed, number)
+    over_budget = False
+    print("{:<20} {:>12} {:>14}".format("call", "time (us)", "overhead (us)"))
+    for name, f, budgeted in CALLS:
+        t = per_call(f, number)
+        over = budgeted and t - bare > BUDGET
+        over_budget = over_budget or over
+        print("{:<20} {:>12.3f} {:>14.3f}{}".format(name, t, t - bare, "  OVER BUDGET" if over else ""))
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Benchmark suite for the hot paths of :mod:`poll`, with results which
+can be saved as JSON and compared against a stored baseline.
+
+Every benchmark is given a :class:`poll.clock.VirtualClock`, so that
+sleeping in between retries costs nothing and the timings measure
+only the library's own work. (A :class:`poll.poller.Poller` always
+runs on real time, so its polls don't sleep at all.)
+
+    $ python benchmarks/suite.py
+    $ python benchmarks/suite.py --json results.json
+    $ python benchmarks/suite.py --save
+
+Each result is the time per operation in microseconds (lower is better).
+Every benchmark is run ``--rounds`` times, and the median, quartiles,
+fastest and slowest of its rounds are kept. Timings on a shared machine
+are noisy, so a benchmark is only reported as a regression if its median
+is slower than the baseline's by more than ``--tolerance`` plus the noise:
+the interquartile range of the rounds as a fraction of the median
+(in this run or the baseline's, whichever is larger), which is unmoved
+by a few outlying rounds, and which counts for at most ``MAX_NOISE``.
+A regression makes the exit status 1. The baseline belongs to
+the machine which saved it, so save a fresh one (with ``--save``)
+before comparing on another machine.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import timeit
+
+from poll import _FailureCounter, circuitbreaker, exec_, poll, retry
+from poll.clock import VirtualClock
+from poll.poller import Poller
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# however noisy the rounds, a benchmark this much slower
+# than the baseline (beyond the tolerance) is a regression
+MAX_NOISE = 0.25
+
+
+def per_call(f, number, repeat=5):
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number * 1e6
+
+
+def exec_success(clock, number):
+    """
+    ``exec_`` for a call which succeeds first time.
+    """
+    def succeed():
+        return 1
+    return per_call(lambda: exec_(succeed, ValueError, lambda x: True, 3, 15, 1, clock=clock), number)
+
+
+def retry_success(clock, number):
+    """
+    A function decorated with ``@retry`` which succeeds first time.
+    """
+    @retry(ValueError, times=3, interval=1, clock=clock)
+    def succeed():
+        return 1
+    return per_call(succeed, number)
+
+
+def poll_success(clock, number):
+    """
+    A function decorated with ``@poll`` whose condition is true first time.
+    """
+    @poll(lambda x: x == 1, timeout=15, interval=1, clock=clock)
+    def succeed():
+        return 1
+    return per_call(succeed, number)
+
+
+def exec_failure(clock, number):
+    """
+    ``exec_`` for a call which fails twice and then succeeds,
+    sleeping for a second after each failure.
+    """
+    calls = [0]
+
+    def fail_twice():
+        calls[0] += 1
+        if calls[0] % 3:
+            raise ValueError
+        return calls[0]
+    return per_call(lambda: exec_(fail_twice, ValueError, lambda x: True, 3, 15, 1, clock=clock), number)
+
+
+def failure_storm(clock, number):
+    """
+    A circuit's failure counter during a failure storm: every call fails,
+    old failures are constantly expiring, and the circuit keeps
+    breaking and resetting.
+    """
+    counter = _FailureCounter(threshold=50, timeout=1, half_open_calls=1, clock=clock)
+
+    def fail():
+        clock.advance(0.01)
+        state = counter.acquire()
+        if state != "broken":
+            counter.add_failure(state == "halfbroken")
+    return per_call(fail, number)
+
+
+def breaker_contention(clock, number, threads=8):
+    """
+    Calls through one circuit breaker from several threads at once,
+    where one call in ten fails. The time is per call, across all threads.
+    """
+    calls = [0]
+
+    # a millisecond passes with each call, so the circuit never sees enough failures to break
+    @circuitbreaker(ValueError, threshold=1000, reset_timeout=1, clock=clock)
+    def sometimes_fail():
+        clock.advance(0.001)
+        calls[0] += 1
+        if calls[0] % 10 == 0:
+            raise ValueError
+
+    def call_many():
+        for _ in range(number):
+            try:
+                sometimes_fail()
+            except ValueError:
+                pass
+
+    def run_threads():
+        workers = [threading.Thread(target=call_many) for _ in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+    return per_call(run_threads, 1, repeat=3) / (number * threads)
+
+
+def poller_throughput(clock, number, polls=1000):
+    """
+    A :class:`poll.poller.Poller` with many polls in progress at once,
+    each of which is checked three times. The time is per check.
+    """
+    def run_polls():
+        with Poller(workers=4) as poller:
+            counts = [0] * polls
+
+            def check(i):
+                counts[i] += 1
+                return counts[i]
+            futures = [poller.submit(check, lambda x: x >= 3, 15, 0, i) for i in range(polls)]
+            for future in futures:
+                future.result()
+    return per_call(run_polls, 1, repeat=3) / (polls * 3)
+
+
+BENCHMARKS = [
+    ("exec_success", exec_success, 20000),
+    ("retry_success", retry_success, 50000),
+    ("poll_success", poll_success, 50000),
+    ("exec_failure", exec_failure, 5000),
+    ("failure_storm", failure_storm, 20000),
+    ("breaker_contention", breaker_contention, 5000),
+    ("poller_throughput", poller_throughput, 1),
+]
+
+
+def run(names=None, rounds=9):
+    """
+    :return: A dictionary mapping the name of each benchmark to the
+        ``median``, lower and upper quartiles (``q1`` and ``q3``),
+        ``min`` and ``max`` of its time per operation
+        in microseconds, over ``rounds`` runs.
+    """
+    results = {}
+    for name, bench, number in BENCHMARKS:
+        if names is None or name in names:
+            times = sorted(bench(VirtualClock(), number) for _ in range(rounds))
+            results[name] = {
+                "median": statistics.median(times),
+                "q1": quantile(times, 0.25),
+                "q3": quantile(times, 0.75),
+                "min": times[0],
+                "max": times[-1],
+            }
+    return results
+
+
+def quantile(ordered, q):
+    """
+    :return: The ``q``-quantile of a sorted list, interpolating between its items.
+    """
+    position = q * (len(ordered) - 1)
+    below = int(position)
+    above = min(below + 1, len(ordered) - 1)
+    return ordered[below] + (ordered[above] - ordered[below]) * (position - below)
+
+
+def noise(result):
+    """
+    :return: The interquartile range of the rounds of a result,
+        as a fraction of its median.
+    """
+    return (result["q3"] - result["q1"]) / result["median"]
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: The names of the benchmarks whose median is slower than
+        the baseline's by more than ``tolerance`` (a fraction)
+        plus the noise in either set of results, up to ``MAX_NOISE``.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            allowance = tolerance + min(max(noise(result), noise(baseline[name])), MAX_NOISE)
+            if result["median"] > baseline[name]["median"] * (1 + allowance):
+                regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help="the benchmarks to run (default: all)")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    parser.add_argument("--baseline", metavar="PATH", default=BASELINE, help="the baseline to compare against")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--rounds", type=int, default=9, help="how many times to run each benchmark (default: 9)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="how much slower than the baseline, beyond the noise, counts as a regression (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run(args.names or None, args.rounds)
+    document = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+
+    print("{:<20} {:>12} {:>8} {:>14} {:>8}".format("benchmark", "median (us)", "noise", "baseline (us)", "change"))
+    for name, result in results.items():
+        if name in baseline:
+            change = "{:+.0%}".format(result["median"] / baseline[name]["median"] - 1)
+            print("{:<20} {:>12.3f} {:>8.0%} {:>14.3f} {:>8}{}".format(name, result["median"], noise(result), baseline[name]["median"], change, "  REGRESSION" if name in regressions else ""))
+        else:
+            print("{:<20} {:>12.3f} {:>8.0%} {:>14} {:>8}".format(name, result["median"], noise(result), "-", "-"))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
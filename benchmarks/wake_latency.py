@@ -0,0 +1,44 @@
+"""
+Measures how long ``poll_`` takes to notice that a job has finished,
+when it sleeps for the whole interval and when it is woken
+by a :class:`threading.Event`.
+
+The job finishes at a random moment. Sleeping for the whole interval
+notices it half an interval later on average; waking for the event
+notices it straight away.
+
+    $ python benchmarks/wake_latency.py
+"""
+import random
+import statistics
+import threading
+import time
+
+from poll import poll_
+
+
+def latency(interval, wake, seed):
+    finished_at = []
+    event = threading.Event() if wake else None
+
+    def finish():
+        finished_at.append(time.perf_counter())
+        if event is not None:
+            event.set()
+    timer = threading.Timer(random.Random(seed).uniform(0, interval * 2), finish)
+    timer.start()
+    poll_(lambda: bool(finished_at), lambda x: x, 60, interval, wake=event)
+    noticed_at = time.perf_counter()
+    timer.join()
+    return noticed_at - finished_at[0]
+
+
+def main(interval=0.1, trials=30):
+    print("{:<20} {:>14} {:>14}".format("", "mean (ms)", "max (ms)"))
+    for name, wake in [("sleep", False), ("wake on event", True)]:
+        latencies = [latency(interval, wake, seed) for seed in range(trials)]
+        print("{:<20} {:>14.2f} {:>14.2f}".format(name, statistics.mean(latencies) * 1000, max(latencies) * 1000))
+
+
+if __name__ == "__main__":
+    main()
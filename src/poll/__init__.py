@@ -2,12 +2,26 @@
 Utilities for polling, retrying, and exception handling.
 """
 import collections
+import concurrent.futures
+import collections.abc
 import inspect
+import itertools
+import numbers
+import queue
+import threading
 import time
+import weakref
 from functools import wraps
 
+from .clock import _default_clock
+from .events import ATTEMPT_FINISHED, ATTEMPT_STARTED, CIRCUIT_CLOSED, CIRCUIT_HALF_OPENED, CIRCUIT_OPENED, GAVE_UP, RETRY_SCHEDULED, _emit, _listeners
 
-def poll(until, timeout=15, interval=1):
+
+def _ignore_error(e, count):
+    pass
+
+
+def poll(until, timeout=15, interval=1, *, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, wake=None):
     """
     Decorator for functions that should be repeated until a condition
     or a timeout.
@@ -17,22 +31,75 @@ def poll(until, timeout=15, interval=1):
         the return value of the function.
         ``until`` should return ``True`` if the operation was successful
         (and retrying should stop) and ``False`` if retrying should continue.
-    :param float timeout: How long to keep retrying the operation in seconds
-    :param float interval: How long to sleep between attempts in seconds
+    :param timeout: How long to keep retrying the operation in seconds,
+        or a :class:`Deadline` by which it must have finished.
+        No attempt is started unless it can begin before the deadline.
+    :type timeout: float or Deadline
+    :param interval: How long to sleep between attempts in seconds,
+        or a backoff strategy from :mod:`poll.backoff`
+    :type interval: float or iterable
+    :param float attempt_timeout: If given, abandon any single attempt
+        which takes longer than this many seconds and try again
+        (the abandoned attempt counts as a failed one).
+        Each attempt runs on a daemon worker thread; an abandoned attempt
+        is left to finish in the background, without holding up other
+        attempts or the program's exit, and its result is discarded.
+        See :func:`set_max_attempt_workers`.
+    :param Hedge hedge: If given, each attempt is a *hedged* call:
+        if it is slow to finish, a second attempt is started concurrently
+        and the first to succeed wins. See :class:`Hedge`.
+    :param RetryBudget budget: If given, each retry after an exception
+        must be paid for from this budget, which may be shared with
+        other functions. If the budget is exhausted, the exception
+        is raised straight away. See :class:`RetryBudget`.
+    :param RateLimit rate_limit: If given, each attempt (including retries)
+        waits for its turn under this limit, which may be shared with
+        other functions. An attempt which couldn't begin before
+        the deadline isn't made. See :class:`RateLimit`.
+    :param clock: The clock to tell the time and sleep by.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    :param wake: If given, something which signals that the condition
+        may have changed: a :class:`threading.Event`,
+        a :class:`threading.Condition` or a file descriptor which is written to
+        (and is drained by the poll).
+        In between attempts, instead of sleeping for the whole ``interval``,
+        wait for ``wake`` to be signalled and check again as soon as it is.
+        See :meth:`poll.clock.Clock.wait`.
 
     :return: The final return value of the decorated function
     :raises TimeoutError: The condition did not become true
         within the specified timeout.
     """
+    _check_interval(interval)
+    clock = _default_clock if clock is None else clock
+    # unless an option needs _exec, the first attempt is made in the wrapper itself
+    fast = attempt_timeout is None and hedge is None and rate_limit is None
+    # a Deadline, or no timeout at all, can be used as it is by every call
+    timed = not isinstance(timeout, Deadline) and timeout != float("inf")
+
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            return poll_(f, until, timeout, interval, *args, **kwargs)
+            if not fast or _listeners:
+                return _exec(f, (), until, float("inf"), timeout, interval, _ignore_error, args, kwargs, attempt_timeout, hedge, budget, rate_limit, clock, wake)
+            deadline = Deadline(timeout, clock) if timed else timeout
+            try:
+                result = f(*args, **kwargs)
+            except BaseException as e:
+                resume = e
+            else:
+                if until(result):
+                    if budget is not None:
+                        budget.deposit()
+                    return result
+                resume = _NOT_DONE
+            return _exec(f, (), until, float("inf"), deadline, interval, _ignore_error, args, kwargs, budget=budget, clock=clock, wake=wake, resume=resume)
         return wrapper
     return decorator
 
 
-def poll_(f, until, timeout=15, interval=1, *args, **kwargs):
+def poll_(f, until, timeout=15, interval=1, *args, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, wake=None, **kwargs):
     """
     Repeatedly call a function until a condition becomes
     true or a timeout expires.
@@ -43,8 +110,41 @@ def poll_(f, until, timeout=15, interval=1, *args, **kwargs):
         the return value of the function.
         ``until`` should return ``True`` if the operation was successful
         (and retrying should stop) and ``False`` if retrying should continue.
-    :param float timeout: How long to keep retrying the operation in seconds
-    :param float interval: How long to sleep in between attempts in seconds
+    :param timeout: How long to keep retrying the operation in seconds,
+        or a :class:`Deadline` by which it must have finished.
+        No attempt is started unless it can begin before the deadline.
+    :type timeout: float or Deadline
+    :param interval: How long to sleep in between attempts in seconds,
+        or a backoff strategy from :mod:`poll.backoff`
+    :type interval: float or iterable
+    :param float attempt_timeout: If given, abandon any single attempt
+        which takes longer than this many seconds and try again
+        (the abandoned attempt counts as a failed one).
+        Each attempt runs on a daemon worker thread; an abandoned attempt
+        is left to finish in the background, without holding up other
+        attempts or the program's exit, and its result is discarded.
+        See :func:`set_max_attempt_workers`.
+    :param Hedge hedge: If given, each attempt is a *hedged* call:
+        if it is slow to finish, a second attempt is started concurrently
+        and the first to succeed wins. See :class:`Hedge`.
+    :param RetryBudget budget: If given, each retry after an exception
+        must be paid for from this budget, which may be shared with
+        other functions. If the budget is exhausted, the exception
+        is raised straight away. See :class:`RetryBudget`.
+    :param RateLimit rate_limit: If given, each attempt (including retries)
+        waits for its turn under this limit, which may be shared with
+        other functions. An attempt which couldn't begin before
+        the deadline isn't made. See :class:`RateLimit`.
+    :param clock: The clock to tell the time and sleep by.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    :param wake: If given, something which signals that the condition
+        may have changed: a :class:`threading.Event`,
+        a :class:`threading.Condition` or a file descriptor which is written to
+        (and is drained by the poll).
+        In between attempts, instead of sleeping for the whole ``interval``,
+        wait for ``wake`` to be signalled and check again as soon as it is.
+        See :meth:`poll.clock.Clock.wait`.
 
     Any other arguments are forwarded to ``f``.
 
@@ -52,17 +152,19 @@ def poll_(f, until, timeout=15, interval=1, *args, **kwargs):
     :raises TimeoutError: The condition did not become true
         within the specified timeout.
     """
-    return exec_(f, (), until, float("inf"), timeout, interval, lambda e, x: None, *args, **kwargs)
+    return _exec(f, (), until, float("inf"), timeout, interval, _ignore_error, args, kwargs, attempt_timeout, hedge, budget, rate_limit, _default_clock if clock is None else clock, wake)
 
 
-def retry(ex, times=3, interval=1, on_error=lambda e, x: None):
+def retry(ex, times=3, interval=1, on_error=_ignore_error, *, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None):
     """
     Decorator for functions that should be retried upon error.
 
     :param ex: The class of the exception to catch, or an iterable of classes
     :type ex: class or iterable
     :param int times: The maximum number of times to retry
-    :param float interval: How long to sleep in between attempts in seconds
+    :param interval: How long to sleep in between attempts in seconds,
+        or a backoff strategy from :mod:`poll.backoff`
+    :type interval: float or iterable
     :param function on_error: A function to be called when the decorated
         function throws an exception.
 
@@ -77,20 +179,58 @@ def retry(ex, times=3, interval=1, on_error=lambda e, x: None):
         the number of previous attempts (starting at 0).
 
         A typical use of ``on_error`` would be to log the exception.
+    :param float attempt_timeout: If given, abandon any single attempt
+        which takes longer than this many seconds and try again
+        (the abandoned attempt counts as a failed one).
+        Each attempt runs on a daemon worker thread; an abandoned attempt
+        is left to finish in the background, without holding up other
+        attempts or the program's exit, and its result is discarded.
+        See :func:`set_max_attempt_workers`.
+    :param Hedge hedge: If given, each attempt is a *hedged* call:
+        if it is slow to finish, a second attempt is started concurrently
+        and the first to succeed wins. See :class:`Hedge`.
+    :param RetryBudget budget: If given, each retry after an exception
+        must be paid for from this budget, which may be shared with
+        other functions. If the budget is exhausted, the exception
+        is raised straight away. See :class:`RetryBudget`.
+    :param RateLimit rate_limit: If given, each attempt (including retries)
+        waits for its turn under this limit, which may be shared with
+        other functions. An attempt which couldn't begin before
+        the deadline isn't made. See :class:`RateLimit`.
+    :param clock: The clock to tell the time and sleep by.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
 
     :return: The return value of the decorated function
     :raises TimeoutError: The function did not succeed
         within the specified timeout.
     """
+    exs = _exception_tuple(ex)
+    _check_interval(interval)
+    on_error = _adapt_callback(on_error, 2)
+    clock = _default_clock if clock is None else clock
+    # unless an option needs _exec, the first attempt is made in the wrapper itself
+    fast = attempt_timeout is None and hedge is None and rate_limit is None
+
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            return retry_(f, ex, times, interval, on_error, *args, **kwargs)
+            if not fast or _listeners:
+                return _exec(f, exs, _always, times, float("inf"), interval, on_error, args, kwargs, attempt_timeout, hedge, budget, rate_limit, clock)
+            try:
+                result = f(*args, **kwargs)
+            except BaseException as e:
+                resume = e
+            else:
+                if budget is not None:
+                    budget.deposit()
+                return result
+            return _exec(f, exs, _always, times, float("inf"), interval, on_error, args, kwargs, budget=budget, clock=clock, resume=resume)
         return wrapper
     return decorator
 
 
-def retry_(f, ex, times=3, interval=1, on_error=lambda e, x: None, *args, **kwargs):
+def retry_(f, ex, times=3, interval=1, on_error=_ignore_error, *args, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, **kwargs):
     """
     Call a function and try again if it throws a specified exception.
 
@@ -98,7 +238,9 @@ def retry_(f, ex, times=3, interval=1, on_error=lambda e, x: None, *args, **kwar
     :param ex: The class of the exception to catch, or an iterable of classes
     :type ex: class or iterable
     :param int times: The maximum number of times to retry
-    :param float interval: How long to sleep in between attempts in seconds
+    :param interval: How long to sleep in between attempts in seconds,
+        or a backoff strategy from :mod:`poll.backoff`
+    :type interval: float or iterable
     :param function on_error: A function to be called when
         ``f`` throws an exception.
 
@@ -113,6 +255,27 @@ def retry_(f, ex, times=3, interval=1, on_error=lambda e, x: None, *args, **kwar
         number of previous attempts (starting at 0).
 
         A typical use of ``on_error`` would be to log the exception.
+    :param float attempt_timeout: If given, abandon any single attempt
+        which takes longer than this many seconds and try again
+        (the abandoned attempt counts as a failed one).
+        Each attempt runs on a daemon worker thread; an abandoned attempt
+        is left to finish in the background, without holding up other
+        attempts or the program's exit, and its result is discarded.
+        See :func:`set_max_attempt_workers`.
+    :param Hedge hedge: If given, each attempt is a *hedged* call:
+        if it is slow to finish, a second attempt is started concurrently
+        and the first to succeed wins. See :class:`Hedge`.
+    :param RetryBudget budget: If given, each retry after an exception
+        must be paid for from this budget, which may be shared with
+        other functions. If the budget is exhausted, the exception
+        is raised straight away. See :class:`RetryBudget`.
+    :param RateLimit rate_limit: If given, each attempt (including retries)
+        waits for its turn under this limit, which may be shared with
+        other functions. An attempt which couldn't begin before
+        the deadline isn't made. See :class:`RateLimit`.
+    :param clock: The clock to tell the time and sleep by.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
 
     Any other arguments are forwarded to ``f``.
 
@@ -120,10 +283,10 @@ def retry_(f, ex, times=3, interval=1, on_error=lambda e, x: None, *args, **kwar
     :raises TimeoutError: The function did not succeed
         within the specified timeout.
     """
-    return exec_(f, ex, lambda _: True, times, float("inf"), interval, on_error, *args, **kwargs)
+    return _exec(f, _exception_tuple(ex), _always, times, float("inf"), interval, _lazy_callback(on_error, 2), args, kwargs, attempt_timeout, hedge, budget, rate_limit, _default_clock if clock is None else clock)
 
 
-def circuitbreaker(ex, threshold, reset_timeout, on_error=lambda e: None):
+def circuitbreaker(ex, threshold, reset_timeout, on_error=lambda e: None, half_open_calls=1, name=None, registry=None, slow_call_duration=None, clock=None):
     """
     Decorator for functions which should 'back off' using the
     Circuit Breaker pattern: http://martinfowler.com/bliki/CircuitBreaker.html
@@ -134,10 +297,15 @@ def circuitbreaker(ex, threshold, reset_timeout, on_error=lambda e: None):
     fails three times *within a sixty-second period*. The circuit breaker
     is lenient towards intermittent failures.
 
+    The decorated function may safely be called from many threads at once.
+    While the circuit is closed, checking it does not take a lock.
+
     :param ex: The class of the exception to catch, or an iterable of classes.
     :type ex: class or iterable
-    :param int threshold: The number of times a failure can occur before
-        the circuit is broken.
+    :param threshold: The number of times a failure can occur before
+        the circuit is broken, or a :class:`FailureRate` to break the circuit
+        when too large a proportion of calls fail.
+    :type threshold: int or :class:`FailureRate`
     :param float reset_timeout: The length of time, in seconds,
         that a broken circuit should remain broken.
     :param function on_error: A function to be called when the
@@ -150,88 +318,510 @@ def circuitbreaker(ex, threshold, reset_timeout, on_error=lambda e: None):
         it will be called with the exception that was raised.
 
         A typical use of ``on_error`` would be to log the exception.
+    :param int half_open_calls: The number of trial calls to let through
+        once ``reset_timeout`` has elapsed. If any of them fails the circuit
+        is broken again; once all of them have succeeded the circuit is closed.
+        Other calls made in the meantime raise :class:`CircuitBrokenError`.
+    :param str name: The name of the circuit. Defaults to the name of the
+        decorated function (qualified with its module if ``registry`` is given).
+    :param registry: Where to keep the state of the circuit, so that it can
+        be shared with other circuit breakers of the same ``name``.
+        By default each decorated function has its own private circuit.
+    :type registry: :class:`poll.shared.SharedCircuitRegistry`
+        or :class:`poll.store.StoredCircuitRegistry`
+    :param float slow_call_duration: If given, calls which take at least
+        this many seconds are counted as failures even if they succeed
+        (or, if ``threshold`` is a :class:`FailureRate` with a ``slow_rate``,
+        as slow calls). A slow call's result is still returned.
+    :param clock: The clock to tell the time by, unless the circuit
+        is kept in a ``registry``. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
 
     :return: The final return value of the function ``f``.
     :raises CircuitBrokenError: The operation was
         not carried out because the circuit is broken.
     """
 
-    if isinstance(ex, collections.Iterable):
-        exs = tuple(ex)
-    else:
-        exs = (ex,)
+    exs = _exception_tuple(ex)
+    on_error = _adapt_callback(on_error, 1)
+    timer = _default_clock if clock is None else clock
 
     def decorator(f):
-        failure_counter = _FailureCounter(threshold, reset_timeout)
+        failure_counter = _failure_counter(f, threshold, reset_timeout, half_open_calls, name, registry, clock)
 
         @wraps(f)
         def wrapper(*args, **kwargs):
-            state = failure_counter.state()
+            state = failure_counter.acquire()
             if state == "broken":
-                time_remaining = failure_counter.time_remaining()
-                message = "The circuit for {} was broken. Try again in {}".format(f.__name__, time_remaining)
-                raise CircuitBrokenError(message, time_remaining)
+                raise _circuit_broken_error(f, failure_counter)
+            probe = state == "halfbroken"
 
+            started = timer.now() if slow_call_duration is not None else None
             try:
                 result = f(*args, **kwargs)
             except BaseException as e:
-                _call_with_correct_number_of_args(on_error, (e,))
                 if isinstance(e, exs):
-                    failure_counter.add_failure()
+                    failure_counter.add_failure(probe)
+                elif probe:
+                    failure_counter.release_probe()
+                on_error(e)
+                raise
+            if started is not None and timer.now() - started >= slow_call_duration:
+                failure_counter.add_slow_call(probe)
+            else:
+                failure_counter.add_success(probe)
+            return result
+
+        return wrapper
+    return decorator
+
+
+def bulkhead(max_calls, max_queue=0, queue_timeout=None):
+    """
+    Decorator for functions which should have a limited
+    number of calls in progress at once, using the Bulkhead pattern.
+
+    When one slow dependency holds up every call made to it,
+    a bulkhead stops those calls from tying up every thread.
+    Calls beyond ``max_calls`` wait in a queue for a call to finish,
+    in the order in which they arrived; calls beyond the queue's capacity,
+    and calls which wait for longer than ``queue_timeout``,
+    raise :class:`BulkheadFullError`.
+
+    The :class:`Bulkhead` is available as the decorated
+    function's ``bulkhead`` attribute, so you can monitor
+    how many calls are in flight and queued.
+
+    :param max_calls: The number of calls which may be in progress at once,
+        or a :class:`Bulkhead` to share its limit with other functions,
+        or an :class:`AdaptiveLimit` to adjust the limit according to
+        the latency and errors of the calls.
+    :type max_calls: int or :class:`Bulkhead`
+    :param int max_queue: The number of calls which may wait for their turn.
+    :param float queue_timeout: The length of time, in seconds,
+        that a call may wait for its turn. ``None`` means wait forever.
+
+    :return: The return value of the function ``f``.
+    :raises BulkheadFullError: The operation was not carried out
+        because there were too many calls in progress.
+    """
+    bh = max_calls if isinstance(max_calls, Bulkhead) else Bulkhead(max_calls, max_queue, queue_timeout)
+    observe = isinstance(bh, AdaptiveLimit)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not bh._acquire():
+                raise _bulkhead_full_error(f, bh)
+            if not observe:
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    bh._release()
+
+            started = bh._clock.now()
+            try:
+                result = f(*args, **kwargs)
+            except BaseException as e:
+                bh._release(bh._clock.now() - started, isinstance(e, bh._exs))
+                raise
+            bh._release(bh._clock.now() - started)
+            return result
+
+        wrapper.bulkhead = bh
+        return wrapper
+    return decorator
+
+
+def ratelimit(rate, per=1, burst=1, max_wait=None, clock=None):
+    """
+    Decorator for functions which should be called
+    no more than a certain number of times per second,
+    for example to stay within an API's rate limit.
+
+    Calls are spaced out evenly, ``per / rate`` seconds apart,
+    but up to ``burst`` calls may be made at once after a quiet spell.
+    A call which arrives too soon waits for its turn;
+    if it would have to wait for longer than ``max_wait`` it
+    raises :class:`RateLimitExceededError` straight away instead.
+    Calls take their turns in the order in which they arrived.
+
+    The :class:`RateLimit` is available as the decorated
+    function's ``ratelimit`` attribute.
+
+    :param rate: The number of calls allowed every ``per`` seconds,
+        or a :class:`RateLimit` to share its limit with other functions
+        (in which case the other parameters are ignored).
+    :type rate: float or :class:`RateLimit`
+    :param float per: The length of the period, in seconds.
+    :param int burst: The number of calls which may be made at once.
+    :param float max_wait: The length of time, in seconds, that a call may
+        wait for its turn. ``None`` means wait as long as necessary;
+        ``0`` means never wait.
+    :param clock: The clock to tell the time and sleep by.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+
+    :return: The return value of the function ``f``.
+    :raises RateLimitExceededError: The operation was not carried out
+        because it would have had to wait for too long.
+    """
+    rl = rate if isinstance(rate, RateLimit) else RateLimit(rate, per, burst, clock)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            wait = rl._reserve(max_wait)
+            if wait is None:
+                raise _rate_limit_exceeded_error(f, rl)
+            if wait > 0:
+                rl._clock.sleep(wait)
+            return f(*args, **kwargs)
+
+        wrapper.ratelimit = rl
+        return wrapper
+    return decorator
+
+
+def singleflight(key=None):
+    """
+    Decorator for functions whose concurrent calls with the same
+    arguments should be *coalesced* into one call.
+
+    While a call is in progress, other calls with the same key
+    don't call the function again; they wait for the call in progress
+    and return its result, or raise the exception which it raised.
+    Once it has finished, the next call with that key calls the function afresh.
+    For example, when many threads miss a cache for the same key at once,
+    only one of them fetches the value.
+
+    Put ``singleflight`` above :func:`retry` to share the whole retry loop
+    between the callers, rather than each caller retrying separately::
+
+        @singleflight()
+        @retry(requests.HTTPError, times=3)
+        def fetch(uri):
+            ...
+
+    :param function key: A function which takes the same arguments as
+        the decorated function and returns a hashable key. Calls with
+        equal keys are coalesced. By default, calls are coalesced
+        if their arguments are equal; the arguments must then be hashable.
+
+    :return: The return value of the function ``f``.
+    """
+    make_key = key if key is not None else _call_key
+
+    def decorator(f):
+        flights = {}
+        lock = threading.Lock()
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            k = make_key(*args, **kwargs)
+            with lock:
+                flight = flights.get(k)
+                if flight is None:
+                    flight = flights[k] = concurrent.futures.Future()
+                    leader = True
+                else:
+                    leader = False
+            if not leader:
+                return flight.result()
+
+            try:
+                result = f(*args, **kwargs)
+            except BaseException as e:
+                with lock:
+                    del flights[k]
+                flight.set_exception(e)
                 raise
-            failure_counter.add_success()
+            with lock:
+                del flights[k]
+            flight.set_result(result)
             return result
 
         return wrapper
     return decorator
 
 
+def _failure_counter(f, threshold, reset_timeout, half_open_calls, name, registry, clock=None):
+    if isinstance(threshold, FailureRate):
+        if registry is not None:
+            raise ValueError("A circuit with a FailureRate threshold can't be kept in a registry")
+        return _RateFailureCounter(threshold, reset_timeout, half_open_calls, name or f.__name__, clock)
+    if registry is None:
+        return _FailureCounter(threshold, reset_timeout, half_open_calls, name or f.__name__, clock)
+    return registry._failure_counter(name or "{}.{}".format(f.__module__, f.__qualname__), threshold, reset_timeout, half_open_calls)
+
+
 class _FailureCounter(object):
-    def __init__(self, threshold, timeout):
-        self._failure_times = collections.deque()
-        self._threshold = threshold
+    """
+    Failure counting for :func:`circuitbreaker`.
+
+    Callers ask for permission with :meth:`acquire` and report the
+    outcome of the call with :meth:`add_success` or :meth:`add_failure`.
+    Every state transition happens under a lock, except that
+    while the circuit is closed neither :meth:`acquire` nor
+    :meth:`add_success` take the lock: reading ``_broken_time``
+    is atomic, and a success in the closed state changes nothing.
+    """
+    def __init__(self, threshold, timeout, half_open_calls=1, name=None, clock=None):
+        # Only the newest `threshold` failures can ever break the circuit,
+        # so they are kept in a fixed-size ring buffer. `_next` points at
+        # the slot which will be overwritten next, i.e. the oldest failure.
+        self._threshold = max(threshold, 1)
+        self._failure_times = [float("-inf")] * self._threshold
+        self._next = 0
         self._timeout = timeout
+        self._half_open_calls = max(half_open_calls, 1)
+        self._probes_started = 0
+        self._probes_succeeded = 0
         self._broken_time = None
+        self._lock = threading.Lock()
+        self._name = name
+        # without a clock, _now reads time.perf_counter directly, which is cheaper
+        if clock is not None:
+            self._now = clock.now
 
     def state(self):
-        if self._broken_time is not None:
-            if self._is_halfbroken():
+        broken_time = self._broken_time
+        if broken_time is not None:
+            if self._now() - broken_time >= self._timeout:
                 return "halfbroken"
             return "broken"
         return "ok"
 
-    def add_failure(self):
-        self._update_failures()
-        self._failure_times.append(time.perf_counter())
-        if len(self._failure_times) >= self._threshold or self._is_halfbroken():
-            self._broken_time = time.perf_counter()
+    def acquire(self):
+        """
+        Ask whether a call may go ahead.
 
-    def add_success(self):
-        if self._is_halfbroken():
-            self._failure_times = collections.deque()
-        self._update_failures()
-        self._broken_time = None
+        Returns ``"ok"`` if the circuit is closed, ``"halfbroken"`` if
+        the call has been admitted as one of the trial calls, or ``"broken"``
+        if the call should not be made.
+        """
+        if self._broken_time is None:
+            return "ok"
+        with self._lock:
+            if self._broken_time is None:
+                return "ok"
+            if not self._is_halfbroken() or self._probes_started >= self._half_open_calls:
+                return "broken"
+            self._probes_started += 1
+            first_probe = self._probes_started == 1
+        if first_probe and _listeners:
+            _emit(CIRCUIT_HALF_OPENED, self._name)
+        return "halfbroken"
+
+    def add_failure(self, probe=False):
+        with self._lock:
+            current_time = self._now()
+            self._record_failure(current_time)
+            opened = False
+            if probe or self._should_break(current_time):
+                # a late failure from a call made before the circuit broke
+                # extends the break but isn't a transition
+                opened = probe or self._broken_time is None
+                self._break(current_time)
+        if opened and _listeners:
+            _emit(CIRCUIT_OPENED, self._name)
+
+    def add_slow_call(self, probe=False):
+        self.add_failure(probe)
+
+    def add_success(self, probe=False):
+        if not probe:
+            return
+        with self._lock:
+            # a trial call which started before the circuit was broken again
+            # doesn't count towards closing it
+            if not self._is_halfbroken():
+                return
+            self._probes_succeeded += 1
+            closed = self._probes_succeeded >= self._half_open_calls
+            if closed:
+                self._close()
+        if closed and _listeners:
+            _emit(CIRCUIT_CLOSED, self._name)
+
+    def release_probe(self):
+        """
+        Give back a trial call's slot without recording an outcome.
+        """
+        with self._lock:
+            if self._probes_started > 0:
+                self._probes_started -= 1
 
     def time_remaining(self):
-        if self._broken_time is None:
+        broken_time = self._broken_time
+        if broken_time is None:
             return 0
-        result = self._timeout - self._time_since_broken()
+        result = self._timeout - (self._now() - broken_time)
         return result if result > 0 else 0
 
+    def _now(self):
+        return time.perf_counter()
+
     def _is_halfbroken(self):
-        return self._broken_time is not None and self._time_since_broken() >= self._timeout
+        return self._broken_time is not None and self._now() - self._broken_time >= self._timeout
+
+    def _record_failure(self, current_time):
+        self._failure_times[self._next] = current_time
+        self._next += 1
+        if self._next == self._threshold:
+            self._next = 0
+
+    def _should_break(self, current_time):
+        oldest = self._failure_times[self._next]
+        return oldest >= current_time - self._timeout
+
+    def _break(self, current_time):
+        self._broken_time = current_time
+        self._probes_started = 0
+        self._probes_succeeded = 0
+
+    def _close(self):
+        self._reset_failures()
+        self._broken_time = None
+
+    def _reset_failures(self):
+        failure_times = self._failure_times
+        for i in range(self._threshold):
+            failure_times[i] = float("-inf")
+        self._next = 0
+
+
+class FailureRate(object):
+    """
+    A ``threshold`` for :func:`circuitbreaker` which breaks the circuit
+    when too large a proportion of recent calls fail, rather than
+    when a fixed number of calls fail.
+
+    Calls are counted in a fixed-size ring of buckets, so recording
+    a call takes constant time, and memory use doesn't depend on the call rate.
+    Unlike a circuit with a numeric ``threshold``, every call takes a lock.
+
+    :param float rate: The proportion of calls, between 0 and 1,
+        which must fail for the circuit to be broken.
+    :param int minimum_calls: The circuit is never broken while
+        fewer than this many calls are in the window.
+    :param float seconds: Count the calls made in the last ``seconds`` seconds.
+    :param int calls: Count the last ``calls`` calls, however long ago
+        they were made, instead of the calls in a period of time.
+    :param int buckets: The number of buckets to divide a ``seconds``
+        window into. Calls leave the window one bucket at a time.
+    :param float slow_rate: The proportion of calls, between 0 and 1, which
+        must be slow (see ``slow_call_duration``) for the circuit to be broken.
+        If ``None``, slow calls count as failures.
+    """
+    def __init__(self, rate, minimum_calls=10, seconds=60, calls=None, buckets=10, slow_rate=None):
+        self.rate = rate
+        self.slow_rate = slow_rate
+        self.minimum_calls = minimum_calls
+        self.seconds = seconds
+        self.calls = calls
+        self.buckets = buckets
+
+    def _window(self):
+        if self.calls is not None:
+            return _Window(self.calls)
+        return _Window(self.buckets, self.seconds / self.buckets)
+
+    def _exceeded(self, window):
+        if window.calls < self.minimum_calls:
+            return False
+        if window.failures >= self.rate * window.calls:
+            return True
+        return self.slow_rate is not None and window.slow_calls >= self.slow_rate * window.calls
+
+
+class _Window(object):
+    """
+    Counts of calls, failures and slow calls in a ring of slots. Each slot holds
+    the calls made in ``slot_width`` seconds, or, if ``slot_width``
+    is ``None``, a single call.
+    """
+    def __init__(self, slot_count, slot_width=None):
+        self._slot_count = slot_count
+        self._slot_width = slot_width
+        self._calls = [0] * slot_count
+        self._failures = [0] * slot_count
+        self._slow_calls = [0] * slot_count
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self._slot = 0
+        self._epoch = 0
+
+    def add(self, current_time, failed, slow=False):
+        if self._slot_width is None:
+            self._advance(1)
+        else:
+            epoch = int(current_time / self._slot_width)
+            self._advance(epoch - self._epoch)
+            self._epoch = max(epoch, self._epoch)
+        self._calls[self._slot] += 1
+        self.calls += 1
+        if failed:
+            self._failures[self._slot] += 1
+            self.failures += 1
+        if slow:
+            self._slow_calls[self._slot] += 1
+            self.slow_calls += 1
+
+    def clear(self):
+        self._advance(self._slot_count)
+
+    def _advance(self, elapsed):
+        for _ in range(min(elapsed, self._slot_count)):
+            self._slot = (self._slot + 1) % self._slot_count
+            self.calls -= self._calls[self._slot]
+            self.failures -= self._failures[self._slot]
+            self.slow_calls -= self._slow_calls[self._slot]
+            self._calls[self._slot] = 0
+            self._failures[self._slot] = 0
+            self._slow_calls[self._slot] = 0
+
 
-    def _time_since_broken(self):
-        return time.perf_counter() - self._broken_time
+class _RateFailureCounter(_FailureCounter):
+    """
+    A :class:`_FailureCounter` which breaks the circuit according
+    to a :class:`FailureRate` rather than a number of failures.
+    """
+    def __init__(self, failure_rate, timeout, half_open_calls=1, name=None, clock=None):
+        self._failure_rate = failure_rate
+        self._window = failure_rate._window()
+        super().__init__(1, timeout, half_open_calls, name, clock)
+
+    def add_success(self, probe=False):
+        if probe:
+            return super().add_success(probe)
+        with self._lock:
+            self._window.add(self._now(), False)
+
+    def add_slow_call(self, probe=False):
+        if probe or self._failure_rate.slow_rate is None:
+            return self.add_failure(probe)
+        with self._lock:
+            current_time = self._now()
+            self._window.add(current_time, False, slow=True)
+            opened = self._broken_time is None and self._should_break(current_time)
+            if opened:
+                self._break(current_time)
+        if opened and _listeners:
+            _emit(CIRCUIT_OPENED, self._name)
+
+    def _record_failure(self, current_time):
+        self._window.add(current_time, True)
 
-    def _update_failures(self):
-        current_time = time.perf_counter()
-        while self._failure_times and self._failure_times[0] < (current_time - self._timeout):
-            result = self._failure_times.popleft()
-            print(result, self._failure_times[0] if self._failure_times else None)
+    def _should_break(self, current_time):
+        return self._failure_rate._exceeded(self._window)
 
+    def _reset_failures(self):
+        self._window.clear()
 
-def exec_(f, ex, until, times=3, timeout=15, interval=1, on_error=lambda e, x: None, *args, **kwargs):
+
+def exec_(f, ex, until, times=3, timeout=15, interval=1, on_error=_ignore_error, *args, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, wake=None, **kwargs):
     """
     General function for polling, retrying, and handling errors.
 
@@ -244,7 +834,13 @@ def exec_(f, ex, until, times=3, timeout=15, interval=1, on_error=lambda e, x: N
         ``until(x)`` should return ``True`` if the operation was successful
         (and retrying should stop) and ``False`` if retrying should continue.
     :param int times: The maximum number of times to retry
-    :param float interval: How long to sleep in between attempts in seconds
+    :param timeout: How long to keep retrying the operation in seconds,
+        or a :class:`Deadline` by which it must have finished.
+        No attempt is started unless it can begin before the deadline.
+    :type timeout: float or Deadline
+    :param interval: How long to sleep in between attempts in seconds,
+        or a backoff strategy from :mod:`poll.backoff`
+    :type interval: float or iterable
     :param function on_error: A function to be called when ``f`` throws an exception.
 
         If ``on_error()`` takes no parameters,
@@ -258,6 +854,34 @@ def exec_(f, ex, until, times=3, timeout=15, interval=1, on_error=lambda e, x: N
         number of previous attempts (starting at 0).
 
         A typical use of ``on_error`` would be to log the exception.
+    :param float attempt_timeout: If given, abandon any single attempt
+        which takes longer than this many seconds and try again
+        (the abandoned attempt counts as a failed one).
+        Each attempt runs on a daemon worker thread; an abandoned attempt
+        is left to finish in the background, without holding up other
+        attempts or the program's exit, and its result is discarded.
+        See :func:`set_max_attempt_workers`.
+    :param Hedge hedge: If given, each attempt is a *hedged* call:
+        if it is slow to finish, a second attempt is started concurrently
+        and the first to succeed wins. See :class:`Hedge`.
+    :param RetryBudget budget: If given, each retry after an exception
+        must be paid for from this budget, which may be shared with
+        other functions. If the budget is exhausted, the exception
+        is raised straight away. See :class:`RetryBudget`.
+    :param RateLimit rate_limit: If given, each attempt (including retries)
+        waits for its turn under this limit, which may be shared with
+        other functions. An attempt which couldn't begin before
+        the deadline isn't made. See :class:`RateLimit`.
+    :param clock: The clock to tell the time and sleep by.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    :param wake: If given, something which signals that the condition
+        may have changed: a :class:`threading.Event`,
+        a :class:`threading.Condition` or a file descriptor which is written to
+        (and is drained by the poll).
+        In between attempts, instead of sleeping for the whole ``interval``,
+        wait for ``wake`` to be signalled and check again as soon as it is.
+        See :meth:`poll.clock.Clock.wait`.
 
     Any other arguments are forwarded to ``f``.
 
@@ -265,32 +889,776 @@ def exec_(f, ex, until, times=3, timeout=15, interval=1, on_error=lambda e, x: N
     :raises TimeoutError: The call did not succeed
         within the specified timeout.
     """
-    if isinstance(ex, collections.Iterable):
-        exs = tuple(ex)
-    else:
-        exs = (ex,)
+    return _exec(f, _exception_tuple(ex), until, times, timeout, interval, _lazy_callback(on_error, 2), args, kwargs, attempt_timeout, hedge, budget, rate_limit, _default_clock if clock is None else clock, wake)
+
 
+def _exec(f, exs, until, times, timeout, interval, on_error, args, kwargs, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=_default_clock, wake=None, resume=None):
+    # If the caller has already made the first attempt, ``resume`` is the
+    # exception it raised, or _NOT_DONE if its result didn't satisfy ``until``
+    deadline = timeout if isinstance(timeout, Deadline) else Deadline(timeout, clock)
+    if attempt_timeout is not None:
+        exs = exs + (AttemptTimeoutError,)
+    delays = None
     count = 0
-    start_time = time.perf_counter()
+    if resume is not None and resume is not _NOT_DONE:
+        on_error(resume, count)
+        count += 1
+        if count >= times or not isinstance(resume, exs) or (budget is not None and not budget.try_withdraw()):
+            if _listeners:
+                _emit(GAVE_UP, f.__name__, count, exception=resume)
+            raise resume
+    attempted = resume is not None
     while True:
+        if attempted:
+            if delays is None:
+                delays = _delays(interval)
+            delay = next(delays)
+            if delay >= deadline.remaining():
+                error = _timeout_error(f, deadline, count)
+                if _listeners:
+                    _emit(GAVE_UP, f.__name__, count, exception=error)
+                raise error
+            if _listeners:
+                _emit(RETRY_SCHEDULED, f.__name__, count, delay=delay)
+            if wake is None:
+                clock.sleep(delay)
+            else:
+                clock.wait(wake, delay)
+        attempted = True
+        if rate_limit is not None:
+            wait = rate_limit._reserve(deadline.remaining())
+            if wait is None:
+                error = _timeout_error(f, deadline, count)
+                if _listeners:
+                    _emit(GAVE_UP, f.__name__, count, exception=error)
+                raise error
+            if wait > 0:
+                clock.sleep(wait)
+        listening = bool(_listeners)
+        if listening:
+            _emit(ATTEMPT_STARTED, f.__name__, count)
+            started = clock.now()
         try:
-            result = f(*args, **kwargs)
+            if hedge is not None:
+                result = hedge._call(f, args, kwargs, _attempt_time_limit(attempt_timeout, deadline))
+            elif attempt_timeout is None:
+                result = f(*args, **kwargs)
+            else:
+                result = _call_with_timeout(f, args, kwargs, _attempt_time_limit(attempt_timeout, deadline))
         except BaseException as e:
-            _call_with_correct_number_of_args(on_error, (e, count))
+            if listening:
+                _emit(ATTEMPT_FINISHED, f.__name__, count, clock.now() - started, exception=e)
+            on_error(e, count)
             count += 1
-            if count >= times or not isinstance(e, exs):
+            if count >= times or not isinstance(e, exs) or (budget is not None and not budget.try_withdraw()):
+                if _listeners:
+                    _emit(GAVE_UP, f.__name__, count, exception=e)
                 raise
         else:
+            if listening:
+                _emit(ATTEMPT_FINISHED, f.__name__, count, clock.now() - started)
             if until(result):
+                if budget is not None:
+                    budget.deposit()
                 return result
-        time.sleep(interval)
-        if time.perf_counter() - start_time > timeout:
-            msg = "The operation '{}' timed out after {} seconds and {} attempts".format(
-                f.__name__,
-                timeout,
-                count
-            )
-            raise TimeoutError(msg)
+
+
+def _attempt_time_limit(attempt_timeout, deadline):
+    if attempt_timeout is None:
+        return None
+    return min(attempt_timeout, deadline.remaining())
+
+
+def _call_with_timeout(f, args, kwargs, timeout, abandoned=None):
+    # if the attempt is abandoned, it's appended to the list `abandoned`
+    attempt = _workers.submit(f, args, kwargs)
+    if attempt is None:
+        raise _workers_busy_error(f)
+    # time the attempt from when it starts, not from when it was handed over
+    attempt.started.wait()
+    try:
+        return attempt.result(timeout)
+    except concurrent.futures.TimeoutError:
+        if attempt.done():
+            # the attempt finished just in time, or f raised TimeoutError itself
+            return attempt.result()
+        if abandoned is not None:
+            abandoned.append(attempt)
+        raise _attempt_timeout_error(f, timeout)
+
+
+class _Attempt(concurrent.futures.Future):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+
+
+class _Workers(object):
+    """
+    Daemon threads to run attempts which may be abandoned.
+
+    An attempt is only ever given to an idle worker, and if there isn't one
+    a new worker is started, so an attempt never waits behind others which
+    are hung. No more than ``max_workers`` workers are started, so a backend
+    which hangs can't use up every thread. Workers are reused, and exit after
+    ``idle_timeout`` seconds with nothing to do. Being daemons,
+    they don't keep the program alive.
+    """
+    def __init__(self, idle_timeout=60, max_workers=100):
+        self.max_workers = max_workers
+        self._idle_timeout = idle_timeout
+        self._idle = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def submit(self, f, args, kwargs):
+        """
+        :return: An :class:`_Attempt`, or ``None`` if every worker is busy
+            and no more can be started.
+        """
+        attempt = _Attempt()
+        with self._lock:
+            inbox = self._idle.pop() if self._idle else None
+            if inbox is None:
+                if self._count >= self.max_workers:
+                    return None
+                self._count += 1
+        if inbox is None:
+            inbox = queue.SimpleQueue()
+            inbox.put((attempt, f, args, kwargs))
+            threading.Thread(target=self._work, args=(inbox,), name="poll-attempt", daemon=True).start()
+        else:
+            inbox.put((attempt, f, args, kwargs))
+        return attempt
+
+    def _work(self, inbox):
+        job = inbox.get()
+        while job is not None:
+            self._run(inbox, *job)
+            job = self._next_job(inbox)
+
+    def _run(self, inbox, attempt, f, args, kwargs):
+        running = attempt.set_running_or_notify_cancel()
+        attempt.started.set()
+        result, error = None, None
+        if running:
+            try:
+                result = f(*args, **kwargs)
+            except BaseException as e:
+                error = e
+        # become idle before the caller hears back, so that its next attempt can reuse this worker
+        with self._lock:
+            self._idle.append(inbox)
+        if not running:
+            return
+        if error is None:
+            attempt.set_result(result)
+        else:
+            attempt.set_exception(error)
+
+    def _next_job(self, inbox):
+        while True:
+            try:
+                return inbox.get(timeout=self._idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if inbox in self._idle:
+                        self._idle.remove(inbox)
+                        self._count -= 1
+                        return None
+                # an attempt was handed to this worker just as it gave up waiting
+
+
+_workers = _Workers()
+
+
+def set_max_attempt_workers(count):
+    """
+    Set the maximum number of worker threads which run attempts
+    with an ``attempt_timeout`` or a :class:`Hedge`. The default is 100.
+
+    An abandoned attempt which is still running keeps its worker busy.
+    Once every worker is busy, further attempts aren't started:
+    they fail straight away with :class:`AttemptTimeoutError`
+    (and a hedge is simply not started).
+
+    :param int count: The maximum number of workers.
+    """
+    _workers.max_workers = count
+
+
+def _attempt_timeout_error(f, timeout):
+    msg = "An attempt at the operation '{}' was abandoned after {} seconds".format(f.__name__, timeout)
+    return AttemptTimeoutError(msg)
+
+
+def _workers_busy_error(f):
+    msg = "An attempt at the operation '{}' wasn't started because all {} attempt workers are busy".format(f.__name__, _workers.max_workers)
+    return AttemptTimeoutError(msg)
+
+
+def _timeout_error(f, deadline, count):
+    msg = "The operation '{}' timed out after {} seconds and {} attempts".format(
+        f.__name__,
+        deadline.timeout,
+        count
+    )
+    return TimeoutError(msg)
+
+
+class Hedge(object):
+    """
+    A policy for *hedged* (or speculative) calls, for use as the
+    ``hedge`` argument of :func:`retry`, :func:`poll` and friends.
+
+    Rather than waiting for a slow attempt to fail before trying again,
+    a hedged call starts another attempt concurrently if the first one
+    hasn't finished after ``delay`` seconds. The first attempt to succeed wins,
+    and the others are left to finish in the background and ignored
+    (or cancelled, when used with :mod:`poll.aio`).
+    If an attempt fails while none of the others are still running,
+    its exception is raised (and may be retried).
+
+    Attempts are run on daemon worker threads, as for the ``attempt_timeout``
+    of :func:`retry`, so they never wait for a free thread;
+    or as tasks when used with :mod:`poll.aio`. If every worker is busy
+    (see :func:`set_max_attempt_workers`), no hedge is started.
+    One ``Hedge`` may be shared between many functions and threads.
+
+    :param float delay: How long to wait, in seconds, before starting another attempt.
+    :param int max_hedges: The maximum number of extra attempts for each call.
+    :param float max_ratio: The maximum number of extra attempts, as a fraction
+        of the number of calls. This caps the extra load put on the
+        downstream system; for example, ``0.1`` allows at most 10% more attempts.
+    :param float percentile: If given, adapt the delay to this percentile
+        (for example ``95``) of the latencies of recent calls.
+        ``delay`` is used until enough calls have been observed.
+    :param int window: How many recent latencies to keep
+        when adapting the delay to ``percentile``.
+    :param clock: The clock to time attempts by. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    """
+    def __init__(self, delay, max_hedges=1, max_ratio=0.1, percentile=None, window=100, clock=None):
+        self.max_hedges = max_hedges
+        self.max_ratio = max_ratio
+        self.percentile = percentile
+        self._delay = delay
+        self._latencies = collections.deque(maxlen=window)
+        self._calls = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._clock = _default_clock if clock is None else clock
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """
+        :return: A dictionary containing the number of ``calls`` made,
+            the number of ``hedges`` (extra attempts) started,
+            how many times one of those extra attempts won (``hedge_wins``),
+            and the current ``delay``.
+        """
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "hedges": self._hedges,
+                "hedge_wins": self._hedge_wins,
+                "delay": self._delay,
+            }
+
+    def _call(self, f, args, kwargs, timeout=None):
+        delay = self._begin()
+        first = self._start(f, args, kwargs)
+        if first is None:
+            raise _workers_busy_error(f)
+        pending = {first: 0}
+        # the call is timed from when its first attempt starts running
+        now = self._clock.now
+        start = now()
+        give_up_at = float("inf") if timeout is None else start + timeout
+        next_hedge_at = start + delay
+        attempts = 1
+        error = None
+        while True:
+            wake_at = min(next_hedge_at, give_up_at)
+            wait_time = None if wake_at == float("inf") else max(wake_at - now(), 0)
+            done, _ = concurrent.futures.wait(pending, wait_time, concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                attempt = pending.pop(future)
+                if future.exception() is None:
+                    self._finish(now() - start, attempt)
+                    return future.result()
+                if error is None:
+                    error = future.exception()
+            if not pending:
+                raise error
+
+            checked_at = now()
+            if checked_at >= give_up_at:
+                raise _attempt_timeout_error(f, timeout)
+            if checked_at >= next_hedge_at:
+                hedge = None
+                if attempts <= self.max_hedges and self._try_hedge():
+                    hedge = self._start(f, args, kwargs)
+                    if hedge is None:
+                        # every worker is busy, so the hedge wasn't made
+                        self._untry_hedge()
+                if hedge is not None:
+                    pending[hedge] = attempts
+                    attempts += 1
+                    next_hedge_at = now() + delay
+                else:
+                    next_hedge_at = float("inf")
+
+    def _start(self, f, args, kwargs):
+        attempt = _workers.submit(f, args, kwargs)
+        if attempt is not None:
+            attempt.started.wait()
+        return attempt
+
+    def _begin(self):
+        with self._lock:
+            self._calls += 1
+            return self._delay
+
+    def _try_hedge(self):
+        with self._lock:
+            if self._hedges >= self.max_ratio * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    def _untry_hedge(self):
+        with self._lock:
+            self._hedges -= 1
+
+    def _finish(self, latency, attempt):
+        with self._lock:
+            if attempt > 0:
+                self._hedge_wins += 1
+            if self.percentile is None:
+                return
+            latencies = self._latencies
+            latencies.append(latency)
+            if len(latencies) >= min(latencies.maxlen, 20):
+                ordered = sorted(latencies)
+                index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+                self._delay = ordered[index]
+
+
+class RetryBudget(object):
+    """
+    A limit on the number of retries, shared between any number of
+    call sites, for use as the ``budget`` argument of :func:`retry` and friends.
+
+    When a downstream system fails, independent retry loops multiply
+    the load on it. A ``RetryBudget`` allows retries only in proportion to
+    the number of calls which recently succeeded, plus a small minimum rate,
+    so that the extra load during an outage is bounded.
+    When the budget is exhausted, operations fail immediately instead of retrying.
+
+    Recording a call takes constant time. A ``RetryBudget``
+    may be shared between many functions and threads.
+
+    :param float ratio: The number of retries allowed for each successful call;
+        for example, ``0.2`` allows retries to add 20% to the load.
+    :param float min_per_second: The number of retries per second
+        which are allowed regardless of how many calls succeeded.
+    :param float ttl: How long, in seconds, a successful call (or a retry)
+        counts towards the budget.
+    :param clock: The clock to tell the time by. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    """
+    def __init__(self, ratio=0.2, min_per_second=10, ttl=10, clock=None):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.ttl = ttl
+        self._clock = _default_clock if clock is None else clock
+        # successes and retries are counted in a ring of time slots
+        # so that old ones can be forgotten in constant time
+        self._slot_count = 10
+        self._slot_width = ttl / self._slot_count
+        self._successes = [0] * self._slot_count
+        self._retries = [0] * self._slot_count
+        self._total_successes = 0
+        self._total_retries = 0
+        self._slot = 0
+        self._epoch = self._current_epoch()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """
+        Record a successful call.
+        """
+        with self._lock:
+            self._advance()
+            self._successes[self._slot] += 1
+            self._total_successes += 1
+
+    def try_withdraw(self):
+        """
+        Ask for permission to retry.
+
+        :return: ``True`` if the retry may go ahead (and has been
+            paid for from the budget), or ``False`` if the budget is exhausted.
+        """
+        with self._lock:
+            self._advance()
+            if self._balance() < 1:
+                return False
+            self._retries[self._slot] += 1
+            self._total_retries += 1
+            return True
+
+    def balance(self):
+        """
+        :return: The number of retries currently available.
+        """
+        with self._lock:
+            self._advance()
+            return max(self._balance(), 0)
+
+    def _balance(self):
+        reserve = self.min_per_second * self.ttl
+        return reserve + self.ratio * self._total_successes - self._total_retries
+
+    def _current_epoch(self):
+        return int(self._clock.now() / self._slot_width)
+
+    def _advance(self):
+        epoch = self._current_epoch()
+        elapsed = epoch - self._epoch
+        if elapsed <= 0:
+            return
+        self._epoch = epoch
+        for _ in range(min(elapsed, self._slot_count)):
+            self._slot = (self._slot + 1) % self._slot_count
+            self._total_successes -= self._successes[self._slot]
+            self._total_retries -= self._retries[self._slot]
+            self._successes[self._slot] = 0
+            self._retries[self._slot] = 0
+
+
+class Bulkhead(object):
+    """
+    A limit on the number of calls in progress at once, with a queue
+    for calls waiting their turn, for use with :func:`bulkhead`.
+    A ``Bulkhead`` may be shared between many functions,
+    including coroutine functions decorated with :func:`poll.aio.bulkhead`.
+
+    :ivar int in_flight: The number of calls in progress.
+    :ivar int queued: The number of calls waiting for their turn.
+
+    See :func:`bulkhead` for the meanings of the other parameters.
+
+    :param clock: The clock to time calls by, for an :class:`AdaptiveLimit`.
+        Waits in the queue take real time. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    """
+    def __init__(self, max_calls, max_queue=0, queue_timeout=None, clock=None):
+        self.max_calls = max_calls
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        # when a call finishes its slot is given straight to the
+        # first waiter, so a newcomer can't jump the queue
+        self._waiters = collections.deque()
+        self._clock = _default_clock if clock is None else clock
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            admitted = self._try_acquire()
+            if admitted is not None:
+                return admitted
+            waiter = _Waiter()
+            self._enqueue(waiter)
+        if waiter.wait(self.queue_timeout):
+            return True
+        return self._abandon(waiter)
+
+    def _try_acquire(self):
+        # returns True if admitted, False if full, or None if the caller should queue
+        if self.in_flight < self.max_calls and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+        return None
+
+    def _enqueue(self, waiter):
+        self._waiters.append(waiter)
+        self.queued += 1
+
+    def _abandon(self, waiter):
+        """
+        Give up waiting. Returns True if the waiter
+        was handed a slot before it could give up.
+        """
+        with self._lock:
+            if waiter.admitted:
+                return True
+            self._waiters.remove(waiter)
+            self.queued -= 1
+            return False
+
+    def _release(self, latency=None, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            if latency is not None:
+                self._observe(latency, failed)
+            while self._waiters and self.in_flight < self.max_calls:
+                self.in_flight += 1
+                self.queued -= 1
+                self._waiters.popleft().admit()
+
+    def _observe(self, latency, failed):
+        pass
+
+
+class AdaptiveLimit(Bulkhead):
+    """
+    A :class:`Bulkhead` whose limit adapts to the latency and errors
+    of the calls it lets through, using Additive Increase/Multiplicative
+    Decrease (AIMD), as TCP does to avoid congestion. Use it as
+    the ``max_calls`` argument of :func:`bulkhead` or :func:`poll.aio.bulkhead`.
+
+    Calls are judged in windows of ``window`` calls. The lowest average
+    latency of a window is taken to be the latency without queueing.
+    If a window's average latency is more than ``tolerance`` times that,
+    calls must be queueing somewhere, or if a call in the window raised
+    one of the exceptions in ``ex``, the limit is multiplied by ``backoff``.
+    Otherwise, if the limit is in use, it grows by one.
+    So that a lasting change in the latency of the backend doesn't
+    pin the limit at ``minimum``, the estimate of the latency without
+    queueing creeps up by 1% each window.
+
+    Like a :class:`Bulkhead`, each call takes a lock once on the way in
+    and once on the way out, and the adjustment takes constant time.
+
+    :param ex: The class of the exception which indicates overload,
+        or an iterable of classes. Other exceptions don't shrink the limit.
+    :type ex: class or iterable
+    :param float initial: The limit to start with.
+    :param int minimum: The smallest the limit may become.
+    :param int maximum: The largest the limit may become.
+    :param float backoff: The factor by which to shrink the limit.
+    :param float tolerance: How many times the latency without queueing
+        a window's average latency may be before the limit shrinks.
+    :param int window: The number of calls in each window.
+    :param int max_queue: The number of calls which may wait for their turn.
+    :param float queue_timeout: The length of time, in seconds,
+        that a call may wait for its turn. ``None`` means wait forever.
+    :param clock: The clock to time calls by. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+
+    :ivar float limit: The current limit. ``max_calls`` is its integer part.
+    :ivar float baseline: The estimated latency without queueing, in seconds.
+    """
+    def __init__(self, ex=(), initial=10, minimum=1, maximum=1000, backoff=0.9, tolerance=1.3, window=100, max_queue=0, queue_timeout=None, clock=None):
+        super().__init__(int(initial), max_queue, queue_timeout, clock)
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.window = window
+        self.baseline = None
+        self._exs = _exception_tuple(ex)
+        self._window_calls = 0
+        self._window_latency = 0.0
+        self._window_failed = False
+
+    def _observe(self, latency, failed):
+        # called with the lock held, after in_flight has been decremented
+        self._window_calls += 1
+        self._window_latency += latency
+        self._window_failed = self._window_failed or failed
+        if self._window_calls < self.window:
+            return
+
+        average = self._window_latency / self._window_calls
+        if self.baseline is None or average < self.baseline * 1.01:
+            self.baseline = average
+        else:
+            self.baseline *= 1.01
+
+        if self._window_failed or average > self.tolerance * self.baseline:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+        elif (self.in_flight + 1) * 2 >= self.max_calls:
+            # don't grow a limit which isn't being used
+            self.limit = min(self.maximum, self.limit + 1)
+        self.max_calls = int(self.limit)
+
+        self._window_calls = 0
+        self._window_latency = 0.0
+        self._window_failed = False
+
+
+class _Waiter(object):
+    def __init__(self):
+        self.admitted = False
+        self._event = threading.Event()
+
+    def admit(self):
+        self.admitted = True
+        self._event.set()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+
+class BulkheadFullError(Exception):
+    """
+    Exception to indicate that the operation was not carried out
+    because too many calls were in progress.
+    """
+
+
+def _bulkhead_full_error(f, bh):
+    message = "The bulkhead for {} is full: {} calls in progress and {} waiting".format(f.__name__, bh.in_flight, bh.queued)
+    return BulkheadFullError(message)
+
+
+class RateLimit(object):
+    """
+    A limit on the rate of calls, for use with :func:`ratelimit` or as the
+    ``rate_limit`` argument of :func:`retry`, :func:`poll` and friends.
+    A ``RateLimit`` may be shared between many functions and threads,
+    including coroutine functions decorated with :func:`poll.aio.ratelimit`.
+
+    This implements the Generic Cell Rate Algorithm (GCRA), a form of token bucket
+    which only needs to remember the time at which the next call
+    is due, so each call takes constant time and space.
+    A call which has to wait books its turn before it starts waiting,
+    so waiting calls don't compete with each other or with newcomers.
+
+    See :func:`ratelimit` for the meanings of the parameters.
+    """
+    def __init__(self, rate, per=1, burst=1, clock=None):
+        self.rate = rate
+        self.per = per
+        self.burst = burst
+        self._clock = _default_clock if clock is None else clock
+        self._interval = per / rate
+        self._tolerance = self._interval * (burst - 1)
+        # the theoretical arrival time of the next call
+        self._tat = float("-inf")
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Ask for permission to make a call straight away.
+
+        :return: ``True`` if the call may go ahead (and has been counted),
+            or ``False`` if it would have to wait.
+        """
+        return self._reserve(0) is not None
+
+    def acquire(self, timeout=None):
+        """
+        Wait until a call may be made.
+
+        :param float timeout: The maximum length of time to wait, in seconds.
+            ``None`` means wait as long as necessary.
+        :return: ``True`` if the call may go ahead (and has been counted),
+            or ``False``, without waiting, if it would have to wait
+            for longer than ``timeout``.
+        """
+        wait = self._reserve(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            self._clock.sleep(wait)
+        return True
+
+    def wait_time(self):
+        """
+        :return: The number of seconds until a call could be made
+            without waiting, or ``0`` if one could be made now.
+        """
+        with self._lock:
+            return max(self._tat - self._tolerance - self._clock.now(), 0)
+
+    def _reserve(self, max_wait):
+        """
+        Book the next turn. Returns the number of seconds to wait
+        for it, or None if that would be longer than max_wait.
+        """
+        with self._lock:
+            now = self._clock.now()
+            tat = self._tat if self._tat > now else now
+            wait = tat - self._tolerance - now
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tat = tat + self._interval
+            return wait if wait > 0 else 0
+
+
+class RateLimitExceededError(Exception):
+    """
+    Exception to indicate that the operation was not carried out
+    because it would have had to wait too long for its turn under a rate limit.
+    """
+    def __init__(self, message="", time_remaining=0):
+        super().__init__(message)
+        self.time_remaining = time_remaining
+
+
+def _rate_limit_exceeded_error(f, rl):
+    time_remaining = rl.wait_time()
+    message = "The rate limit for {} was exceeded. Try again in {}".format(f.__name__, time_remaining)
+    return RateLimitExceededError(message, time_remaining)
+
+
+class AttemptTimeoutError(TimeoutError):
+    """
+    Exception to indicate that a single attempt at an operation
+    was abandoned because it took longer than its ``attempt_timeout``.
+    """
+
+
+class Deadline(object):
+    """
+    A fixed point in time by which an operation must have finished.
+
+    A ``Deadline`` can be passed as the ``timeout`` of :func:`poll`,
+    :func:`retry_`, :func:`exec_` and friends, in place of a number of seconds.
+    Sharing a single ``Deadline`` between several operations
+    (for example, by passing it down the call stack) makes
+    them finish within the same overall time limit.
+
+    :param float timeout: The number of seconds from now until the deadline
+    :param clock: The clock to tell the time by. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    """
+    def __init__(self, timeout, clock=None):
+        self.timeout = timeout
+        self._clock = _default_clock if clock is None else clock
+        if timeout == float("inf"):
+            self.expires_at = timeout
+        else:
+            self.expires_at = self._clock.now() + timeout
+
+    def remaining(self):
+        """
+        :return: The number of seconds until the deadline,
+            or ``0`` if it has already passed.
+        """
+        result = self.expires_at - self._clock.now()
+        return result if result > 0 else 0
+
+    def expired(self):
+        """
+        :return: ``True`` if the deadline has passed.
+        """
+        return self._clock.now() >= self.expires_at
+
+
+def _circuit_broken_error(f, failure_counter):
+    time_remaining = failure_counter.time_remaining()
+    message = "The circuit for {} was broken. Try again in {}".format(f.__name__, time_remaining)
+    return CircuitBrokenError(message, time_remaining)
 
 
 class CircuitBrokenError(Exception):
@@ -303,6 +1671,116 @@ class CircuitBrokenError(Exception):
         self.time_remaining = time_remaining
 
 
-def _call_with_correct_number_of_args(f, args):
-    arg_count = len(inspect.signature(f).parameters)
-    f(*args[:arg_count])
+def _call_key(*args, **kwargs):
+    if kwargs:
+        return args, frozenset(kwargs.items())
+    return args
+
+
+def _exception_tuple(ex):
+    if isinstance(ex, collections.abc.Iterable):
+        return tuple(ex)
+    return (ex,)
+
+
+def _adapt_callback(f, max_args):
+    """
+    Work out how many of the ``max_args`` positional arguments
+    ``f`` is able to accept, and return a function which
+    takes all ``max_args`` and passes on the right number of them.
+    """
+    return _pass_arguments(f, _positional_arg_count(f, max_args), max_args)
+
+
+def _pass_arguments(f, arg_count, max_args):
+    if arg_count == max_args:
+        return f
+    if arg_count == 0:
+        return lambda *args: f()
+    if arg_count == 1:
+        return lambda *args: f(args[0])
+    return lambda *args: f(*args[:arg_count])
+
+
+def _lazy_callback(f, max_args):
+    """
+    Like :func:`_adapt_callback`, but put off inspecting ``f``
+    until it is first called, which for a call that succeeds
+    first time is never. How many arguments ``f`` takes is remembered,
+    so ``f`` is only inspected once however many calls it is passed to.
+    """
+    try:
+        return _pass_arguments(f, _arg_counts[f][max_args], max_args)
+    except (KeyError, TypeError):
+        # TypeError: f can't be weakly referenced, so it isn't remembered
+        pass
+    adapted = None
+
+    def callback(*args):
+        nonlocal adapted
+        if adapted is None:
+            arg_count = _positional_arg_count(f, max_args)
+            try:
+                _arg_counts.setdefault(f, {})[max_args] = arg_count
+            except TypeError:
+                pass
+            adapted = _pass_arguments(f, arg_count, max_args)
+        return adapted(*args)
+    return callback
+
+
+# how many of max_args arguments each callback given to _lazy_callback takes.
+# The counts are kept rather than the adapted callbacks, which refer to
+# the callbacks and so would keep them alive
+_arg_counts = weakref.WeakKeyDictionary({_ignore_error: {2: 2}})
+
+
+def _positional_arg_count(f, max_args):
+    try:
+        parameters = inspect.signature(f).parameters.values()
+    except (TypeError, ValueError):
+        # builtins which don't expose a signature get every argument
+        return max_args
+    count = 0
+    for p in parameters:
+        if p.kind == p.VAR_POSITIONAL:
+            return max_args
+        if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD):
+            count += 1
+    return min(count, max_args)
+
+
+def _delays(interval):
+    if isinstance(interval, numbers.Real):
+        return itertools.repeat(interval)
+    if callable(interval):
+        return _repeat_last(interval())
+    _check_interval(interval)
+    return _repeat_last(interval)
+
+
+def _check_interval(interval):
+    # every call needs its own delays, so an iterator (which can only be used once) won't do
+    if not isinstance(interval, numbers.Real) and not callable(interval) and iter(interval) is interval:
+        raise TypeError("interval must be a number, an iterable or a generator function, not an iterator: {!r}".format(interval))
+
+
+def _repeat_last(delays):
+    delay = _NO_DELAY
+    for delay in delays:
+        yield delay
+    if delay is _NO_DELAY:
+        raise ValueError("the backoff strategy produced no delays")
+    while True:
+        yield delay
+
+
+_NO_DELAY = object()
+
+
+# passed to _exec when the first attempt's result didn't satisfy ``until``
+_NOT_DONE = object()
+
+
+def _always(result):
+    return True
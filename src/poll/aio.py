@@ -0,0 +1,391 @@
+"""
+:mod:`asyncio` versions of the utilities in :mod:`poll`.
+
+Each function here has the same signature as its namesake in :mod:`poll`,
+but sleeps with :func:`asyncio.sleep` (or the ``clock``'s
+:meth:`~poll.clock.Clock.async_sleep`) instead of :func:`time.sleep`,
+so that waiting between attempts never blocks the event loop.
+
+The function being polled or retried may be a coroutine function
+or an ordinary function. ``until`` and ``on_error`` may also be
+coroutine functions; if they return an awaitable it will be awaited.
+
+Cancelling the calling task (for example using :func:`asyncio.wait_for`
+or :func:`asyncio.timeout`) cancels the operation immediately, whether
+it is in the middle of an attempt or sleeping in between attempts.
+Likewise, an attempt which overruns its ``attempt_timeout``,
+or which loses a race when hedging (see :class:`poll.Hedge`),
+is cancelled rather than being left to run on a worker thread.
+:exc:`asyncio.CancelledError` is never retried and is not passed to ``on_error``.
+"""
+import asyncio
+import inspect
+from functools import wraps
+
+from . import AdaptiveLimit, AttemptTimeoutError, Bulkhead, Deadline, RateLimit, _adapt_callback, _always, _attempt_time_limit, _attempt_timeout_error, _bulkhead_full_error, _call_key, _check_interval, _circuit_broken_error, _delays, _exception_tuple, _failure_counter, _ignore_error, _lazy_callback, _rate_limit_exceeded_error, _timeout_error
+from .clock import _default_clock
+from .events import ATTEMPT_FINISHED, ATTEMPT_STARTED, GAVE_UP, RETRY_SCHEDULED, _emit, _listeners
+
+
+def poll(until, timeout=15, interval=1, *, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, wake=None):
+    """
+    Decorator for coroutine functions that should be repeated until a condition
+    or a timeout.
+
+    ``wake`` may be an :class:`asyncio.Event`, an :class:`asyncio.Condition`
+    or a file descriptor which is written to (and is drained by the poll).
+    See :meth:`poll.clock.Clock.async_wait`.
+
+    See :func:`poll.poll`.
+    """
+    _check_interval(interval)
+    clock = _default_clock if clock is None else clock
+
+    def decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            return await _exec(f, (), until, float("inf"), timeout, interval, _ignore_error, args, kwargs, attempt_timeout, hedge, budget, rate_limit, clock, wake)
+        return wrapper
+    return decorator
+
+
+async def poll_(f, until, timeout=15, interval=1, *args, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, wake=None, **kwargs):
+    """
+    Repeatedly call a function until a condition becomes
+    true or a timeout expires.
+
+    ``wake`` may be an :class:`asyncio.Event`, an :class:`asyncio.Condition`
+    or a file descriptor which is written to (and is drained by the poll).
+    See :meth:`poll.clock.Clock.async_wait`.
+
+    See :func:`poll.poll_`.
+    """
+    return await _exec(f, (), until, float("inf"), timeout, interval, _ignore_error, args, kwargs, attempt_timeout, hedge, budget, rate_limit, _default_clock if clock is None else clock, wake)
+
+
+def retry(ex, times=3, interval=1, on_error=_ignore_error, *, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None):
+    """
+    Decorator for coroutine functions that should be retried upon error.
+
+    See :func:`poll.retry`.
+    """
+    _check_interval(interval)
+    exs = _exception_tuple(ex)
+    on_error = _adapt_callback(on_error, 2)
+    clock = _default_clock if clock is None else clock
+
+    def decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            return await _exec(f, exs, _always, times, float("inf"), interval, on_error, args, kwargs, attempt_timeout, hedge, budget, rate_limit, clock)
+        return wrapper
+    return decorator
+
+
+async def retry_(f, ex, times=3, interval=1, on_error=_ignore_error, *args, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, **kwargs):
+    """
+    Call a function and try again if it throws a specified exception.
+
+    See :func:`poll.retry_`.
+    """
+    return await exec_(f, ex, _always, times, float("inf"), interval, on_error, *args, attempt_timeout=attempt_timeout, hedge=hedge, budget=budget, rate_limit=rate_limit, clock=clock, **kwargs)
+
+
+def circuitbreaker(ex, threshold, reset_timeout, on_error=lambda e: None, half_open_calls=1, name=None, registry=None, slow_call_duration=None, clock=None):
+    """
+    Decorator for coroutine functions which should 'back off' using the
+    Circuit Breaker pattern.
+
+    See :func:`poll.circuitbreaker`.
+    """
+    exs = _exception_tuple(ex)
+    on_error = _adapt_callback(on_error, 1)
+    timer = _default_clock if clock is None else clock
+
+    def decorator(f):
+        failure_counter = _failure_counter(f, threshold, reset_timeout, half_open_calls, name, registry, clock)
+
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            state = failure_counter.acquire()
+            if state == "broken":
+                raise _circuit_broken_error(f, failure_counter)
+            probe = state == "halfbroken"
+
+            started = timer.now() if slow_call_duration is not None else None
+            try:
+                result = await _maybe_await(f(*args, **kwargs))
+            except asyncio.CancelledError:
+                if probe:
+                    failure_counter.release_probe()
+                raise
+            except BaseException as e:
+                if isinstance(e, exs):
+                    failure_counter.add_failure(probe)
+                elif probe:
+                    failure_counter.release_probe()
+                await _maybe_await(on_error(e))
+                raise
+            if started is not None and timer.now() - started >= slow_call_duration:
+                failure_counter.add_slow_call(probe)
+            else:
+                failure_counter.add_success(probe)
+            return result
+
+        return wrapper
+    return decorator
+
+
+def bulkhead(max_calls, max_queue=0, queue_timeout=None):
+    """
+    Decorator for coroutine functions which should have a limited
+    number of calls in progress at once, using the Bulkhead pattern.
+    Calls waiting in the queue don't block the event loop.
+
+    See :func:`poll.bulkhead`.
+    """
+    bh = max_calls if isinstance(max_calls, Bulkhead) else Bulkhead(max_calls, max_queue, queue_timeout)
+    observe = isinstance(bh, AdaptiveLimit)
+
+    def decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            if not await _acquire(bh):
+                raise _bulkhead_full_error(f, bh)
+            if not observe:
+                try:
+                    return await _maybe_await(f(*args, **kwargs))
+                finally:
+                    bh._release()
+
+            started = bh._clock.now()
+            try:
+                result = await _maybe_await(f(*args, **kwargs))
+            except asyncio.CancelledError:
+                # a cancelled call says nothing about the load
+                bh._release()
+                raise
+            except BaseException as e:
+                bh._release(bh._clock.now() - started, isinstance(e, bh._exs))
+                raise
+            bh._release(bh._clock.now() - started)
+            return result
+
+        wrapper.bulkhead = bh
+        return wrapper
+    return decorator
+
+
+def ratelimit(rate, per=1, burst=1, max_wait=None, clock=None):
+    """
+    Decorator for coroutine functions which should be called
+    no more than a certain number of times per second.
+    Calls waiting for their turn don't block the event loop.
+
+    See :func:`poll.ratelimit`.
+    """
+    rl = rate if isinstance(rate, RateLimit) else RateLimit(rate, per, burst, clock)
+
+    def decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            wait = rl._reserve(max_wait)
+            if wait is None:
+                raise _rate_limit_exceeded_error(f, rl)
+            if wait > 0:
+                await rl._clock.async_sleep(wait)
+            return await _maybe_await(f(*args, **kwargs))
+
+        wrapper.ratelimit = rl
+        return wrapper
+    return decorator
+
+
+def singleflight(key=None):
+    """
+    Decorator for coroutine functions whose concurrent calls with the same
+    arguments should be coalesced into one call.
+
+    The call runs in its own task, so cancelling one of the callers
+    doesn't cancel the call for the others.
+
+    See :func:`poll.singleflight`.
+    """
+    make_key = key if key is not None else _call_key
+
+    def decorator(f):
+        flights = {}
+
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            k = make_key(*args, **kwargs)
+            flight = flights.get(k)
+            if flight is None:
+                flight = flights[k] = asyncio.ensure_future(_maybe_await(f(*args, **kwargs)))
+                flight.add_done_callback(lambda _: flights.pop(k))
+            return await asyncio.shield(flight)
+
+        return wrapper
+    return decorator
+
+
+async def exec_(f, ex, until, times=3, timeout=15, interval=1, on_error=_ignore_error, *args, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=None, wake=None, **kwargs):
+    """
+    General coroutine for polling, retrying, and handling errors.
+
+    See :func:`poll.exec_`.
+    """
+    return await _exec(f, _exception_tuple(ex), until, times, timeout, interval, _lazy_callback(on_error, 2), args, kwargs, attempt_timeout, hedge, budget, rate_limit, _default_clock if clock is None else clock, wake)
+
+
+async def _exec(f, exs, until, times, timeout, interval, on_error, args, kwargs, attempt_timeout=None, hedge=None, budget=None, rate_limit=None, clock=_default_clock, wake=None):
+    deadline = timeout if isinstance(timeout, Deadline) else Deadline(timeout, clock)
+    if attempt_timeout is not None:
+        exs = exs + (AttemptTimeoutError,)
+    delays = None
+    count = 0
+    while True:
+        if rate_limit is not None:
+            wait = rate_limit._reserve(deadline.remaining())
+            if wait is None:
+                error = _timeout_error(f, deadline, count)
+                if _listeners:
+                    _emit(GAVE_UP, f.__name__, count, exception=error)
+                raise error
+            if wait > 0:
+                await clock.async_sleep(wait)
+        listening = bool(_listeners)
+        if listening:
+            _emit(ATTEMPT_STARTED, f.__name__, count)
+            started = clock.now()
+        try:
+            if hedge is not None:
+                result = await _hedged_call(hedge, f, args, kwargs, _attempt_time_limit(attempt_timeout, deadline))
+            elif attempt_timeout is None:
+                result = await _maybe_await(f(*args, **kwargs))
+            else:
+                result = await _call_with_timeout(f, args, kwargs, _attempt_time_limit(attempt_timeout, deadline))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            if listening:
+                _emit(ATTEMPT_FINISHED, f.__name__, count, clock.now() - started, exception=e)
+            await _maybe_await(on_error(e, count))
+            count += 1
+            if count >= times or not isinstance(e, exs) or (budget is not None and not budget.try_withdraw()):
+                if _listeners:
+                    _emit(GAVE_UP, f.__name__, count, exception=e)
+                raise
+        else:
+            if listening:
+                _emit(ATTEMPT_FINISHED, f.__name__, count, clock.now() - started)
+            if await _maybe_await(until(result)):
+                if budget is not None:
+                    budget.deposit()
+                return result
+        if delays is None:
+            delays = _delays(interval)
+        delay = next(delays)
+        if delay >= deadline.remaining():
+            error = _timeout_error(f, deadline, count)
+            if _listeners:
+                _emit(GAVE_UP, f.__name__, count, exception=error)
+            raise error
+        if _listeners:
+            _emit(RETRY_SCHEDULED, f.__name__, count, delay=delay)
+        if wake is None:
+            await clock.async_sleep(delay)
+        else:
+            await clock.async_wait(wake, delay)
+
+
+async def _call_with_timeout(f, args, kwargs, timeout):
+    task = asyncio.ensure_future(_maybe_await(f(*args, **kwargs)))
+    try:
+        done, _ = await asyncio.wait((task,), timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        task.cancel()
+        raise _attempt_timeout_error(f, timeout)
+    return task.result()
+
+
+async def _hedged_call(hedge, f, args, kwargs, timeout=None):
+    now = hedge._clock.now
+    start = now()
+    give_up_at = float("inf") if timeout is None else start + timeout
+    delay = hedge._begin()
+    next_hedge_at = start + delay
+    pending = {asyncio.ensure_future(_maybe_await(f(*args, **kwargs))): 0}
+    attempts = 1
+    error = None
+    try:
+        while True:
+            wake_at = min(next_hedge_at, give_up_at)
+            wait_time = None if wake_at == float("inf") else max(wake_at - now(), 0)
+            done, _ = await asyncio.wait(pending, timeout=wait_time, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempt = pending.pop(task)
+                if task.exception() is None:
+                    hedge._finish(now() - start, attempt)
+                    return task.result()
+                if error is None:
+                    error = task.exception()
+            if not pending:
+                raise error
+
+            checked_at = now()
+            if checked_at >= give_up_at:
+                raise _attempt_timeout_error(f, timeout)
+            if checked_at >= next_hedge_at:
+                if attempts <= hedge.max_hedges and hedge._try_hedge():
+                    pending[asyncio.ensure_future(_maybe_await(f(*args, **kwargs)))] = attempts
+                    attempts += 1
+                    next_hedge_at = checked_at + delay
+                else:
+                    next_hedge_at = float("inf")
+    finally:
+        for loser in pending:
+            loser.cancel()
+
+
+async def _acquire(bh):
+    with bh._lock:
+        admitted = bh._try_acquire()
+        if admitted is not None:
+            return admitted
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        bh._enqueue(waiter)
+    try:
+        await asyncio.wait_for(waiter.future, bh.queue_timeout)
+        return True
+    except asyncio.TimeoutError:
+        return bh._abandon(waiter)
+    except asyncio.CancelledError:
+        if bh._abandon(waiter):
+            bh._release()
+        raise
+
+
+class _AsyncWaiter(object):
+    # the slot may be handed over by a call finishing on another thread
+    def __init__(self, loop):
+        self.admitted = False
+        self.future = loop.create_future()
+        self._loop = loop
+
+    def admit(self):
+        self.admitted = True
+        self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+async def _maybe_await(x):
+    if inspect.isawaitable(x):
+        return await x
+    return x
@@ -0,0 +1,144 @@
+"""
+Backoff strategies, for use as the ``interval`` of
+:func:`poll.poll`, :func:`poll.retry`, :func:`poll.exec_` and friends.
+
+A backoff strategy is an iterable of delays in seconds.
+Each call to a polled or retried function iterates over
+the strategy afresh, and sleeps for each successive delay in turn.
+If the strategy runs out of delays, the last one is repeated.
+A generator function (which takes no arguments) may also be used,
+but not an iterator or a generator object, which could only be
+iterated over once; these are rejected with :class:`TypeError`.
+
+The jittered strategies spread clients' retries out at random,
+to avoid a 'thundering herd' of clients retrying in lockstep when a
+shared dependency recovers. Pass ``seed`` to make their delays
+deterministic (for example, in tests).
+
+See https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+for a comparison of the jittered strategies.
+"""
+import random
+
+
+class Constant(object):
+    """
+    Sleep for the same length of time between every attempt.
+
+    :param float interval: The delay in seconds
+    """
+    def __init__(self, interval):
+        self.interval = interval
+
+    def __iter__(self):
+        while True:
+            yield self.interval
+
+
+class Linear(object):
+    """
+    Sleep for ``start``, then ``start + step``, then ``start + 2 * step``, and so on.
+
+    :param float start: The first delay in seconds
+    :param float step: How much to increase the delay by each time
+    :param float maximum: The longest delay
+    """
+    def __init__(self, start, step, maximum=float("inf")):
+        self.start = start
+        self.step = step
+        self.maximum = maximum
+
+    def __iter__(self):
+        delay = self.start
+        while True:
+            yield min(delay, self.maximum)
+            delay += self.step
+
+
+class Exponential(object):
+    """
+    Sleep for ``base``, then ``base * factor``, then ``base * factor ** 2``, and so on.
+
+    :param float base: The first delay in seconds
+    :param float factor: How much to multiply the delay by each time
+    :param float maximum: The longest delay
+    """
+    def __init__(self, base, factor=2, maximum=float("inf")):
+        self.base = base
+        self.factor = factor
+        self.maximum = maximum
+
+    def __iter__(self):
+        return _exponential(self.base, self.factor, self.maximum)
+
+
+class FullJitter(object):
+    """
+    Sleep for a random length of time between zero and
+    the delay given by :class:`Exponential`.
+
+    :param float base: The first (un-jittered) delay in seconds
+    :param float factor: How much to multiply the (un-jittered) delay by each time
+    :param float maximum: The longest delay
+    :param seed: A seed for the random number generator
+    """
+    def __init__(self, base, factor=2, maximum=float("inf"), seed=None):
+        self.base = base
+        self.factor = factor
+        self.maximum = maximum
+        self._random = random.Random(seed)
+
+    def __iter__(self):
+        for delay in _exponential(self.base, self.factor, self.maximum):
+            yield self._random.uniform(0, delay)
+
+
+class EqualJitter(object):
+    """
+    Sleep for at least half of the delay given by :class:`Exponential`,
+    plus a random length of time up to the other half.
+
+    :param float base: The first (un-jittered) delay in seconds
+    :param float factor: How much to multiply the (un-jittered) delay by each time
+    :param float maximum: The longest delay
+    :param seed: A seed for the random number generator
+    """
+    def __init__(self, base, factor=2, maximum=float("inf"), seed=None):
+        self.base = base
+        self.factor = factor
+        self.maximum = maximum
+        self._random = random.Random(seed)
+
+    def __iter__(self):
+        for delay in _exponential(self.base, self.factor, self.maximum):
+            yield delay / 2 + self._random.uniform(0, delay / 2)
+
+
+class DecorrelatedJitter(object):
+    """
+    Sleep for a random length of time between ``base`` and
+    three times the previous delay.
+
+    :param float base: The shortest delay in seconds
+    :param float maximum: The longest delay
+    :param seed: A seed for the random number generator
+    """
+    def __init__(self, base, maximum=float("inf"), seed=None):
+        self.base = base
+        self.maximum = maximum
+        self._random = random.Random(seed)
+
+    def __iter__(self):
+        delay = self.base
+        while True:
+            delay = min(self.maximum, self._random.uniform(self.base, delay * 3))
+            yield delay
+
+
+def _exponential(base, factor, maximum):
+    delay = base
+    while delay < maximum:
+        yield delay
+        delay *= factor
+    while True:
+        yield maximum
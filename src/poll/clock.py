@@ -0,0 +1,222 @@
+"""
+Clocks for :mod:`poll` to tell the time and sleep by.
+
+Everything in :mod:`poll` which waits or measures time - :func:`poll.retry`,
+:func:`poll.poll`, :func:`poll.exec_`, :func:`poll.circuitbreaker`,
+:func:`poll.ratelimit`, :class:`poll.RetryBudget`, :class:`poll.RateLimit`,
+:class:`poll.Deadline`, :class:`poll.Bulkhead`, :class:`poll.AdaptiveLimit`,
+:class:`poll.Hedge`, :class:`poll.poller.Poller`, :class:`poll.policy.Policy`
+and their counterparts in :mod:`poll.aio` - takes a ``clock`` argument. By default they use
+the real :class:`Clock`.
+
+In tests, pass a :class:`VirtualClock` instead. Sleeping on a virtual clock
+returns straight away and moves the clock forward, so code which
+retries every five seconds can be tested in microseconds::
+
+    clock = VirtualClock()
+
+    @retry(requests.HTTPError, times=3, interval=5, clock=clock)
+    def get_user(uri):
+        ...
+
+    get_user(uri)
+    assert clock.sleeps == [5, 5]
+
+:class:`Clock` has coroutine methods for :mod:`poll.aio`, so importing
+:mod:`poll` at all needs Python 3.7 or later, as ``setup.py`` declares.
+
+Waits which are made by threads on each other - in a :class:`poll.Bulkhead`'s
+queue, or for the attempts of a :class:`poll.Hedge`, for example - take real
+time whatever the clock, though the time they take is measured by it.
+A :class:`poll.poller.Poller` waits for its next due poll on its clock,
+so on a :class:`VirtualClock` it skips straight to it.
+"""
+import asyncio
+import os
+import select
+import threading
+import time
+
+
+class Clock(object):
+    """
+    The real clock: :func:`time.perf_counter`, :func:`time.sleep`
+    and :func:`asyncio.sleep`.
+
+    Subclass it to tell the time or sleep some other way.
+    """
+    def now(self):
+        """
+        :return: The current time in seconds, from an arbitrary starting point.
+        """
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        """
+        Block the calling thread for ``seconds`` seconds.
+        """
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds):
+        """
+        Suspend the calling coroutine for ``seconds`` seconds.
+        """
+        await asyncio.sleep(seconds)
+
+    def wait(self, source, seconds):
+        """
+        Block the calling thread until ``source`` is signalled,
+        for at most ``seconds`` seconds.
+
+        :param source: A :class:`threading.Event`, which is cleared
+            when it wakes the caller, a :class:`threading.Condition`,
+            which must be notified, or a file descriptor (or an object
+            with a ``fileno()`` method) which becomes readable.
+            Whatever has been written to a file descriptor is read
+            and thrown away, so that it doesn't stay readable;
+            it should be a pipe or an eventfd used only for waking.
+            At the end of the file, it is never signalled.
+        :return: ``True`` if ``source`` was signalled.
+        """
+        if isinstance(source, threading.Event):
+            if source.wait(seconds):
+                source.clear()
+                return True
+            return False
+        if isinstance(source, threading.Condition):
+            with source:
+                return source.wait(seconds)
+        started = self.now()
+        if select.select([source], [], [], seconds)[0]:
+            if _drain(source):
+                return True
+            self.sleep(max(seconds - (self.now() - started), 0))
+        return False
+
+    async def async_wait(self, source, seconds):
+        """
+        Suspend the calling coroutine until ``source`` is signalled,
+        for at most ``seconds`` seconds.
+
+        :param source: An :class:`asyncio.Event`, which is cleared
+            when it wakes the caller, an :class:`asyncio.Condition`,
+            which must be notified, or a file descriptor (or an object
+            with a ``fileno()`` method) which becomes readable,
+            and is drained as for :meth:`wait`.
+        :return: ``True`` if ``source`` was signalled.
+        """
+        if isinstance(source, asyncio.Event):
+            try:
+                await asyncio.wait_for(source.wait(), seconds)
+            except asyncio.TimeoutError:
+                return False
+            source.clear()
+            return True
+        if isinstance(source, asyncio.Condition):
+            async with source:
+                try:
+                    await asyncio.wait_for(source.wait(), seconds)
+                except asyncio.TimeoutError:
+                    return False
+                return True
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        readable = loop.create_future()
+        loop.add_reader(source, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait((readable,), timeout=seconds)
+        finally:
+            loop.remove_reader(source)
+        if readable.done():
+            if _drain(source):
+                return True
+            await self.async_sleep(max(seconds - (loop.time() - started), 0))
+        return False
+
+
+class VirtualClock(Clock):
+    """
+    A clock which only moves when something sleeps on it,
+    or when it is moved forward with :meth:`advance`.
+
+    Sleeping returns straight away, with the clock moved forward by
+    the length of the sleep, so sleeps made by different threads
+    or coroutines add up rather than overlapping.
+    A coroutine which sleeps still yields to the event loop once.
+
+    Waiting for a source (see :meth:`Clock.wait`) doesn't block either:
+    if the source has already been signalled the wait ends at once
+    (and the source is cleared or drained),
+    and otherwise it counts as a sleep for the whole length of the wait.
+    A condition never counts as signalled, since a notification
+    can't be seen without blocking.
+
+    A ``VirtualClock`` may be shared between many threads.
+
+    :param float start: The time on the clock to begin with.
+    """
+    def __init__(self, start=0):
+        self.time = start
+        #: The length of every sleep made on the clock, in order.
+        self.sleeps = []
+        self._lock = threading.Lock()
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self._sleep(seconds)
+
+    async def async_sleep(self, seconds):
+        self._sleep(seconds)
+        await asyncio.sleep(0)
+
+    def wait(self, source, seconds):
+        if _signalled(source):
+            return True
+        self._sleep(seconds)
+        return False
+
+    async def async_wait(self, source, seconds):
+        signalled = _signalled(source)
+        if not signalled:
+            self._sleep(seconds)
+        await asyncio.sleep(0)
+        return signalled
+
+    def advance(self, seconds):
+        """
+        Move the clock forward by ``seconds`` seconds, without counting it as a sleep.
+        """
+        with self._lock:
+            self.time += seconds
+
+    def _sleep(self, seconds):
+        with self._lock:
+            self.sleeps.append(seconds)
+            self.time += seconds
+
+
+def _signalled(source):
+    # has source been signalled? Checks without blocking, and clears an event
+    if isinstance(source, (threading.Event, asyncio.Event)):
+        if source.is_set():
+            source.clear()
+            return True
+        return False
+    if isinstance(source, (threading.Condition, asyncio.Condition)):
+        return False
+    return bool(select.select([source], [], [], 0)[0]) and _drain(source)
+
+
+def _drain(source):
+    # read and throw away what was written to a readable wake-up descriptor,
+    # so that it stops being readable. False at the end of the file
+    fd = source if isinstance(source, int) else source.fileno()
+    try:
+        return bool(os.read(fd, 65536))
+    except BlockingIOError:
+        return False
+
+
+_default_clock = Clock()
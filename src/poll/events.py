@@ -0,0 +1,194 @@
+"""
+Instrumentation for :mod:`poll`.
+
+Register a listener with :func:`add_listener` to be told about every
+attempt, retry and circuit breaker transition. A listener is any function
+which takes an :class:`Event`. Listeners are called synchronously,
+on the thread which made the call, so they should be quick.
+
+When no listeners are registered, :mod:`poll` doesn't build events,
+or even read the clock to time attempts.
+
+:class:`Metrics` is a listener which aggregates events in memory
+into counters and latency histograms.
+"""
+import collections
+import threading
+
+
+ATTEMPT_STARTED = "attempt_started"
+ATTEMPT_FINISHED = "attempt_finished"
+RETRY_SCHEDULED = "retry_scheduled"
+GAVE_UP = "gave_up"
+CIRCUIT_OPENED = "circuit_opened"
+CIRCUIT_HALF_OPENED = "circuit_half_opened"
+CIRCUIT_CLOSED = "circuit_closed"
+
+
+class Event(collections.namedtuple("Event", "kind name attempt duration delay exception")):
+    """
+    Something which happened while polling, retrying or circuit breaking.
+
+    :ivar str kind: One of the constants in this module:
+        ``ATTEMPT_STARTED``, ``ATTEMPT_FINISHED``, ``RETRY_SCHEDULED``, ``GAVE_UP``,
+        ``CIRCUIT_OPENED``, ``CIRCUIT_HALF_OPENED`` or ``CIRCUIT_CLOSED``.
+    :ivar str name: The name of the function being called.
+    :ivar int attempt: For ``ATTEMPT_STARTED`` and ``ATTEMPT_FINISHED``,
+        the number of the attempt, starting at 0. For ``RETRY_SCHEDULED``,
+        the number of the attempt which will be made after the delay.
+        For ``GAVE_UP``, the total number of attempts which were made.
+    :ivar float duration: How long the attempt took in seconds (``ATTEMPT_FINISHED`` only).
+    :ivar float delay: How long the retry will sleep for in seconds (``RETRY_SCHEDULED`` only).
+    :ivar exception: The exception which was raised by the attempt,
+        or (for ``GAVE_UP``) the exception which is being raised to the caller.
+    """
+    __slots__ = ()
+
+
+Event.__new__.__defaults__ = (None, None, None, None)
+
+
+# mutated in place (never rebound) so that other modules can hold a reference to it
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def add_listener(listener):
+    """
+    Start calling ``listener`` with every :class:`Event`.
+
+    :param function listener: A function taking an :class:`Event`.
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """
+    Stop calling ``listener``.
+
+    :param function listener: A function which was passed to :func:`add_listener`.
+    """
+    with _listeners_lock:
+        _listeners.remove(listener)
+
+
+def _emit(kind, name, attempt=None, duration=None, delay=None, exception=None):
+    event = Event(kind, name, attempt, duration, delay, exception)
+    for listener in tuple(_listeners):
+        listener(event)
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of latencies with a fixed relative precision,
+    in the style of HdrHistogram.
+
+    Latencies are recorded in whole microseconds. Each power of two
+    is divided into ``2 ** (precision_bits - 1)`` equal buckets, so every
+    recorded value is accurate to within about ``2 ** -(precision_bits - 1)``
+    of itself (under 1% by default). Recording a value takes constant time,
+    and memory grows only with the number of distinct buckets used.
+
+    :param int precision_bits: The number of significant bits to keep.
+    """
+    def __init__(self, precision_bits=8):
+        self._precision_bits = precision_bits
+        self._counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """
+        Record a latency.
+
+        :param float seconds: The latency in seconds.
+        """
+        micros = max(int(seconds * 1e6), 0)
+        shift = max(micros.bit_length() - self._precision_bits, 0)
+        key = (shift, micros >> shift)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """
+        :param float p: The percentile to compute, between 0 and 100.
+        :return: The latency in seconds below which ``p`` percent of
+            the recorded latencies fall, or ``None`` if nothing has been recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(p / 100 * self.count, 1)
+        seen = 0
+        for (shift, mantissa), n in sorted(self._counts.items()):
+            seen += n
+            if seen >= rank:
+                # the midpoint of the bucket
+                return (((mantissa << shift) + ((mantissa + 1) << shift) - 1) / 2) / 1e6
+        return self.max
+
+    def to_dict(self):
+        """
+        :return: A dictionary summarising the histogram, suitable for exporting.
+        """
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+        }
+
+
+class Metrics(object):
+    """
+    A listener which keeps counters and latency histograms in memory,
+    for each function name.
+
+    Usage::
+
+        metrics = Metrics()
+        add_listener(metrics)
+        ...
+        export(metrics.to_dict())
+    """
+    def __init__(self):
+        self._counters = collections.defaultdict(collections.Counter)
+        self._sleep_time = collections.defaultdict(float)
+        self._latencies = collections.defaultdict(LatencyHistogram)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self._counters[event.name][event.kind] += 1
+            if event.kind == ATTEMPT_FINISHED:
+                self._latencies[event.name].record(event.duration)
+            elif event.kind == RETRY_SCHEDULED:
+                self._sleep_time[event.name] += event.delay
+
+    def to_dict(self):
+        """
+        :return: A dictionary, keyed by function name, of the number
+            of events of each kind, the total time spent sleeping
+            between attempts (``sleep_seconds``), and a summary of the
+            latency of attempts (``latency``).
+        """
+        with self._lock:
+            return {
+                name: dict(
+                    counters,
+                    sleep_seconds=self._sleep_time.get(name, 0.0),
+                    latency=self._latencies[name].to_dict() if name in self._latencies else None,
+                )
+                for name, counters in self._counters.items()
+            }
@@ -0,0 +1,270 @@
+"""
+Combinations of the utilities in :mod:`poll`, compiled into one wrapper.
+
+Stacking decorators such as :func:`poll.retry`, :func:`poll.circuitbreaker`
+and :func:`poll.bulkhead` works, but every call then passes through
+each decorator's wrapper in turn. A :class:`Policy` describes the whole
+combination, and applying it to a function builds a single wrapper
+which does everything, with every option worked out in advance::
+
+    policy = (Policy()
+        .fallback(CircuitBrokenError, lambda: cached_user)
+        .retry(requests.HTTPError, times=3, interval=1)
+        .circuitbreaker(requests.HTTPError, threshold=5, reset_timeout=60)
+        .bulkhead(10)
+        .timeout(5))
+
+    @policy
+    def get_user(uri):
+        ...
+
+Whatever order they are added in, the parts of a policy are always
+applied in this order, from the outside in:
+
+1. ``fallback`` handles whatever the rest of the policy raises.
+2. ``retry`` and ``poll`` make repeated attempts.
+3. ``circuitbreaker`` decides whether each attempt may go ahead
+   and counts its outcome.
+4. ``bulkhead`` limits the number of attempts in progress.
+5. ``timeout`` abandons an attempt which takes too long.
+   (An abandoned attempt gives up its place in the bulkhead,
+   although it carries on in the background.)
+
+``Policy`` objects are immutable: each method returns a new ``Policy``,
+so a partly-built policy can be shared and extended.
+"""
+import copy
+from functools import partial, wraps
+
+from . import AdaptiveLimit, AttemptTimeoutError, Bulkhead, Deadline, _adapt_callback, _attempt_time_limit, _bulkhead_full_error, _call_with_timeout, _check_interval, _circuit_broken_error, _delays, _exception_tuple, _failure_counter, _ignore_error, _timeout_error
+from .clock import _default_clock
+from .events import ATTEMPT_FINISHED, ATTEMPT_STARTED, GAVE_UP, RETRY_SCHEDULED, _emit, _listeners
+
+
+class Policy(object):
+    """
+    A combination of retrying or polling, circuit breaking, a bulkhead,
+    a timeout and a fallback, to be applied to functions as a decorator.
+
+    Each method takes the same parameters as the corresponding
+    decorator in :mod:`poll` and returns a new ``Policy``.
+    Calling a method again replaces that part of the policy.
+
+    :param clock: The clock which every part of the policy tells
+        the time and sleeps by. See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    """
+    def __init__(self, clock=None):
+        self._clock = clock
+        self._retry = None
+        self._poll = None
+        self._interval = 1
+        self._circuit = None
+        self._bulkhead = None
+        self._attempt_timeout = None
+        self._fallback = None
+
+    def retry(self, ex, times=3, interval=1, on_error=_ignore_error):
+        """
+        Retry attempts which raise ``ex``. See :func:`poll.retry`.
+        """
+        _check_interval(interval)
+        return self._with(_retry=(ex, times, on_error), _interval=interval)
+
+    def poll(self, until, timeout=15, interval=1, wake=None):
+        """
+        Repeat attempts until a condition becomes true. See :func:`poll.poll`.
+
+        If the policy also retries, it behaves like :func:`poll.exec_`,
+        and waits for the ``interval`` which was given last.
+        If ``wake`` is given, retries wake early for it too.
+        """
+        _check_interval(interval)
+        return self._with(_poll=(until, timeout, wake), _interval=interval)
+
+    def circuitbreaker(self, ex, threshold, reset_timeout, on_error=lambda e: None, half_open_calls=1, name=None, registry=None, slow_call_duration=None):
+        """
+        Guard each attempt with a circuit breaker. See :func:`poll.circuitbreaker`.
+
+        The circuit belongs to the decorated function, so applying
+        one policy to several functions gives each of them its own circuit,
+        unless they share a ``name`` and a ``registry``.
+        """
+        return self._with(_circuit=(ex, threshold, reset_timeout, on_error, half_open_calls, name, registry, slow_call_duration))
+
+    def bulkhead(self, max_calls, max_queue=0, queue_timeout=None):
+        """
+        Limit the number of attempts in progress at once. See :func:`poll.bulkhead`.
+
+        Unless ``max_calls`` is a :class:`poll.Bulkhead`, each function
+        which the policy is applied to has its own limit.
+        """
+        return self._with(_bulkhead=(max_calls, max_queue, queue_timeout))
+
+    def timeout(self, seconds):
+        """
+        Abandon any attempt which takes longer than ``seconds``,
+        like the ``attempt_timeout`` parameter of :func:`poll.retry`.
+        If the policy retries, abandoned attempts are retried.
+        """
+        return self._with(_attempt_timeout=seconds)
+
+    def fallback(self, ex, function):
+        """
+        Instead of raising ``ex``, return the result of ``function``.
+
+        :param ex: The class of the exception to catch, or an iterable of classes
+        :type ex: class or iterable
+        :param function function: A function to call in place of raising the exception.
+            If it takes a parameter, it will be called with the exception.
+        """
+        return self._with(_fallback=(ex, function))
+
+    def __call__(self, f):
+        exs, times, on_error = (), 1, _ignore_error
+        until, timeout, wake = None, float("inf"), None
+        if self._retry is not None:
+            ex, times, on_error = self._retry
+            exs = _exception_tuple(ex)
+            on_error = _adapt_callback(on_error, 2)
+        if self._poll is not None:
+            until, timeout, wake = self._poll
+            if self._retry is None:
+                times = float("inf")
+        polling = self._poll is not None
+        interval = self._interval
+        clock = _default_clock if self._clock is None else self._clock
+        attempt_timeout = self._attempt_timeout
+        if attempt_timeout is not None:
+            exs = exs + (AttemptTimeoutError,)
+
+        failure_counter = None
+        if self._circuit is not None:
+            cb_ex, threshold, reset_timeout, cb_on_error, half_open_calls, name, registry, slow_call_duration = self._circuit
+            cb_exs = _exception_tuple(cb_ex)
+            cb_on_error = _adapt_callback(cb_on_error, 1)
+            failure_counter = _failure_counter(f, threshold, reset_timeout, half_open_calls, name, registry, self._clock)
+        else:
+            slow_call_duration = None
+
+        bh = None
+        if self._bulkhead is not None:
+            max_calls, max_queue, queue_timeout = self._bulkhead
+            bh = max_calls if isinstance(max_calls, Bulkhead) else Bulkhead(max_calls, max_queue, queue_timeout, self._clock)
+        observe = isinstance(bh, AdaptiveLimit)
+        # an abandoned attempt is still running, so it keeps its place in the bulkhead
+        hold_abandoned = bh is not None and attempt_timeout is not None
+        timing = observe or slow_call_duration is not None
+
+        fallback_exs, fallback = (), None
+        if self._fallback is not None:
+            fallback_exs = _exception_tuple(self._fallback[0])
+            fallback = _adapt_callback(self._fallback[1], 1)
+
+        timed = isinstance(timeout, Deadline) or timeout != float("inf")
+        forever = Deadline(float("inf"))
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            deadline = forever
+            if timed:
+                deadline = timeout if isinstance(timeout, Deadline) else Deadline(timeout, clock)
+            delays = None
+            count = 0
+            try:
+                while True:
+                    listening = bool(_listeners)
+                    if listening:
+                        _emit(ATTEMPT_STARTED, f.__name__, count)
+                        started = clock.now()
+                    try:
+                        probe = None
+                        if failure_counter is not None:
+                            state = failure_counter.acquire()
+                            if state == "broken":
+                                raise _circuit_broken_error(f, failure_counter)
+                            probe = state == "halfbroken"
+                        try:
+                            if bh is not None and not bh._acquire():
+                                raise _bulkhead_full_error(f, bh)
+                            if timing:
+                                call_started = clock.now()
+                            abandoned = [] if hold_abandoned else None
+                            try:
+                                if attempt_timeout is None:
+                                    result = f(*args, **kwargs)
+                                else:
+                                    result = _call_with_timeout(f, args, kwargs, _attempt_time_limit(attempt_timeout, deadline), abandoned)
+                            except BaseException as e:
+                                if abandoned:
+                                    abandoned[0].add_done_callback(partial(_release_when_done, bh, observe, clock, call_started if timing else None))
+                                elif observe:
+                                    bh._release(clock.now() - call_started, isinstance(e, bh._exs))
+                                elif bh is not None:
+                                    bh._release()
+                                raise
+                            if timing:
+                                call_duration = clock.now() - call_started
+                            if observe:
+                                bh._release(call_duration)
+                            elif bh is not None:
+                                bh._release()
+                        except BaseException as e:
+                            if probe is not None:
+                                if isinstance(e, cb_exs):
+                                    failure_counter.add_failure(probe)
+                                elif probe:
+                                    failure_counter.release_probe()
+                                cb_on_error(e)
+                            raise
+                        if probe is not None:
+                            if slow_call_duration is not None and call_duration >= slow_call_duration:
+                                failure_counter.add_slow_call(probe)
+                            else:
+                                failure_counter.add_success(probe)
+                    except BaseException as e:
+                        if listening:
+                            _emit(ATTEMPT_FINISHED, f.__name__, count, clock.now() - started, exception=e)
+                        on_error(e, count)
+                        count += 1
+                        if count >= times or not isinstance(e, exs):
+                            if _listeners:
+                                _emit(GAVE_UP, f.__name__, count, exception=e)
+                            raise
+                    else:
+                        if listening:
+                            _emit(ATTEMPT_FINISHED, f.__name__, count, clock.now() - started)
+                        if not polling or until(result):
+                            return result
+                    if delays is None:
+                        delays = _delays(interval)
+                    delay = next(delays)
+                    if delay >= deadline.remaining():
+                        error = _timeout_error(f, deadline, count)
+                        if _listeners:
+                            _emit(GAVE_UP, f.__name__, count, exception=error)
+                        raise error
+                    if _listeners:
+                        _emit(RETRY_SCHEDULED, f.__name__, count, delay=delay)
+                    if wake is None:
+                        clock.sleep(delay)
+                    else:
+                        clock.wait(wake, delay)
+            except fallback_exs as e:
+                return fallback(e)
+
+        if bh is not None:
+            wrapper.bulkhead = bh
+        return wrapper
+
+    def _with(self, **changes):
+        policy = copy.copy(self)
+        policy.__dict__.update(changes)
+        return policy
+
+
+def _release_when_done(bh, observe, clock, started, attempt):
+    if observe:
+        bh._release(clock.now() - started, isinstance(attempt.exception(), bh._exs))
+    else:
+        bh._release()
@@ -0,0 +1,345 @@
+"""
+Polling many conditions at once without a thread for each.
+
+:func:`poll.poll_` sleeps on the calling thread in between attempts,
+so waiting for a thousand jobs at once takes a thousand threads.
+A :class:`Poller` keeps every outstanding poll in one schedule,
+which is driven by a single thread, and runs the checks on a fixed
+pool of worker threads. Each poll is represented by a
+:class:`concurrent.futures.Future`::
+
+    with Poller(workers=8) as poller:
+        futures = [poller.submit(get_job, is_finished, 600, 5, job_id) for job_id in job_ids]
+        for future in concurrent.futures.as_completed(futures):
+            print(future.result())
+
+The number of threads stays the same however many polls are in progress,
+and each one only costs a few small objects. To wait for a poll
+in a coroutine, wrap its future with :func:`asyncio.wrap_future`.
+
+If the things you're waiting for can be checked in bulk, for example by
+an API which takes a list of IDs, use :meth:`Poller.batch` to check
+many of them with one call::
+
+    with Poller() as poller:
+        jobs = poller.batch(get_jobs, max_size=100, max_wait=1)
+        futures = [jobs.submit(job_id, is_finished, 600, 5) for job_id in job_ids]
+"""
+import concurrent.futures
+import heapq
+import itertools
+import threading
+
+from . import Deadline, _delays, _timeout_error
+from .clock import _default_clock
+from .events import ATTEMPT_FINISHED, ATTEMPT_STARTED, GAVE_UP, RETRY_SCHEDULED, _emit, _listeners
+
+
+class Poller(object):
+    """
+    A scheduler which polls many functions at once.
+
+    Each poll follows the rules of :func:`poll.poll_`: the function is
+    called straight away and then every ``interval`` seconds until
+    ``until`` returns ``True``, it raises an exception,
+    or the next check couldn't be made before the ``timeout``.
+
+    A ``Poller`` may be used from many threads at once.
+    Close it when you're done, or use it as a context manager.
+
+    :param int workers: The number of threads on which to run the checks.
+        A check which is due waits for a free worker,
+        so slow checks may delay other polls.
+    :param clock: The clock to tell the time and wait for due polls by.
+        Checks are timed, and timeouts are measured, on the same clock.
+        See :mod:`poll.clock`.
+    :type clock: :class:`poll.clock.Clock`
+    """
+    def __init__(self, workers=4, clock=None):
+        self.workers = workers
+        self._clock = _default_clock if clock is None else clock
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="poll-worker")
+        # a heap of (due time, sequence number, poll or batch); the sequence number breaks ties
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, f, until, timeout=15, interval=1, *args, **kwargs):
+        """
+        Start polling a function.
+
+        See :func:`poll.poll_` for the meanings of the parameters.
+
+        :return: A :class:`concurrent.futures.Future` which will be
+            resolved with the final return value of ``f``,
+            or with the exception raised by ``f`` or ``until``,
+            or with :class:`TimeoutError` if the condition didn't become true
+            within the timeout. Cancel the future to stop polling.
+        :raises RuntimeError: The poller has been closed.
+        """
+        return self._submit(_Poll(f, until, timeout, interval, args, kwargs, self._clock))
+
+    def batch(self, f, max_size=100, max_wait=0):
+        """
+        Create a :class:`Batch`, through which many polls can be checked
+        with a single call to ``f``.
+
+        Polls in the batch which are due at the same time are checked together,
+        in groups of up to ``max_size``. A group is checked as soon as
+        ``max_size`` polls are due, but a smaller group may be held back
+        for up to ``max_wait`` seconds after its first poll is due,
+        so that it can be checked along with polls which fall due later.
+
+        :param function f: A function which takes a list of keys
+            and returns a dictionary mapping each key to its result.
+            If a key is missing from the dictionary,
+            the poll for that key fails with :class:`KeyError`.
+        :param int max_size: The most keys to pass to ``f`` at once.
+        :param float max_wait: How long a poll may be held back, in seconds.
+        :return: A :class:`Batch`.
+        """
+        return Batch(self, f, max_size, max_wait)
+
+    def close(self):
+        """
+        Stop polling. Outstanding polls are cancelled,
+        and checks which are in progress are allowed to finish.
+        """
+        with self._condition:
+            self._closed = True
+            jobs = [job for _, _, job in self._schedule if isinstance(job, _Poll)]
+            for batch in self._batches:
+                jobs.extend(job for _, _, job in batch._schedule)
+                batch._schedule = []
+            self._schedule = []
+            self._condition.notify()
+        for job in jobs:
+            job.future.cancel()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, job):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Can't submit a poll to a closed Poller")
+            self._schedule_poll(self._clock.now(), job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="poll-scheduler", daemon=True)
+                self._thread.start()
+        return job.future
+
+    def _schedule_poll(self, due_time, job):
+        # the caller must hold self._condition
+        if job.batch is None:
+            self._push(due_time, job)
+        else:
+            # the batch's polls wait in its own schedule. The batch is woken
+            # when the poll is due, in case that fills a group, and again
+            # when the poll has been held back for long enough
+            heapq.heappush(job.batch._schedule, (due_time, next(self._sequence), job))
+            self._push(due_time, job.batch)
+            if job.batch.max_wait > 0:
+                self._push(due_time + job.batch.max_wait, job.batch)
+
+    def _push(self, due_time, item):
+        # the caller must hold self._condition
+        heapq.heappush(self._schedule, (due_time, next(self._sequence), item))
+        if self._schedule[0][2] is item:
+            # the scheduler is sleeping until a later time
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._wait_for_due_polls()
+            if due is None:
+                return
+            for job in due:
+                if isinstance(job, tuple):
+                    batch, jobs = job
+                    self._executor.submit(self._check_batch, batch, jobs)
+                elif not job.future.cancelled():
+                    self._executor.submit(self._check, job)
+
+    def _wait_for_due_polls(self):
+        # the caller must hold self._condition. Returns None once the poller is closed
+        while not self._closed:
+            if not self._schedule:
+                self._condition.wait()
+                continue
+            now = self._clock.now()
+            if self._schedule[0][0] > now:
+                self._clock.wait(self._condition, self._schedule[0][0] - now)
+                continue
+            due = []
+            while self._schedule and self._schedule[0][0] <= now:
+                item = heapq.heappop(self._schedule)[2]
+                if isinstance(item, Batch):
+                    due.extend((item, jobs) for jobs in item._take_due(now))
+                else:
+                    due.append(item)
+            return due
+        return None
+
+    def _check(self, job):
+        if job.future.cancelled():
+            return
+        name = job.f.__name__
+        listening = bool(_listeners)
+        if listening:
+            _emit(ATTEMPT_STARTED, name, job.attempts)
+            started = self._clock.now()
+        try:
+            result = job.f(*job.args, **job.kwargs)
+        except BaseException as e:
+            job.attempts += 1
+            if listening:
+                _emit(ATTEMPT_FINISHED, name, job.attempts - 1, self._clock.now() - started, exception=e)
+            self._give_up(job, e)
+            return
+        job.attempts += 1
+        if listening:
+            _emit(ATTEMPT_FINISHED, name, job.attempts - 1, self._clock.now() - started)
+        self._judge(job, result)
+
+    def _check_batch(self, batch, jobs):
+        jobs = [job for job in jobs if not job.future.cancelled()]
+        if not jobs:
+            return
+        name = batch.f.__name__
+        listening = bool(_listeners)
+        if listening:
+            for job in jobs:
+                _emit(ATTEMPT_STARTED, name, job.attempts)
+            started = self._clock.now()
+        try:
+            results = batch.f([job.key for job in jobs])
+        except BaseException as e:
+            for job in jobs:
+                job.attempts += 1
+                if listening:
+                    _emit(ATTEMPT_FINISHED, name, job.attempts - 1, self._clock.now() - started, exception=e)
+                self._give_up(job, e)
+            return
+        duration = self._clock.now() - started if listening else None
+        for job in jobs:
+            job.attempts += 1
+            try:
+                result = results[job.key]
+            except KeyError as e:
+                if listening:
+                    _emit(ATTEMPT_FINISHED, name, job.attempts - 1, duration, exception=e)
+                self._give_up(job, e)
+                continue
+            if listening:
+                _emit(ATTEMPT_FINISHED, name, job.attempts - 1, duration)
+            self._judge(job, result)
+
+    def _judge(self, job, result):
+        try:
+            done = job.until(result)
+        except BaseException as e:
+            self._give_up(job, e)
+            return
+        if done:
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_result(result)
+            return
+
+        delay = next(job.delays)
+        if delay >= job.deadline.remaining():
+            self._give_up(job, _timeout_error(job.f, job.deadline, job.attempts))
+            return
+        if _listeners:
+            _emit(RETRY_SCHEDULED, job.f.__name__, job.attempts, delay=delay)
+        with self._condition:
+            if self._closed:
+                job.future.cancel()
+                return
+            self._schedule_poll(self._clock.now() + delay, job)
+
+    def _give_up(self, job, exception):
+        if _listeners:
+            _emit(GAVE_UP, job.f.__name__, job.attempts, exception=exception)
+        if job.future.set_running_or_notify_cancel():
+            job.future.set_exception(exception)
+
+
+class Batch(object):
+    """
+    A group of polls which are checked together by one function.
+    Create one using :meth:`Poller.batch`.
+    """
+    def __init__(self, poller, f, max_size, max_wait):
+        self.f = f
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._poller = poller
+        # a heap of (due time, sequence number, poll), guarded by the poller's lock
+        self._schedule = []
+        with poller._condition:
+            poller._batches.append(self)
+
+    def submit(self, key, until, timeout=15, interval=1):
+        """
+        Start polling a key.
+
+        :param key: The key to pass to the batch's function.
+        :param function until: The success condition.
+            It will be called with the result for ``key``.
+
+        See :func:`poll.poll_` for the meanings of the other parameters.
+
+        :return: A :class:`concurrent.futures.Future`, as for :meth:`Poller.submit`.
+        :raises RuntimeError: The poller has been closed.
+        """
+        return self._poller._submit(_Poll(self.f, until, timeout, interval, (), {}, self._poller._clock, key, self))
+
+    def _take_due(self, now):
+        # the caller must hold the poller's lock. Returns the polls which
+        # are due, in groups of max_size. The remaining polls are only returned
+        # once the first of them has been held back for max_wait; until then
+        # they go back in the schedule, where a later wake-up will find them
+        groups = []
+        group = []
+        while self._schedule and self._schedule[0][0] <= now:
+            entry = heapq.heappop(self._schedule)
+            if entry[2].future.cancelled():
+                continue
+            group.append(entry)
+            if len(group) == self.max_size:
+                groups.append(group)
+                group = []
+        if group:
+            if group[0][0] + self.max_wait <= now:
+                groups.append(group)
+            else:
+                for entry in group:
+                    heapq.heappush(self._schedule, entry)
+        return [[job for _, _, job in group] for group in groups]
+
+
+class _Poll(object):
+    __slots__ = ("f", "until", "deadline", "delays", "args", "kwargs", "key", "batch", "attempts", "future")
+
+    def __init__(self, f, until, timeout, interval, args, kwargs, clock, key=None, batch=None):
+        self.f = f
+        self.until = until
+        self.deadline = timeout if isinstance(timeout, Deadline) else Deadline(timeout, clock)
+        self.delays = _delays(interval)
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.batch = batch
+        self.attempts = 0
+        self.future = concurrent.futures.Future()
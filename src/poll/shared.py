@@ -0,0 +1,292 @@
+"""
+Circuit breakers whose state is shared between processes.
+
+A :class:`SharedCircuitRegistry` is a table of named circuits kept in
+a memory-mapped file. Every process which opens the same file sees the
+same circuits, so when one worker in a pre-forking server discovers
+that a backend is down, the rest of the workers on that host back off too::
+
+    registry = SharedCircuitRegistry("/dev/shm/myapp-circuits")
+
+    @circuitbreaker(requests.HTTPError, threshold=3, reset_timeout=60, registry=registry)
+    def attempt(uri):
+        ...
+
+State is read and written in place in the mapped memory, never pickled.
+Checking a closed circuit reads a single integer without taking a lock;
+state transitions take a ``fcntl`` record lock on the circuit's slot,
+so this module is only available on Unix.
+
+Failure times are measured with :func:`time.monotonic`,
+which is system-wide on Linux and macOS.
+"""
+import fcntl
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from . import _FailureCounter
+
+
+_MAGIC = b"POLLCB02"
+# magic, number of slots, failure times per slot
+_HEADER = struct.Struct("<8sII")
+# name, broken time, broken flag, probes started, probes succeeded, next,
+# threshold, reset timeout; followed by the failure times
+_SLOT = struct.Struct("<64sdiiiiid")
+_BROKEN_TIME = 64
+_BROKEN = 72
+_PROBES_STARTED = 76
+_PROBES_SUCCEEDED = 80
+_NEXT = 84
+_THRESHOLD = 88
+_TIMEOUT = 92
+_INT = struct.Struct("<i")
+_DOUBLE = struct.Struct("<d")
+
+
+class SharedCircuitRegistry(object):
+    """
+    A table of named circuits in a memory-mapped file,
+    for use with the ``registry`` parameter of :func:`poll.circuitbreaker`.
+
+    The file is created if it doesn't exist. Every process using the file
+    must pass the same ``slots`` and ``max_threshold``, and every circuit
+    breaker using a circuit must pass the same ``threshold`` and ``reset_timeout``.
+
+    ``fcntl`` locks belong to the whole process, so registries opened on
+    the same file in one process share a single mapping and set of locks.
+
+    :param str path: The path of the file. A file in ``/dev/shm`` is never written to disk.
+    :param int slots: The maximum number of circuits in the table.
+    :param int max_threshold: The largest ``threshold`` of any circuit in the table.
+    """
+    def __init__(self, path, slots=64, max_threshold=16):
+        self._table = _open_table(path, slots, max_threshold)
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def close(self):
+        """
+        Stop using the file. It is unmapped once every registry
+        in this process which opened it has been closed.
+        Circuit breakers using this registry must not be called afterwards.
+        """
+        table, self._table = self._table, None
+        if table is not None:
+            _close_table(table)
+
+    def _failure_counter(self, name, threshold, timeout, half_open_calls):
+        table = self._table
+        if threshold > table.max_threshold:
+            raise ValueError("threshold {} is larger than the registry's max_threshold of {}".format(threshold, table.max_threshold))
+        threshold = max(threshold, 1)
+        with self._lock:
+            if name in self._counters:
+                counter = self._counters[name]
+                _check_settings(name, (counter._threshold, counter._timeout), (threshold, timeout))
+            else:
+                offset, lock = table.slot(name, threshold, timeout)
+                counter = self._counters[name] = _SharedFailureCounter(table.mmap, offset, lock, threshold, timeout, half_open_calls, name)
+            return counter
+
+
+def _check_settings(name, existing, requested):
+    if existing != requested:
+        raise ValueError("circuit {!r} has a threshold of {} and a reset_timeout of {}, not {} and {}".format(name, *(existing + requested)))
+
+
+# the tables open in this process, by process ID and file
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _open_table(path, slots, max_threshold):
+    with _tables_lock:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            table = None
+        else:
+            table = _tables.get((os.getpid(), st.st_dev, st.st_ino))
+        if table is None:
+            table = _Table(path, slots, max_threshold)
+            _tables[table.key] = table
+        elif (table.slots, table.max_threshold) != (slots, max_threshold):
+            raise ValueError("{} is open as a circuit table with {} slots of {} failures".format(path, table.slots, table.max_threshold))
+        table.users += 1
+        return table
+
+
+def _close_table(table):
+    with _tables_lock:
+        table.users -= 1
+        if table.users == 0:
+            del _tables[table.key]
+            table.close()
+
+
+class _Table(object):
+    # A circuit table's file, mapped into memory. Only one is
+    # opened per file in a process: closing any descriptor for the file
+    # would release every fcntl lock which the process holds on it.
+    def __init__(self, path, slots, max_threshold):
+        self.slots = slots
+        self.max_threshold = max_threshold
+        self.users = 0
+        self._slot_size = _SLOT.size + 8 * max_threshold
+        size = _HEADER.size + slots * self._slot_size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        st = os.fstat(self._fd)
+        self.key = (os.getpid(), st.st_dev, st.st_ino)
+        # the header lock doubles as the lock for allocating slots
+        self._header_lock = _SlotLock(threading.Lock(), self._fd, 0)
+        with self._header_lock:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, slots, max_threshold), 0)
+            magic, file_slots, file_max_threshold = _HEADER.unpack(os.pread(self._fd, _HEADER.size, 0))
+        if magic != _MAGIC or (file_slots, file_max_threshold) != (slots, max_threshold):
+            os.close(self._fd)
+            raise ValueError("{} is not a circuit table with {} slots of {} failures".format(path, slots, max_threshold))
+        self.mmap = mmap.mmap(self._fd, size)
+        self._slot_locks = {}
+
+    def close(self):
+        self.mmap.close()
+        os.close(self._fd)
+
+    def slot(self, name, threshold, timeout):
+        """
+        :return: The offset of the slot for the circuit called ``name``,
+            which is allocated with the given settings if necessary,
+            and the lock for the slot.
+        :raises ValueError: if the circuit exists with different settings.
+        """
+        encoded = name.encode("utf-8")
+        if len(encoded) > 64:
+            raise ValueError("circuit name {!r} is longer than 64 bytes".format(name))
+        encoded = encoded.ljust(64, b"\0")
+        with self._header_lock:
+            offset = self._find_slot(name, encoded, threshold, timeout)
+            if offset not in self._slot_locks:
+                self._slot_locks[offset] = _SlotLock(threading.Lock(), self._fd, offset)
+            return offset, self._slot_locks[offset]
+
+    def _find_slot(self, name, encoded, threshold, timeout):
+        for i in range(self.slots):
+            offset = _HEADER.size + i * self._slot_size
+            slot_name = self.mmap[offset:offset + 64]
+            if slot_name == encoded:
+                # the ring position is only valid for the threshold it was made with
+                existing = (_INT.unpack_from(self.mmap, offset + _THRESHOLD)[0], _DOUBLE.unpack_from(self.mmap, offset + _TIMEOUT)[0])
+                _check_settings(name, existing, (threshold, timeout))
+                return offset
+            if slot_name == bytes(64):
+                _SLOT.pack_into(self.mmap, offset, encoded, 0, 0, 0, 0, 0, threshold, timeout)
+                for j in range(self.max_threshold):
+                    _DOUBLE.pack_into(self.mmap, offset + _SLOT.size + 8 * j, -math.inf)
+                return offset
+        raise ValueError("no free slots for circuit {!r}".format(name))
+
+
+class _SlotLock(object):
+    # fcntl locks belong to the process, so they don't
+    # exclude other threads; the thread lock does that
+    def __init__(self, thread_lock, fd, offset):
+        self._thread_lock = thread_lock
+        self._fd = fd
+        self._offset = offset
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._offset)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset)
+        finally:
+            self._thread_lock.release()
+
+
+class _SharedFailureCounter(_FailureCounter):
+    """
+    A :class:`poll._FailureCounter` whose state lives in a slot of a
+    :class:`SharedCircuitRegistry` rather than in instance attributes.
+    """
+    def __init__(self, mm, offset, lock, threshold, timeout, half_open_calls, name):
+        self._mmap = mm
+        self._offset = offset
+        self._threshold = threshold
+        self._failure_times = _SharedDoubles(mm, offset + _SLOT.size)
+        self._timeout = timeout
+        self._half_open_calls = max(half_open_calls, 1)
+        self._lock = lock
+        self._name = name
+
+    def state(self):
+        # the broken time is two fields, which are only read together under the lock
+        if not self._broken:
+            return "ok"
+        with self._lock:
+            return _FailureCounter.state(self)
+
+    def time_remaining(self):
+        if not self._broken:
+            return 0
+        with self._lock:
+            return _FailureCounter.time_remaining(self)
+
+    def _now(self):
+        return time.monotonic()
+
+    @property
+    def _broken(self):
+        return _INT.unpack_from(self._mmap, self._offset + _BROKEN)[0]
+
+    @property
+    def _broken_time(self):
+        if not _INT.unpack_from(self._mmap, self._offset + _BROKEN)[0]:
+            return None
+        return _DOUBLE.unpack_from(self._mmap, self._offset + _BROKEN_TIME)[0]
+
+    @_broken_time.setter
+    def _broken_time(self, value):
+        if value is None:
+            _INT.pack_into(self._mmap, self._offset + _BROKEN, 0)
+        else:
+            _DOUBLE.pack_into(self._mmap, self._offset + _BROKEN_TIME, value)
+            _INT.pack_into(self._mmap, self._offset + _BROKEN, 1)
+
+    _next = property(
+        lambda self: _INT.unpack_from(self._mmap, self._offset + _NEXT)[0],
+        lambda self, value: _INT.pack_into(self._mmap, self._offset + _NEXT, value)
+    )
+    _probes_started = property(
+        lambda self: _INT.unpack_from(self._mmap, self._offset + _PROBES_STARTED)[0],
+        lambda self, value: _INT.pack_into(self._mmap, self._offset + _PROBES_STARTED, value)
+    )
+    _probes_succeeded = property(
+        lambda self: _INT.unpack_from(self._mmap, self._offset + _PROBES_SUCCEEDED)[0],
+        lambda self, value: _INT.pack_into(self._mmap, self._offset + _PROBES_SUCCEEDED, value)
+    )
+
+
+class _SharedDoubles(object):
+    def __init__(self, mm, offset):
+        self._mmap = mm
+        self._offset = offset
+
+    def __getitem__(self, i):
+        return _DOUBLE.unpack_from(self._mmap, self._offset + 8 * i)[0]
+
+    def __setitem__(self, i, value):
+        _DOUBLE.pack_into(self._mmap, self._offset + 8 * i, value)
@@ -0,0 +1,359 @@
+"""
+Circuit breakers whose state is kept in a store, such as a database,
+so that it can be shared between hosts.
+
+A :class:`StoredCircuitRegistry` keeps an ordinary in-memory circuit for
+each name, and synchronises it with a :class:`CircuitStore` in the
+background. Failures and state transitions are queued and written in
+batches, and the stored state is read back at the same time, so calling
+the circuit breaker never waits for the store. The price is that a
+circuit may take up to ``sync_interval`` seconds to notice what has
+happened on other hosts::
+
+    store = SQLiteCircuitStore("/var/lib/myapp/circuits.db")
+    registry = StoredCircuitRegistry(store, sync_interval=1)
+
+    @circuitbreaker(requests.HTTPError, threshold=3, reset_timeout=60, registry=registry)
+    def attempt(uri):
+        ...
+
+Failures on different hosts add up: if ``threshold`` is 3 and three hosts
+each see one failure, every host will break the circuit.
+
+To share circuits using another database or a network service,
+subclass :class:`CircuitStore`. Times are measured with :func:`time.time`,
+so the hosts' clocks should be synchronised.
+"""
+import abc
+import collections
+import logging
+import sqlite3
+import threading
+import time
+
+from . import _FailureCounter
+from .events import CIRCUIT_CLOSED, CIRCUIT_OPENED, _emit, _listeners
+
+
+_logger = logging.getLogger(__name__)
+
+
+class CircuitState(collections.namedtuple("CircuitState", "broken_time closed_time failure_times")):
+    """
+    The state of a circuit in a :class:`CircuitStore`.
+
+    :ivar float broken_time: When the circuit was most recently broken, or ``None``.
+    :ivar float closed_time: When the circuit was most recently closed
+        after being broken, or ``None``. The circuit is broken if
+        ``broken_time`` is later than ``closed_time``.
+    :ivar list failure_times: When calls failed.
+    """
+    __slots__ = ()
+
+
+class CircuitStore(abc.ABC):
+    """
+    The interface for places to keep the state of circuits.
+    Subclasses must implement both :meth:`read` and :meth:`write`.
+
+    Stores are only used by a :class:`StoredCircuitRegistry`'s
+    synchronisation, never while calling a circuit breaker,
+    so they may be slow, but they must be safe to use from many
+    processes or hosts at once.
+    """
+    @abc.abstractmethod
+    def read(self, names, since):
+        """
+        Get the state of some circuits.
+
+        :param list names: The names of the circuits.
+        :param float since: Failures before this time may be left out.
+        :return: A dictionary mapping the names of any circuits
+            which have been stored to their :class:`CircuitState`.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write(self, updates):
+        """
+        Record what has happened to some circuits.
+
+        Updates must be merged with the stored state, not overwrite it:
+        the failure times are added to the stored ones,
+        and the stored ``broken_time`` and ``closed_time`` are only replaced
+        by later times. This makes it safe for hosts to write in any order.
+
+        :param dict updates: A dictionary mapping names to :class:`CircuitState`.
+            ``broken_time`` or ``closed_time`` may be ``None`` if the circuit
+            hasn't been broken or closed since the last update.
+        """
+        raise NotImplementedError
+
+
+class SQLiteCircuitStore(CircuitStore):
+    """
+    A :class:`CircuitStore` in a SQLite database.
+
+    SQLite can only share a database between the processes on one host,
+    so this store is mainly useful for testing and as an example.
+
+    :param str path: The path of the database file. It will be created if it doesn't exist.
+    :param float retention: How long to keep failures for, in seconds.
+    """
+    def __init__(self, path, retention=3600):
+        self._retention = retention
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._transaction() as cursor:
+            cursor.execute("CREATE TABLE IF NOT EXISTS circuits (name TEXT PRIMARY KEY, broken_time REAL, closed_time REAL)")
+            cursor.execute("CREATE TABLE IF NOT EXISTS failures (name TEXT NOT NULL, time REAL NOT NULL)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS failures_by_name ON failures (name, time)")
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        self._connection.close()
+
+    def read(self, names, since):
+        placeholders = ", ".join("?" * len(names))
+        with self._transaction() as cursor:
+            circuits = cursor.execute(
+                "SELECT name, broken_time, closed_time FROM circuits WHERE name IN ({})".format(placeholders),
+                names
+            ).fetchall()
+            failures = cursor.execute(
+                "SELECT name, time FROM failures WHERE time >= ? AND name IN ({})".format(placeholders),
+                [since] + list(names)
+            ).fetchall()
+
+        states = {name: CircuitState(broken_time, closed_time, []) for name, broken_time, closed_time in circuits}
+        for name, failure_time in failures:
+            states.setdefault(name, CircuitState(None, None, [])).failure_times.append(failure_time)
+        return states
+
+    def write(self, updates):
+        with self._transaction() as cursor:
+            for name, state in updates.items():
+                cursor.execute(
+                    """INSERT INTO circuits (name, broken_time, closed_time) VALUES (?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        broken_time = max(coalesce(broken_time, excluded.broken_time), coalesce(excluded.broken_time, broken_time)),
+                        closed_time = max(coalesce(closed_time, excluded.closed_time), coalesce(excluded.closed_time, closed_time))""",
+                    (name, state.broken_time, state.closed_time)
+                )
+                cursor.executemany("INSERT INTO failures (name, time) VALUES (?, ?)", [(name, t) for t in state.failure_times])
+            cursor.execute("DELETE FROM failures WHERE time < ?", (time.time() - self._retention,))
+
+    def _transaction(self):
+        return _Transaction(self._connection, self._lock)
+
+
+class _Transaction(object):
+    def __init__(self, connection, lock):
+        self._connection = connection
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._cursor = self._connection.cursor()
+            self._cursor.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._cursor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._cursor.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        finally:
+            self._lock.release()
+
+
+class StoredCircuitRegistry(object):
+    """
+    Circuits which are synchronised with a :class:`CircuitStore`,
+    for use with the ``registry`` parameter of :func:`poll.circuitbreaker`.
+
+    Synchronisation happens on a background thread every ``sync_interval``
+    seconds. If the store can't be reached, the circuits carry on
+    using the state they know about, and the updates are kept to be
+    written next time. Each failed background synchronisation is logged
+    as a warning to the ``poll.store`` logger, and
+    :attr:`consecutive_failures` counts how many have failed in a row,
+    so that hosts which have stopped sharing state can be alerted on.
+
+    :param CircuitStore store: Where to keep the state of the circuits.
+    :param float sync_interval: How often to synchronise, in seconds.
+        If ``None``, circuits are only synchronised when you call :meth:`sync`.
+    """
+    def __init__(self, store, sync_interval=1):
+        self._store = store
+        self._sync_interval = sync_interval
+        self._counters = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._failures = 0
+
+    @property
+    def consecutive_failures(self):
+        """
+        The number of synchronisations in a row which have failed,
+        or 0 if the last one succeeded.
+        """
+        return self._failures
+
+    def sync(self):
+        """
+        Write the updates which are waiting to be written,
+        then read the state of every circuit from the store.
+        """
+        with self._sync_lock:
+            try:
+                self._sync()
+            except BaseException:
+                self._failures += 1
+                raise
+            self._failures = 0
+
+    def _sync(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            counters = dict(self._counters)
+        if pending:
+            try:
+                self._store.write({name: CircuitState(*update) for name, update in pending.items()})
+            except BaseException:
+                self._requeue(pending)
+                raise
+        if counters:
+            since = time.time() - max(c._timeout for c in counters.values())
+            for name, state in self._store.read(list(counters), since).items():
+                counters[name]._merge(state)
+
+    def close(self):
+        """
+        Stop the background thread and write any remaining updates.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+
+    def _failure_counter(self, name, threshold, timeout, half_open_calls):
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = _StoredFailureCounter(self, threshold, timeout, half_open_calls, name)
+                if self._thread is None and self._sync_interval is not None:
+                    self._thread = threading.Thread(target=self._run, name="poll-circuit-sync", daemon=True)
+                    self._thread.start()
+            return self._counters[name]
+
+    def _run(self):
+        while not self._stopped.wait(self._sync_interval):
+            try:
+                self.sync()
+            except Exception:
+                _logger.warning("Couldn't synchronise circuits with %r (%d failures in a row)", self._store, self._failures, exc_info=True)
+
+    def _update(self, name):
+        # [broken time, closed time, failure times]; the caller must hold self._lock
+        update = self._pending.get(name)
+        if update is None:
+            update = self._pending[name] = [None, None, []]
+        return update
+
+    def _add_failure(self, name, failure_time):
+        with self._lock:
+            self._update(name)[2].append(failure_time)
+
+    def _add_break(self, name, broken_time):
+        with self._lock:
+            self._update(name)[0] = broken_time
+
+    def _add_close(self, name, closed_time):
+        with self._lock:
+            self._update(name)[1] = closed_time
+
+    def _requeue(self, pending):
+        with self._lock:
+            for name, (broken_time, closed_time, failure_times) in pending.items():
+                update = self._update(name)
+                update[0] = _later(broken_time, update[0])
+                update[1] = _later(closed_time, update[1])
+                update[2][:0] = failure_times
+
+
+def _later(x, y):
+    if x is None:
+        return y
+    if y is None:
+        return x
+    return max(x, y)
+
+
+class _StoredFailureCounter(_FailureCounter):
+    """
+    A :class:`poll._FailureCounter` which tells its registry
+    about failures and transitions, and merges in what
+    other hosts have done when the registry synchronises.
+    """
+    def __init__(self, registry, threshold, timeout, half_open_calls, name):
+        super().__init__(threshold, timeout, half_open_calls, name)
+        self._registry = registry
+        self._closed_time = float("-inf")
+
+    def _now(self):
+        return time.time()
+
+    def _record_failure(self, current_time):
+        super()._record_failure(current_time)
+        self._registry._add_failure(self._name, current_time)
+
+    def _break(self, current_time):
+        super()._break(current_time)
+        self._registry._add_break(self._name, current_time)
+
+    def _close(self):
+        super()._close()
+        self._closed_time = self._now()
+        self._registry._add_close(self._name, self._closed_time)
+
+    def _merge(self, state):
+        opened = closed = False
+        with self._lock:
+            if state.closed_time is not None and state.closed_time > self._closed_time:
+                self._closed_time = state.closed_time
+            broken_time = self._broken_time
+            remote_broken = state.broken_time is not None and state.broken_time > self._closed_time
+
+            if broken_time is not None and not remote_broken and self._closed_time > broken_time:
+                _FailureCounter._close(self)
+                closed = True
+                broken_time = None
+
+            # failures from before the circuit was last closed don't count
+            failure_times = {t for t in state.failure_times if t > self._closed_time}
+            failure_times.update(t for t in self._failure_times if t > self._closed_time)
+            self._reset_failures()
+            for t in sorted(failure_times)[-self._threshold:]:
+                _FailureCounter._record_failure(self, t)
+
+            if remote_broken and (broken_time is None or state.broken_time > broken_time):
+                opened = broken_time is None
+                _FailureCounter._break(self, state.broken_time)
+            elif broken_time is None and len(failure_times) >= self._threshold:
+                # failures on several hosts have added up to the threshold
+                oldest = self._failure_times[self._next]
+                newest = self._failure_times[self._next - 1]
+                if oldest >= self._now() - self._timeout:
+                    self._break(newest)
+                    opened = True
+        if opened and _listeners:
+            _emit(CIRCUIT_OPENED, self._name)
+        if closed and _listeners:
+            _emit(CIRCUIT_CLOSED, self._name)
@@ -0,0 +1,338 @@
+import asyncio
+import os
+import select
+import time
+from poll import AttemptTimeoutError, CircuitBrokenError
+from poll.aio import poll, poll_, retry, retry_, circuitbreaker
+from poll.clock import VirtualClock
+from contexts import catch
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def is_three(x):
+    await asyncio.sleep(0)
+    return x == 3
+
+
+class WhenPollingACoroutineFunctionWithACoroutineCondition:
+    def given_a_call_counter(self):
+        self.x = 0
+        self.expected_args = (1, 2, 3)
+        self.expected_kwargs = {"foo": "bar"}
+
+    def when_i_execute_the_function_to_poll(self):
+        self.result = run(self.function_to_poll(*self.expected_args, **self.expected_kwargs))
+
+    def it_should_keep_trying(self):
+        assert self.x == 3
+
+    def it_should_forward_the_arguments(self):
+        assert self.args == self.expected_args
+
+    def it_should_forward_the_keyword_arguments(self):
+        assert self.kwargs == self.expected_kwargs
+
+    def it_should_return_the_final_answer(self):
+        assert self.result == 3
+
+    @poll(is_three, interval=0.001, clock=VirtualClock())
+    async def function_to_poll(self, *args, **kwargs):
+        self.args, self.kwargs = args, kwargs
+        self.x += 1
+        return self.x
+
+
+class WhenPollingAtUseSiteAndConditionIsNotTrueInTime:
+    def given_a_call_counter(self):
+        self.x = 0
+
+    def when_i_poll_the_function(self):
+        self.exception = catch(run, poll_(self.function_to_poll, lambda x: False, timeout=0.01, interval=0.004, clock=VirtualClock()))
+
+    def it_should_keep_trying(self):
+        assert self.x >= 2
+
+    def it_should_throw(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    async def function_to_poll(self):
+        self.x += 1
+        return self.x
+
+
+class WhenRetryingACoroutineFunctionWithACoroutineOnErrorCallback:
+    def given_a_call_counter(self):
+        self.x = 0
+        self.on_error_calls = []
+        self.exception = ValueError()
+
+    def when_i_execute_the_retryable_function(self):
+        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error, clock=VirtualClock())
+        async def function_to_retry():
+            self.x += 1
+            if self.x != 3:
+                raise self.exception
+            return self.x
+
+        self.result = run(function_to_retry())
+
+    def it_should_keep_trying_until_the_exception_goes_away(self):
+        assert self.x == 3
+
+    def it_should_return_the_final_answer(self):
+        assert self.result == 3
+
+    def it_should_await_on_error_every_time_it_failed(self):
+        assert self.on_error_calls == [(self.exception, 0), (self.exception, 1)]
+
+    async def on_error(self, ex, count):
+        await asyncio.sleep(0)
+        self.on_error_calls.append((ex, count))
+
+
+class WhenRetryingAtUseSiteAndItThrowsAnExceptionTooManyTimes:
+    def given_an_exception(self):
+        self.x = 0
+        self.expected_exception = ValueError()
+
+    def when_i_execute_the_retryable_function(self):
+        self.exception = catch(run, retry_(self.function_to_retry, ValueError, 3, 0.001, clock=VirtualClock()))
+
+    def it_should_call_it_the_specified_number_of_times(self):
+        assert self.x == 3
+
+    def it_should_bubble_the_exception_out(self):
+        assert self.exception is self.expected_exception
+
+    async def function_to_retry(self):
+        self.x += 1
+        raise self.expected_exception
+
+
+class WhenRetryingAnOrdinaryFunction:
+    def given_a_call_counter(self):
+        self.x = 0
+
+    def when_i_execute_the_retryable_function(self):
+        self.result = run(retry_(self.function_to_retry, ValueError, 3, 0.001, clock=VirtualClock()))
+
+    def it_should_return_the_final_answer(self):
+        assert self.result == 2
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x < 2:
+            raise ValueError
+        return self.x
+
+
+class WhenARetryingCoroutineIsCancelledWhileSleeping:
+    def given_a_call_counter(self):
+        self.x = 0
+        self.on_error_calls = []
+
+    def when_i_time_out_the_task(self):
+        async def main():
+            await asyncio.wait_for(retry_(self.function_to_retry, ValueError, 100, 10, self.on_error), 0.05)
+        self.started = time.perf_counter()
+        self.exception = catch(run, main())
+        self.elapsed = time.perf_counter() - self.started
+
+    def it_should_stop_straight_away(self):
+        assert self.elapsed < 5
+
+    def it_should_raise_TimeoutError(self):
+        assert isinstance(self.exception, asyncio.TimeoutError)
+
+    def it_should_only_call_the_function_once(self):
+        assert self.x == 1
+
+    def it_should_not_pass_the_cancellation_to_on_error(self):
+        assert len(self.on_error_calls) == 1
+
+    async def function_to_retry(self):
+        self.x += 1
+        raise ValueError
+
+    def on_error(self, ex):
+        self.on_error_calls.append(ex)
+
+
+class WhenRunningThousandsOfPollsConcurrently:
+    def given_many_counters(self):
+        self.counts = [0] * 2000
+
+    def when_i_poll_them_all(self):
+        async def main():
+            return await asyncio.gather(*[
+                poll_(self.function_to_poll, lambda x: x == 3, 5, 0.01, i)
+                for i in range(len(self.counts))
+            ])
+        self.started = time.perf_counter()
+        self.results = run(main())
+        self.elapsed = time.perf_counter() - self.started
+
+    def it_should_return_every_result(self):
+        assert self.results == [3] * len(self.counts)
+
+    def it_should_sleep_concurrently(self):
+        assert self.elapsed < 5
+
+    async def function_to_poll(self, i):
+        self.counts[i] += 1
+        return self.counts[i]
+
+
+class WhenACoroutineCircuitIsBroken:
+    def given_the_function_has_failed_three_times(self):
+        self.x = 0
+
+        @circuitbreaker(ValueError, threshold=3, reset_timeout=10)
+        async def function_to_break():
+            self.x += 1
+            raise ValueError
+        self.function_to_break = function_to_break
+
+        for _ in range(3):
+            catch(run, function_to_break())
+        self.x = 0
+
+    def when_i_call_the_circuit_breaker_function(self):
+        self.exception = catch(run, self.function_to_break())
+
+    def it_should_throw_CircuitBrokenError(self):
+        assert isinstance(self.exception, CircuitBrokenError)
+
+    def it_should_not_call_the_function(self):
+        assert self.x == 0
+
+
+class WhenCoroutineCallsAreSlow:
+    def given_a_circuit_breaker_which_detects_slow_calls(self):
+        clock = VirtualClock()
+
+        @circuitbreaker(ValueError, threshold=2, reset_timeout=10, slow_call_duration=1, clock=clock)
+        async def function_to_break():
+            await clock.async_sleep(2)
+            return "done"
+        self.function_to_break = function_to_break
+
+    def when_the_coroutine_takes_too_long_twice(self):
+        self.results = [run(self.function_to_break()) for _ in range(2)]
+        self.exception = catch(run, self.function_to_break())
+
+    def it_should_return_the_results_of_the_slow_calls(self):
+        assert self.results == ["done", "done"]
+
+    def it_should_break_the_circuit(self):
+        assert isinstance(self.exception, CircuitBrokenError)
+
+
+class WhenACoroutineAttemptHangs:
+    def given_a_coroutine_which_hangs_the_first_time(self):
+        self.x = 0
+        self.cancelled = False
+        self.on_error_calls = []
+
+    def when_i_retry_the_coroutine_with_an_attempt_timeout(self):
+        self.result = run(retry_(self.function_to_retry, ValueError, 3, 0.001, self.on_error_calls.append, attempt_timeout=0.01, clock=VirtualClock()))
+
+    def it_should_try_again(self):
+        assert self.result == 2
+
+    def it_should_cancel_the_hung_attempt(self):
+        assert self.cancelled
+
+    def it_should_report_the_abandoned_attempt_to_on_error(self):
+        assert len(self.on_error_calls) == 1
+        assert isinstance(self.on_error_calls[0], AttemptTimeoutError)
+
+    async def function_to_retry(self):
+        self.x += 1
+        if self.x == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return self.x
+
+
+class WhenACoroutinePollIsWokenByAnEvent:
+    def given_a_job_finishing_in_the_background(self):
+        self.done = False
+
+    def when_i_poll_the_job_with_a_long_interval(self):
+        async def main():
+            wake = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.05, self.finish, wake)
+            return await poll_(lambda: self.done, lambda x: x, 30, 10, wake=wake)
+        started = time.perf_counter()
+        self.result = run(main())
+        self.elapsed = time.perf_counter() - started
+
+    def it_should_return_the_result(self):
+        assert self.result is True
+
+    def it_should_check_again_as_soon_as_the_poll_is_woken(self):
+        assert self.elapsed < 5
+
+    def finish(self, wake):
+        self.done = True
+        wake.set()
+
+
+class WhenACoroutinePollIsWokenByAFileDescriptor:
+    def given_a_pipe(self):
+        self.status = "running"
+        self.read_end, self.write_end = os.pipe()
+
+    def when_i_poll_with_a_long_interval(self):
+        async def main():
+            asyncio.get_running_loop().call_later(0.05, self.finish)
+            return await poll_(lambda: self.status, lambda x: x == "done", 30, 10, wake=self.read_end)
+        started = time.perf_counter()
+        self.result = run(main())
+        self.elapsed = time.perf_counter() - started
+
+    def it_should_return_the_result(self):
+        assert self.result == "done"
+
+    def it_should_check_again_as_soon_as_the_poll_is_woken(self):
+        assert self.elapsed < 5
+
+    def it_should_drain_the_pipe(self):
+        assert not select.select([self.read_end], [], [], 0)[0]
+
+    def cleanup_the_pipe(self):
+        os.close(self.read_end)
+        os.close(self.write_end)
+
+    def finish(self):
+        self.status = "done"
+        os.write(self.write_end, b"x")
+
+
+class WhenACoroutinePollIsWokenByAFileDescriptorAtTheEndOfTheFile:
+    def given_a_pipe_whose_write_end_is_closed(self):
+        self.x = 0
+        self.read_end, write_end = os.pipe()
+        os.close(write_end)
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        self.exception = catch(run, poll_(self.check, lambda x: False, 0.3, 0.1, wake=self.read_end))
+
+    def it_should_throw_TimeoutError(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_sleep_for_the_interval_instead(self):
+        assert self.x <= 4
+
+    def cleanup_the_pipe(self):
+        os.close(self.read_end)
+
+    async def check(self):
+        self.x += 1
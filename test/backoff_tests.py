@@ -0,0 +1,157 @@
+import itertools
+from poll import retry, retry_, poll_
+from poll.backoff import Constant, Linear, Exponential, FullJitter, EqualJitter, DecorrelatedJitter
+from poll.clock import VirtualClock
+from contexts import catch
+
+
+def take(n, strategy):
+    return list(itertools.islice(strategy, n))
+
+
+class WhenUsingAConstantBackoff:
+    def when_i_iterate_over_the_strategy(self):
+        self.delays = take(4, Constant(2))
+
+    def it_should_always_give_the_same_delay(self):
+        assert self.delays == [2, 2, 2, 2]
+
+
+class WhenUsingALinearBackoff:
+    def when_i_iterate_over_the_strategy(self):
+        self.delays = take(5, Linear(1, 2, maximum=6))
+
+    def it_should_increase_the_delay_by_the_step_up_to_the_maximum(self):
+        assert self.delays == [1, 3, 5, 6, 6]
+
+
+class WhenUsingAnExponentialBackoff:
+    def when_i_iterate_over_the_strategy(self):
+        self.delays = take(6, Exponential(0.5, 2, maximum=5))
+
+    def it_should_multiply_the_delay_by_the_factor_up_to_the_maximum(self):
+        assert self.delays == [0.5, 1, 2, 4, 5, 5]
+
+
+class WhenUsingAFullJitterBackoff:
+    def when_i_iterate_over_the_strategy(self):
+        self.delays = take(50, FullJitter(1, 2, maximum=8, seed=42))
+        self.caps = take(50, Exponential(1, 2, maximum=8))
+
+    def it_should_never_exceed_the_exponential_delay(self):
+        assert all(0 <= d <= cap for d, cap in zip(self.delays, self.caps))
+
+    def it_should_be_deterministic_for_the_same_seed(self):
+        assert self.delays == take(50, FullJitter(1, 2, maximum=8, seed=42))
+
+
+class WhenUsingAnEqualJitterBackoff:
+    def when_i_iterate_over_the_strategy(self):
+        self.delays = take(50, EqualJitter(1, 2, maximum=8, seed=42))
+        self.caps = take(50, Exponential(1, 2, maximum=8))
+
+    def it_should_wait_for_at_least_half_of_the_exponential_delay(self):
+        assert all(cap / 2 <= d <= cap for d, cap in zip(self.delays, self.caps))
+
+    def it_should_be_deterministic_for_the_same_seed(self):
+        assert self.delays == take(50, EqualJitter(1, 2, maximum=8, seed=42))
+
+
+class WhenUsingADecorrelatedJitterBackoff:
+    def when_i_iterate_over_the_strategy(self):
+        self.delays = take(50, DecorrelatedJitter(1, maximum=10, seed=42))
+
+    def it_should_stay_between_the_base_and_the_maximum(self):
+        assert all(1 <= d <= 10 for d in self.delays)
+
+    def it_should_never_more_than_triple_the_previous_delay(self):
+        assert all(b <= a * 3 for a, b in zip([1] + self.delays, self.delays))
+
+    def it_should_be_deterministic_for_the_same_seed(self):
+        assert self.delays == take(50, DecorrelatedJitter(1, maximum=10, seed=42))
+
+
+class WhenRetryingWithABackoffStrategy:
+    def given_a_function_decorated_with_a_backoff_strategy(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+        @retry(ValueError, times=4, interval=Exponential(1, 2), clock=self.clock)
+        def function_to_retry():
+            self.x += 1
+            raise ValueError
+        self.function_to_retry = function_to_retry
+
+    def when_i_call_the_function_twice(self):
+        catch(self.function_to_retry)
+        catch(self.function_to_retry)
+
+    def it_should_sleep_for_successive_delays_starting_afresh_each_call(self):
+        assert self.clock.sleeps == [1, 2, 4, 1, 2, 4]
+
+
+class WhenPollingWithAFiniteListOfDelays:
+    def given_a_virtual_clock(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+    def when_i_poll_the_function(self):
+        self.result = poll_(self.function_to_poll, lambda x: x == 5, 15, [0.1, 0.2], clock=self.clock)
+
+    def it_should_keep_using_the_last_delay(self):
+        assert self.clock.sleeps == [0.1, 0.2, 0.2, 0.2]
+
+    def function_to_poll(self):
+        self.x += 1
+        return self.x
+
+
+class WhenPollingWithAGeneratorFunction:
+    def given_a_virtual_clock(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+    def when_i_poll_the_function(self):
+        self.result = poll_(self.function_to_poll, lambda x: x == 3, 15, self.delays, clock=self.clock)
+
+    def it_should_sleep_for_the_generated_delays(self):
+        assert self.clock.sleeps == [0.5, 1]
+
+    def delays(self):
+        yield 0.5
+        yield 1
+
+    def function_to_poll(self):
+        self.x += 1
+        return self.x
+
+
+class WhenRetryingWithAGeneratorObject:
+    def given_a_generator_of_delays(self):
+        self.delays = (d for d in [1, 2, 4])
+
+    def when_i_decorate_a_function(self):
+        self.exception = catch(retry, ValueError, times=4, interval=self.delays)
+
+    def it_should_throw_TypeError(self):
+        assert isinstance(self.exception, TypeError)
+
+
+class WhenRetryingWithAnEmptyBackoffStrategy:
+    def given_a_virtual_clock(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+    def when_i_call_a_function_which_fails(self):
+        self.exception = catch(retry_, self.fail, ValueError, 3, [], clock=self.clock)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
+        assert "no delays" in str(self.exception)
+
+    def it_should_not_sleep(self):
+        assert self.clock.sleeps == []
+
+    def fail(self):
+        self.x += 1
+        raise ValueError
@@ -0,0 +1,292 @@
+import asyncio
+import threading
+from poll import AdaptiveLimit, Bulkhead, BulkheadFullError, bulkhead
+from poll import aio
+from poll.clock import VirtualClock
+from contexts import catch
+
+
+class BlockedCalls:
+    def start_blocked_calls(self, f, n):
+        self.release = threading.Event()
+        self.threads = [threading.Thread(target=f) for _ in range(n)]
+        for t in self.threads:
+            t.start()
+
+    def finish_blocked_calls(self):
+        self.release.set()
+        for t in self.threads:
+            t.join()
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            threading.Event().wait(0.01)
+
+
+class WhenABulkheadIsFull(BlockedCalls):
+    def given_two_calls_in_progress(self):
+        @bulkhead(2)
+        def call():
+            self.release.wait(5)
+        self.call = call
+        self.start_blocked_calls(call, 2)
+        self.wait_for(lambda: call.bulkhead.in_flight == 2)
+
+    def when_i_make_another_call(self):
+        self.exception = catch(self.call)
+
+    def it_should_throw_BulkheadFullError(self):
+        assert isinstance(self.exception, BulkheadFullError)
+
+    def it_should_report_the_calls_in_progress(self):
+        assert self.call.bulkhead.in_flight == 2
+        assert self.call.bulkhead.queued == 0
+
+    def cleanup_the_threads(self):
+        self.finish_blocked_calls()
+
+
+class WhenACallWaitsInTheQueue(BlockedCalls):
+    def given_a_call_in_progress(self):
+        @bulkhead(1, max_queue=1)
+        def call():
+            self.release.wait(5)
+            return "done"
+        self.call = call
+        self.start_blocked_calls(call, 1)
+        self.wait_for(lambda: call.bulkhead.in_flight == 1)
+
+    def when_i_make_another_call_and_the_first_one_finishes(self):
+        result = []
+        waiting = threading.Thread(target=lambda: result.append(self.call()))
+        waiting.start()
+        self.wait_for(lambda: self.call.bulkhead.queued == 1)
+        self.queued = self.call.bulkhead.queued
+        self.finish_blocked_calls()
+        waiting.join()
+        self.result = result
+
+    def it_should_report_the_queued_call(self):
+        assert self.queued == 1
+
+    def it_should_make_the_queued_call(self):
+        assert self.result == ["done"]
+
+    def it_should_be_empty_afterwards(self):
+        assert self.call.bulkhead.in_flight == 0
+        assert self.call.bulkhead.queued == 0
+
+
+class WhenACallWaitsInTheQueueForTooLong(BlockedCalls):
+    def given_a_call_in_progress(self):
+        @bulkhead(1, max_queue=1, queue_timeout=0.01)
+        def call():
+            self.release.wait(5)
+        self.call = call
+        self.start_blocked_calls(call, 1)
+        self.wait_for(lambda: call.bulkhead.in_flight == 1)
+
+    def when_i_make_another_call(self):
+        self.exception = catch(self.call)
+
+    def it_should_throw_BulkheadFullError(self):
+        assert isinstance(self.exception, BulkheadFullError)
+
+    def it_should_leave_the_queue(self):
+        assert self.call.bulkhead.queued == 0
+
+    def cleanup_the_threads(self):
+        self.finish_blocked_calls()
+
+
+class WhenTheQueueIsFull(BlockedCalls):
+    def given_a_call_in_progress_and_one_queued(self):
+        @bulkhead(1, max_queue=1)
+        def call():
+            self.release.wait(5)
+        self.call = call
+        self.start_blocked_calls(call, 2)
+        self.wait_for(lambda: call.bulkhead.queued == 1)
+
+    def when_i_make_another_call(self):
+        self.exception = catch(self.call)
+
+    def it_should_throw_BulkheadFullError_without_waiting(self):
+        assert isinstance(self.exception, BulkheadFullError)
+
+    def cleanup_the_threads(self):
+        self.finish_blocked_calls()
+
+
+class WhenTheFunctionThrows:
+    def given_a_bulkhead(self):
+        @bulkhead(1)
+        def call():
+            raise ValueError
+        self.call = call
+
+    def when_i_call_the_function_twice(self):
+        self.exceptions = [catch(self.call), catch(self.call)]
+
+    def it_should_free_the_slot_for_the_next_call(self):
+        assert all(isinstance(e, ValueError) for e in self.exceptions)
+        assert self.call.bulkhead.in_flight == 0
+
+
+class WhenFunctionsShareABulkhead(BlockedCalls):
+    def given_a_call_in_progress_on_one_function(self):
+        shared = Bulkhead(1)
+
+        @bulkhead(shared)
+        def one():
+            self.release.wait(5)
+
+        @bulkhead(shared)
+        def two():
+            pass
+
+        self.two = two
+        self.start_blocked_calls(one, 1)
+        self.wait_for(lambda: shared.in_flight == 1)
+
+    def when_i_call_the_other_function(self):
+        self.exception = catch(self.two)
+
+    def it_should_throw_BulkheadFullError(self):
+        assert isinstance(self.exception, BulkheadFullError)
+
+    def cleanup_the_threads(self):
+        self.finish_blocked_calls()
+
+
+class WhenCoroutinesQueueInABulkhead:
+    def given_a_coroutine_bulkhead(self):
+        self.running = 0
+        self.most_running = 0
+
+        @aio.bulkhead(2, max_queue=10)
+        async def call():
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            return "done"
+        self.call = call
+
+    def when_i_make_many_calls_at_once(self):
+        async def main():
+            return await asyncio.gather(*[self.call() for _ in range(6)])
+        self.results = asyncio.run(main())
+
+    def it_should_make_every_call(self):
+        assert self.results == ["done"] * 6
+
+    def it_should_never_run_more_than_the_limit_at_once(self):
+        assert self.most_running == 2
+
+
+class WhenACoroutineWaitsInTheQueueForTooLong:
+    def given_a_coroutine_bulkhead_with_a_queue_timeout(self):
+        @aio.bulkhead(1, max_queue=1, queue_timeout=0.01)
+        async def call():
+            await asyncio.sleep(0.1)
+        self.call = call
+
+    def when_i_make_two_calls_at_once(self):
+        async def main():
+            return await asyncio.gather(self.call(), self.call(), return_exceptions=True)
+        self.results = asyncio.run(main())
+
+    def it_should_throw_BulkheadFullError_for_the_second(self):
+        assert self.results[0] is None
+        assert isinstance(self.results[1], BulkheadFullError)
+
+    def it_should_be_empty_afterwards(self):
+        assert self.call.bulkhead.in_flight == 0
+        assert self.call.bulkhead.queued == 0
+
+
+class AdaptiveCalls:
+    def make_function(self, limiter):
+        @bulkhead(limiter)
+        def call(latency, exception=None):
+            self.clock.advance(latency)
+            if exception is not None:
+                raise exception
+        return call
+
+
+class WhenCallsThroughAnAdaptiveLimitAreFast(AdaptiveCalls):
+    def given_an_adaptive_limit(self):
+        self.clock = VirtualClock()
+        self.limiter = AdaptiveLimit(initial=2, window=10, clock=self.clock)
+        self.call = self.make_function(self.limiter)
+
+    def when_i_make_three_windows_of_calls(self):
+        for _ in range(30):
+            self.call(0.1)
+
+    def it_should_grow_the_limit_only_as_far_as_the_calls_use_it(self):
+        assert self.limiter.limit == 3
+        assert self.limiter.max_calls == 3
+
+    def it_should_estimate_the_latency(self):
+        assert abs(self.limiter.baseline - 0.1) < 1e-9
+
+
+class WhenCallsThroughAnAdaptiveLimitSlowDown(AdaptiveCalls):
+    def given_an_adaptive_limit_which_has_seen_fast_calls(self):
+        self.clock = VirtualClock()
+        self.limiter = AdaptiveLimit(initial=10, window=10, backoff=0.5, clock=self.clock)
+        self.call = self.make_function(self.limiter)
+        for _ in range(10):
+            self.call(0.1)
+
+    def when_the_calls_start_to_queue(self):
+        for _ in range(20):
+            self.call(0.5)
+
+    def it_should_shrink_the_limit_each_window(self):
+        assert self.limiter.limit == 2.5
+        assert self.limiter.max_calls == 2
+
+
+class WhenCallsThroughAnAdaptiveLimitFail(AdaptiveCalls):
+    def given_an_adaptive_limit_for_timeouts(self):
+        self.clock = VirtualClock()
+        self.limiter = AdaptiveLimit(TimeoutError, initial=10, window=10, backoff=0.5, clock=self.clock)
+        self.call = self.make_function(self.limiter)
+
+    def when_a_window_contains_a_timeout_and_another_contains_a_different_error(self):
+        for _ in range(9):
+            self.call(0.1)
+        catch(self.call, 0.1, TimeoutError())
+        for _ in range(9):
+            self.call(0.1)
+        catch(self.call, 0.1, ValueError())
+
+    def it_should_only_shrink_the_limit_for_the_timeout(self):
+        assert self.limiter.limit == 5
+
+
+class WhenCoroutinesCallThroughAnAdaptiveLimit:
+    def given_an_adaptive_limit(self):
+        self.limiter = AdaptiveLimit(initial=2, window=5)
+
+        @aio.bulkhead(self.limiter)
+        async def call():
+            return "done"
+        self.call = call
+
+    def when_i_make_some_calls(self):
+        async def main():
+            return [await self.call() for _ in range(10)]
+        self.results = asyncio.run(main())
+
+    def it_should_make_the_calls(self):
+        assert self.results == ["done"] * 10
+
+    def it_should_adjust_the_limit(self):
+        assert self.limiter.limit == 3
@@ -1,6 +1,10 @@
 import contexts
-from unittest import mock
-from poll import circuitbreaker, CircuitBrokenError
+import contextlib
+import io
+import threading
+import time
+from poll import circuitbreaker, CircuitBrokenError, FailureRate
+from poll.clock import VirtualClock
 
 
 class WhenAFunctionWithCircuitBreakerDoesNotThrow:
@@ -105,9 +109,9 @@ class WhenACircuitBreakerIsOnTheThresholdOfBreaking:
 
 
 class WhenCircuitIsBroken:
+    clock = VirtualClock()
+
     def given_the_function_has_failed_three_times(self):
-        self.patch = mock.patch('time.perf_counter', return_value=0)
-        self.mock = self.patch.start()
         self.x = 0
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
@@ -115,7 +119,7 @@ class WhenCircuitIsBroken:
         self.x = 0
 
     def when_i_call_the_circuit_breaker_function(self):
-        self.mock.return_value = 0.5
+        self.clock.advance(0.5)
         self.exception = contexts.catch(self.function_to_break)
 
     def it_should_throw_CircuitBrokenError(self):
@@ -127,7 +131,7 @@ class WhenCircuitIsBroken:
     def it_should_not_call_the_function(self):
         assert self.x == 0
 
-    @circuitbreaker(ValueError, threshold=3, reset_timeout=1)
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=1, clock=clock)
     def function_to_break(self):
         self.x += 1
         raise ValueError
@@ -135,13 +139,13 @@ class WhenCircuitIsBroken:
 
 # 'leaky bucket' functionality
 class WhenTheCircuitBreakerWasAboutToTripAndWeWaitForTheTimeout:
+    clock = VirtualClock()
+
     def given_the_circuit_was_about_to_be_broken(self):
-        self.patch = mock.patch('time.perf_counter', return_value=0)
-        self.mock = self.patch.start()
         contexts.catch(self.function_to_break)
-        self.mock.return_value = 0.5
+        self.clock.advance(0.5)
         contexts.catch(self.function_to_break)
-        self.mock.return_value = 1.1
+        self.clock.advance(0.6)
 
     def when_we_run_the_function_again(self):
         self.exception1 = contexts.catch(self.function_to_break)
@@ -153,26 +157,47 @@ class WhenTheCircuitBreakerWasAboutToTripAndWeWaitForTheTimeout:
         assert isinstance(self.exception2, ValueError)
         assert isinstance(self.exception3, CircuitBrokenError)
 
-    def cleanup_the_mock(self):
-        self.patch.stop()
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=1, clock=clock)
+    def function_to_break(self):
+        raise ValueError
+
 
-    @circuitbreaker(ValueError, threshold=3, reset_timeout=1)
+class WhenFailuresTrickleInSlowerThanTheThreshold:
+    clock = VirtualClock()
+
+    def given_a_circuit_breaker(self):
+        self.stdout = io.StringIO()
+
+    def when_the_function_fails_many_times(self):
+        self.exceptions = []
+        with contextlib.redirect_stdout(self.stdout):
+            for _ in range(50):
+                self.exceptions.append(contexts.catch(self.function_to_break))
+                self.clock.advance(0.6)
+
+    def it_should_never_break_the_circuit(self):
+        assert all(isinstance(e, ValueError) for e in self.exceptions)
+
+    def it_should_not_write_anything_to_stdout(self):
+        assert self.stdout.getvalue() == ""
+
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=1, clock=clock)
     def function_to_break(self):
         raise ValueError
 
 
 class WhenTheCircuitIsHalfBrokenAndTheFunctionSucceeds:
+    clock = VirtualClock()
+
     def given_the_circuit_was_broken_in_the_past(self):
         self.x = 0
         self.expected_return_value = "some thing that was returned"
-        self.patch = mock.patch('time.perf_counter', return_value=0)
-        self.mock = self.patch.start()
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
 
     def when_we_wait_for_the_timeout_and_retry(self):
-        self.mock.return_value = 1.1
+        self.clock.advance(1.1)
         self.result = self.function_to_break()
 
     def it_should_call_the_function(self):
@@ -181,10 +206,7 @@ class WhenTheCircuitIsHalfBrokenAndTheFunctionSucceeds:
     def it_should_forward_the_return_value(self):
         assert self.result == self.expected_return_value
 
-    def cleanup_the_mock(self):
-        self.patch.stop()
-
-    @circuitbreaker(ValueError, threshold=3, reset_timeout=1)
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=1, clock=clock)
     def function_to_break(self):
         self.x += 1
         if self.x < 3:
@@ -193,17 +215,17 @@ class WhenTheCircuitIsHalfBrokenAndTheFunctionSucceeds:
 
 
 class WhenTheCircuitIsHalfBrokenAndTheFunctionFails:
+    clock = VirtualClock()
+
     def given_the_circuit_was_broken_in_the_past(self):
         self.x = 0
         self.expected_exception = ValueError()
-        self.patch = mock.patch('time.perf_counter', return_value=0)
-        self.mock = self.patch.start()
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
 
     def when_we_wait_for_the_timeout_and_retry(self):
-        self.mock.return_value = 1.1
+        self.clock.advance(1.1)
         self.exception = contexts.catch(self.function_to_break)
 
     def it_should_call_the_function(self):
@@ -212,24 +234,21 @@ class WhenTheCircuitIsHalfBrokenAndTheFunctionFails:
     def it_should_bubble_out_the_exception(self):
         assert self.exception is self.expected_exception
 
-    def cleanup_the_mock(self):
-        self.patch.stop()
-
-    @circuitbreaker(ValueError, threshold=3, reset_timeout=1)
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=1, clock=clock)
     def function_to_break(self):
         self.x += 1
         raise self.expected_exception
 
 
 class WhenRetryingAfterTheFunctionFailedInTheHalfBrokenState:
+    clock = VirtualClock()
+
     def given_the_circuit_was_half_broken_and_the_function_failed_again(self):
         self.x = 0
-        self.patch = mock.patch('time.perf_counter', return_value=0)
-        self.mock = self.patch.start()
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
         contexts.catch(self.function_to_break)
-        self.mock.return_value = 1.1
+        self.clock.advance(1.1)
         contexts.catch(self.function_to_break)
 
     def when_we_wait_for_the_timeout_and_retry(self):
@@ -241,10 +260,241 @@ class WhenRetryingAfterTheFunctionFailedInTheHalfBrokenState:
     def it_should_throw_CircuitBrokenError(self):
         assert isinstance(self.exception, CircuitBrokenError)
 
-    def cleanup_the_mock(self):
-        self.patch.stop()
-
-    @circuitbreaker(ValueError, threshold=3, reset_timeout=1)
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=1, clock=clock)
     def function_to_break(self):
         self.x += 1
         raise ValueError
+
+
+class WhenManyThreadsCallAHalfBrokenCircuitAtOnce:
+    def given_a_circuit_which_is_ready_to_be_retried(self):
+        self.clock = VirtualClock()
+        self.thread_count = 50
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.entered = 0
+        self.rejected = 0
+
+        @circuitbreaker(ValueError, threshold=3, reset_timeout=1, half_open_calls=3, clock=self.clock)
+        def function_to_break(fail):
+            if fail:
+                raise ValueError
+            with self.lock:
+                self.entered += 1
+            self.release.wait(5)
+        self.function_to_break = function_to_break
+
+        for _ in range(3):
+            contexts.catch(self.function_to_break, True)
+        self.clock.advance(1.1)
+
+    def when_all_the_threads_call_the_function(self):
+        barrier = threading.Barrier(self.thread_count)
+
+        def call():
+            barrier.wait()
+            exception = contexts.catch(self.function_to_break, False)
+            if isinstance(exception, CircuitBrokenError):
+                with self.lock:
+                    self.rejected += 1
+
+        threads = [threading.Thread(target=call) for _ in range(self.thread_count)]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + 5
+        while self.entered + self.rejected < self.thread_count and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for t in threads:
+            t.join()
+        self.trial_calls = self.entered
+        self.exception_after_trial = contexts.catch(self.function_to_break, False)
+
+    def it_should_let_exactly_the_trial_calls_through(self):
+        assert self.trial_calls == 3
+
+    def it_should_reject_everyone_else(self):
+        assert self.rejected == self.thread_count - 3
+
+    def it_should_close_the_circuit_once_the_trial_calls_succeed(self):
+        assert self.exception_after_trial is None
+
+
+class WhenManyThreadsHammerACircuitBreaker:
+    def given_a_flaky_function(self):
+        self.thread_count = 32
+        self.calls_per_thread = 500
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.outcomes = {"ok": 0, "failed": 0, "broken": 0, "other": []}
+
+        @circuitbreaker(ValueError, threshold=5, reset_timeout=0.001, half_open_calls=2)
+        def function_to_break(i):
+            with self.lock:
+                self.calls += 1
+            if i % 3 == 0:
+                raise ValueError
+        self.function_to_break = function_to_break
+
+    def when_all_the_threads_call_the_function(self):
+        def call():
+            for i in range(self.calls_per_thread):
+                try:
+                    self.function_to_break(i)
+                except ValueError:
+                    outcome = "failed"
+                except CircuitBrokenError:
+                    outcome = "broken"
+                except Exception as e:
+                    with self.lock:
+                        self.outcomes["other"].append(e)
+                    continue
+                else:
+                    outcome = "ok"
+                with self.lock:
+                    self.outcomes[outcome] += 1
+
+        threads = [threading.Thread(target=call) for _ in range(self.thread_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def it_should_not_raise_any_unexpected_exceptions(self):
+        assert self.outcomes["other"] == []
+
+    def it_should_account_for_every_call(self):
+        total = self.outcomes["ok"] + self.outcomes["failed"] + self.outcomes["broken"]
+        assert total == self.thread_count * self.calls_per_thread
+
+    def it_should_only_call_the_function_for_admitted_calls(self):
+        assert self.calls == self.outcomes["ok"] + self.outcomes["failed"]
+
+
+class FailureRateCircuit:
+    def make_circuit(self, failure_rate, clock=None):
+        @circuitbreaker(ValueError, failure_rate, reset_timeout=10, clock=clock)
+        def function_to_break(fail):
+            if fail:
+                raise ValueError
+        return function_to_break
+
+    def call(self, *outcomes):
+        return [contexts.catch(self.function_to_break, fail) for fail in outcomes]
+
+
+class WhenTheFailureRateIsBelowTheThreshold(FailureRateCircuit):
+    def given_a_circuit_which_breaks_at_half_of_ten_calls(self):
+        self.function_to_break = self.make_circuit(FailureRate(0.5, minimum_calls=10))
+
+    def when_four_of_ten_calls_fail(self):
+        self.exceptions = self.call(*[True] * 4 + [False] * 6)
+        self.exception = contexts.catch(self.function_to_break, False)
+
+    def it_should_not_break_the_circuit(self):
+        assert self.exception is None
+
+
+class WhenTheFailureRateReachesTheThreshold(FailureRateCircuit):
+    def given_a_circuit_which_breaks_at_half_of_ten_calls(self):
+        self.function_to_break = self.make_circuit(FailureRate(0.5, minimum_calls=10))
+        self.call(*[True] * 4 + [False] * 6)
+
+    def when_two_more_calls_fail(self):
+        self.exceptions = self.call(True, True, False)
+
+    def it_should_break_the_circuit(self):
+        assert isinstance(self.exceptions[0], ValueError)
+        assert isinstance(self.exceptions[1], ValueError)
+        assert isinstance(self.exceptions[2], CircuitBrokenError)
+
+
+class WhenThereAreTooFewCallsToJudgeTheFailureRate(FailureRateCircuit):
+    def given_a_circuit_which_needs_ten_calls(self):
+        self.function_to_break = self.make_circuit(FailureRate(0.5, minimum_calls=10))
+
+    def when_every_call_fails(self):
+        self.exceptions = self.call(*[True] * 9)
+
+    def it_should_not_break_the_circuit(self):
+        assert all(isinstance(e, ValueError) for e in self.exceptions)
+
+
+class WhenFailuresFallOutOfATimeWindow(FailureRateCircuit):
+    def given_a_circuit_which_had_many_failures_a_minute_ago(self):
+        self.clock = VirtualClock()
+        self.function_to_break = self.make_circuit(FailureRate(0.5, minimum_calls=10, seconds=60), self.clock)
+        self.call(*[True] * 4 + [False] * 6)
+
+    def when_the_window_moves_on_and_more_calls_fail(self):
+        self.clock.advance(61)
+        self.exceptions = self.call(*[False] * 8 + [True] * 3)
+
+    def it_should_only_count_the_recent_calls(self):
+        assert all(e is None or isinstance(e, ValueError) for e in self.exceptions)
+
+
+class WhenFailuresFallOutOfACountWindow(FailureRateCircuit):
+    def given_a_circuit_which_counts_the_last_ten_calls(self):
+        self.function_to_break = self.make_circuit(FailureRate(0.5, minimum_calls=10, calls=10))
+        self.call(*[True] * 4 + [False] * 10)
+
+    def when_more_calls_fail(self):
+        self.exceptions = self.call(True, True, True, True, True, False)
+
+    def it_should_break_the_circuit_once_half_of_the_last_ten_calls_failed(self):
+        assert all(isinstance(e, ValueError) for e in self.exceptions[:5])
+        assert isinstance(self.exceptions[5], CircuitBrokenError)
+
+
+class WhenKeepingAFailureRateCircuitInARegistry:
+    def when_i_make_the_circuit_breaker(self):
+        self.exception = contexts.catch(circuitbreaker(ValueError, FailureRate(0.5), 10, registry=object()), lambda: None)
+
+    def it_should_throw_a_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+
+class WhenCallsAreSlow:
+    def given_a_circuit_breaker_which_detects_slow_calls(self):
+        self.clock = VirtualClock()
+
+        @circuitbreaker(ValueError, threshold=2, reset_timeout=10, slow_call_duration=1, clock=self.clock)
+        def function_to_break(duration):
+            self.clock.advance(duration)
+            return "done"
+        self.function_to_break = function_to_break
+
+    def when_the_function_takes_too_long_repeatedly(self):
+        self.results = [contexts.catch(self.function_to_break, 0.5)]
+        self.results += [self.function_to_break(2) for _ in range(2)]
+        self.exception = contexts.catch(self.function_to_break, 0.5)
+
+    def it_should_return_the_results_of_the_slow_calls(self):
+        assert self.results == [None, "done", "done"]
+
+    def it_should_count_the_slow_calls_as_failures(self):
+        assert isinstance(self.exception, CircuitBrokenError)
+
+
+class WhenTooManyCallsAreSlow:
+    def given_a_circuit_breaker_with_a_slow_call_rate(self):
+        self.clock = VirtualClock()
+
+        failure_rate = FailureRate(0.5, minimum_calls=4, calls=4, slow_rate=0.75)
+
+        @circuitbreaker(ValueError, failure_rate, reset_timeout=10, slow_call_duration=1, clock=self.clock)
+        def function_to_break(duration):
+            self.clock.advance(duration)
+        self.function_to_break = function_to_break
+
+    def when_three_of_four_calls_are_slow(self):
+        self.before = [contexts.catch(self.function_to_break, d) for d in [2, 0, 2]]
+        self.after = [contexts.catch(self.function_to_break, d) for d in [2, 0]]
+
+    def it_should_not_break_the_circuit_below_the_slow_call_rate(self):
+        assert self.before == [None, None, None]
+
+    def it_should_break_the_circuit_at_the_slow_call_rate(self):
+        assert self.after[0] is None
+        assert isinstance(self.after[1], CircuitBrokenError)
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from poll import circuitbreaker, poll_, ratelimit, retry, CircuitBrokenError
+from poll import aio
+from poll.clock import VirtualClock
+from poll.policy import Policy
+from contexts import catch
+
+
+class WhenRetryingWithAVirtualClock:
+    def given_a_function_which_fails_twice(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+        @retry(ValueError, times=3, interval=5, clock=self.clock)
+        def fail_twice():
+            self.x += 1
+            if self.x < 3:
+                raise ValueError
+            return self.x
+        self.function = fail_twice
+
+    def when_i_call_the_function(self):
+        self.result = self.function()
+
+    def it_should_return_the_result(self):
+        assert self.result == 3
+
+    def it_should_sleep_on_the_clock(self):
+        assert self.clock.sleeps == [5, 5]
+
+    def it_should_move_the_clock_forward(self):
+        assert self.clock.now() == 10
+
+
+class WhenPollingWithAVirtualClockUntilTheTimeout:
+    def given_a_virtual_clock(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        self.exception = catch(poll_, self.check, lambda x: False, 60, 10, clock=self.clock)
+
+    def it_should_throw_TimeoutError(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_keep_checking_until_the_timeout(self):
+        assert self.x == 6
+
+    def it_should_not_sleep_past_the_timeout(self):
+        assert self.clock.now() == 50
+
+    def check(self):
+        self.x += 1
+
+
+class WhenACircuitOnAVirtualClockResets:
+    def given_a_broken_circuit(self):
+        self.clock = VirtualClock()
+        self.fail = True
+
+        @circuitbreaker(ValueError, threshold=2, reset_timeout=60, clock=self.clock)
+        def function_to_break():
+            if self.fail:
+                raise ValueError
+            return "done"
+        self.function_to_break = function_to_break
+        catch(function_to_break)
+        catch(function_to_break)
+        self.fail = False
+        self.exception_while_broken = catch(function_to_break)
+
+    def when_the_reset_timeout_passes(self):
+        self.clock.advance(60)
+        self.result = self.function_to_break()
+
+    def it_should_have_broken_the_circuit(self):
+        assert isinstance(self.exception_while_broken, CircuitBrokenError)
+
+    def it_should_let_the_call_through(self):
+        assert self.result == "done"
+
+    def it_should_not_count_advancing_the_clock_as_a_sleep(self):
+        assert self.clock.sleeps == []
+
+
+class WhenRateLimitingWithAVirtualClock:
+    def given_a_rate_limited_function(self):
+        self.clock = VirtualClock()
+        self.function = ratelimit(2, clock=self.clock)(lambda: self.clock.now())
+
+    def when_i_call_the_function_three_times(self):
+        self.times = [self.function() for _ in range(3)]
+
+    def it_should_space_the_calls_out_on_the_clock(self):
+        assert self.times == [0, 0.5, 1]
+
+
+class WhenAPolicyUsesAVirtualClock:
+    def given_a_policy_which_polls(self):
+        self.x = 0
+        self.clock = VirtualClock()
+        self.policy = Policy(clock=self.clock).poll(lambda x: x == 3, timeout=60, interval=20)
+
+    def when_i_call_the_function(self):
+        self.result = self.policy(self.count)()
+
+    def it_should_sleep_on_the_clock(self):
+        assert self.clock.sleeps == [20, 20]
+
+    def it_should_return_the_result(self):
+        assert self.result == 3
+
+    def count(self):
+        self.x += 1
+        return self.x
+
+
+class WhenRetryingACoroutineWithAVirtualClock:
+    def given_a_coroutine_function_which_fails_twice(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+        @aio.retry(ValueError, times=3, interval=5, clock=self.clock)
+        async def fail_twice():
+            self.x += 1
+            if self.x < 3:
+                raise ValueError
+            return self.x
+        self.function = fail_twice
+
+    def when_i_run_the_coroutine(self):
+        self.result = asyncio.run(self.function())
+
+    def it_should_return_the_result(self):
+        assert self.result == 3
+
+    def it_should_sleep_on_the_clock(self):
+        assert self.clock.sleeps == [5, 5]
+
+
+class WhenManyThreadsSleepOnAVirtualClock:
+    def given_a_virtual_clock(self):
+        self.clock = VirtualClock()
+
+    def when_ten_threads_sleep_a_hundred_times_each(self):
+        def sleep():
+            for _ in range(100):
+                self.clock.sleep(1)
+        threads = [threading.Thread(target=sleep) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def it_should_add_up_every_sleep(self):
+        assert self.clock.now() == 1000
+
+    def it_should_record_every_sleep(self):
+        assert len(self.clock.sleeps) == 1000
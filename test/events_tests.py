@@ -0,0 +1,201 @@
+import asyncio
+from unittest import mock
+from poll import circuitbreaker, retry_, poll_
+from poll import aio
+from poll.clock import VirtualClock
+from poll.events import (
+    ATTEMPT_FINISHED, ATTEMPT_STARTED, CIRCUIT_CLOSED, CIRCUIT_HALF_OPENED, CIRCUIT_OPENED, GAVE_UP, RETRY_SCHEDULED,
+    LatencyHistogram, Metrics, add_listener, remove_listener
+)
+from contexts import catch
+
+
+class WhenRetryingWithAListener:
+    def given_a_listener(self):
+        self.x = 0
+        self.events = []
+        add_listener(self.events.append)
+
+    def when_i_retry_a_function_which_fails_once(self):
+        retry_(self.flaky, ValueError, 3, 2, clock=VirtualClock())
+
+    def it_should_report_each_attempt_and_the_retry(self):
+        assert [(e.kind, e.attempt) for e in self.events] == [
+            (ATTEMPT_STARTED, 0),
+            (ATTEMPT_FINISHED, 0),
+            (RETRY_SCHEDULED, 1),
+            (ATTEMPT_STARTED, 1),
+            (ATTEMPT_FINISHED, 1),
+        ]
+
+    def it_should_name_the_function(self):
+        assert all(e.name == "flaky" for e in self.events)
+
+    def it_should_report_the_exception(self):
+        assert isinstance(self.events[1].exception, ValueError)
+        assert self.events[4].exception is None
+
+    def it_should_report_the_delay(self):
+        assert self.events[2].delay == 2
+
+    def it_should_time_the_attempts(self):
+        assert all(e.duration >= 0 for e in self.events if e.kind == ATTEMPT_FINISHED)
+
+    def cleanup_the_listener(self):
+        remove_listener(self.events.append)
+
+    def flaky(self):
+        self.x += 1
+        if self.x == 1:
+            raise ValueError
+
+
+class WhenRetryingGivesUp:
+    def given_a_listener(self):
+        self.events = []
+        add_listener(self.events.append)
+
+    def when_i_retry_a_function_which_always_fails(self):
+        self.exception = catch(retry_, self.broken, ValueError, 2, 1, clock=VirtualClock())
+
+    def it_should_report_giving_up_once_the_attempts_run_out(self):
+        assert self.events[-1].kind == GAVE_UP
+        assert self.events[-1].attempt == 2
+        assert self.events[-1].exception is self.exception
+
+    def cleanup_the_listener(self):
+        remove_listener(self.events.append)
+
+    def broken(self):
+        raise ValueError
+
+
+class WhenPollingTimesOutWithAListener:
+    def given_a_listener(self):
+        self.events = []
+        add_listener(self.events.append)
+
+    def when_i_poll_a_function_which_never_succeeds(self):
+        self.exception = catch(poll_, lambda: False, lambda x: x, 0.5, 1, clock=VirtualClock())
+
+    def it_should_report_giving_up_with_the_timeout_error(self):
+        assert self.events[-1].kind == GAVE_UP
+        assert self.events[-1].exception is self.exception
+        assert isinstance(self.exception, TimeoutError)
+
+    def cleanup_the_listener(self):
+        remove_listener(self.events.append)
+
+
+class WhenACircuitOpensAndCloses:
+    def given_a_listener_and_a_circuit_breaker(self):
+        self.events = []
+        add_listener(self.events.append)
+        self.clock = VirtualClock()
+        self.fail = True
+
+        @circuitbreaker(ValueError, threshold=2, reset_timeout=10, clock=self.clock)
+        def call():
+            if self.fail:
+                raise ValueError
+        self.call = call
+
+    def when_the_circuit_breaks_and_recovers(self):
+        catch(self.call)
+        catch(self.call)
+        self.clock.advance(11)
+        self.fail = False
+        self.call()
+
+    def it_should_report_each_transition(self):
+        assert [e.kind for e in self.events] == [CIRCUIT_OPENED, CIRCUIT_HALF_OPENED, CIRCUIT_CLOSED]
+
+    def it_should_use_the_function_name_for_the_circuit(self):
+        assert all(e.name == "call" for e in self.events)
+
+    def cleanup_the_listener(self):
+        remove_listener(self.events.append)
+
+
+class WhenRetryingACoroutineWithAListener:
+    def given_a_listener(self):
+        self.x = 0
+        self.events = []
+        add_listener(self.events.append)
+
+    def when_i_retry_a_coroutine_which_fails_once(self):
+        asyncio.run(aio.retry_(self.flaky, ValueError, 3, 0))
+
+    def it_should_report_each_attempt_and_the_retry(self):
+        assert [e.kind for e in self.events] == [
+            ATTEMPT_STARTED, ATTEMPT_FINISHED, RETRY_SCHEDULED, ATTEMPT_STARTED, ATTEMPT_FINISHED
+        ]
+
+    def cleanup_the_listener(self):
+        remove_listener(self.events.append)
+
+    async def flaky(self):
+        self.x += 1
+        if self.x == 1:
+            raise ValueError
+
+
+class WhenThereAreNoListeners:
+    def given_a_clock_which_records_its_reads(self):
+        self.clock = VirtualClock()
+        self.clock.now = mock.Mock(wraps=self.clock.now)
+
+    def when_i_retry_a_function_which_succeeds(self):
+        retry_(lambda: None, ValueError, clock=self.clock)
+
+    def it_should_not_read_the_clock(self):
+        assert not self.clock.now.called
+
+
+class WhenCollectingMetrics:
+    def given_a_metrics_listener(self):
+        self.x = 0
+        self.metrics = Metrics()
+        add_listener(self.metrics)
+
+    def when_i_retry_a_function_which_fails_twice(self):
+        retry_(self.flaky, ValueError, 3, 0.5, clock=VirtualClock())
+        self.result = self.metrics.to_dict()["flaky"]
+
+    def it_should_count_the_events(self):
+        assert self.result[ATTEMPT_STARTED] == 3
+        assert self.result[RETRY_SCHEDULED] == 2
+        assert GAVE_UP not in self.result
+
+    def it_should_add_up_the_time_spent_sleeping(self):
+        assert self.result["sleep_seconds"] == 1
+
+    def it_should_summarise_the_latencies(self):
+        assert self.result["latency"]["count"] == 3
+
+    def cleanup_the_listener(self):
+        remove_listener(self.metrics)
+
+    def flaky(self):
+        self.x += 1
+        if self.x < 3:
+            raise ValueError
+
+
+class WhenComputingPercentilesOfLatencies:
+    def given_a_histogram(self):
+        self.histogram = LatencyHistogram()
+
+    def when_i_record_a_wide_range_of_latencies(self):
+        for ms in range(1, 1001):
+            self.histogram.record(ms / 1000)
+
+    def it_should_compute_the_percentiles_to_within_one_percent(self):
+        for p in [50, 90, 99]:
+            assert abs(self.histogram.percentile(p) - p / 100) <= p / 100 * 0.01
+
+    def it_should_export_a_summary(self):
+        summary = self.histogram.to_dict()
+        assert summary["count"] == 1000
+        assert summary["min"] == 0.001
+        assert summary["max"] == 1
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from poll import Hedge, retry, retry_
+from poll import aio
+from poll.clock import VirtualClock
+from contexts import catch
+
+
+class WhenTheFirstAttemptIsSlow:
+    def given_a_function_which_hangs_the_first_time(self):
+        self.x = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.hedge = Hedge(0.01, max_ratio=1)
+
+    def when_i_make_a_hedged_call(self):
+        self.result = retry_(self.function_to_hedge, ValueError, 3, 0.001, hedge=self.hedge)
+        self.release.set()
+
+    def it_should_return_the_result_of_the_hedged_attempt(self):
+        assert self.result == "fast"
+
+    def it_should_count_the_hedge_as_a_win(self):
+        assert self.hedge.stats()["hedges"] == 1
+        assert self.hedge.stats()["hedge_wins"] == 1
+
+    def function_to_hedge(self):
+        with self.lock:
+            self.x += 1
+            x = self.x
+        if x == 1:
+            self.release.wait(5)
+            return "slow"
+        return "fast"
+
+
+class WhenTheFirstAttemptIsFast:
+    def given_a_hedge(self):
+        self.x = 0
+        self.hedge = Hedge(1, max_ratio=1)
+
+    def when_i_make_some_hedged_calls(self):
+        self.results = [self.function_to_hedge() for _ in range(5)]
+
+    def it_should_return_the_results(self):
+        assert self.results == [1, 2, 3, 4, 5]
+
+    def it_should_not_start_any_more_attempts(self):
+        assert self.hedge.stats() == {"calls": 5, "hedges": 0, "hedge_wins": 0, "delay": 1}
+
+    def function_to_hedge(self):
+        @retry(ValueError, hedge=self.hedge)
+        def f():
+            self.x += 1
+            return self.x
+        return f()
+
+
+class WhenTheExtraLoadIsCapped:
+    def given_a_hedge_which_allows_no_extra_load(self):
+        self.x = 0
+        self.hedge = Hedge(0.001, max_ratio=0)
+
+    def when_i_make_a_slow_hedged_call(self):
+        self.result = retry_(self.function_to_hedge, ValueError, hedge=self.hedge)
+
+    def it_should_wait_for_the_first_attempt(self):
+        assert self.result == 1
+
+    def it_should_not_start_another_attempt(self):
+        assert self.hedge.stats()["hedges"] == 0
+
+    def function_to_hedge(self):
+        self.x += 1
+        time.sleep(0.02)
+        return self.x
+
+
+class WhenEveryAttemptFails:
+    def given_a_failing_function(self):
+        self.x = 0
+        self.lock = threading.Lock()
+        self.hedge = Hedge(0.001, max_ratio=1)
+
+    def when_i_make_a_hedged_call(self):
+        self.exception = catch(retry_, self.function_to_hedge, ValueError, 2, 0.001, hedge=self.hedge)
+
+    def it_should_raise_the_exception(self):
+        assert isinstance(self.exception, ValueError)
+
+    def function_to_hedge(self):
+        with self.lock:
+            self.x += 1
+        time.sleep(0.01)
+        raise ValueError
+
+
+class WhenAdaptingTheHedgeDelayToRecentLatencies:
+    def given_a_hedge_with_a_long_initial_delay(self):
+        self.hedge = Hedge(10, percentile=95)
+
+    def when_i_make_many_fast_calls(self):
+        for _ in range(30):
+            retry_(lambda: None, ValueError, hedge=self.hedge)
+
+    def it_should_shorten_the_delay(self):
+        assert self.hedge.stats()["delay"] < 1
+
+
+class WhenManyHedgedCallsAreMadeAtOnce:
+    def given_a_hedge(self):
+        self.hedge = Hedge(1)
+
+    def when_forty_threads_make_a_hedged_call_together(self):
+        threads = [threading.Thread(target=retry_, args=(time.sleep, ValueError, 1, 0, None, 0.1), kwargs={"hedge": self.hedge}) for _ in range(40)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.elapsed = time.perf_counter() - start
+
+    def it_should_run_the_calls_concurrently(self):
+        assert self.elapsed < 0.5
+
+
+class WhenAHedgedCallIsMadeAfterManyAttemptsHaveBeenAbandoned:
+    def given_many_abandoned_attempts_which_are_still_hung(self):
+        self.release = threading.Event()
+        self.results = []
+        for _ in range(40):
+            catch(retry_, self.release.wait, ValueError, 1, attempt_timeout=0.01)
+
+    def when_i_make_a_hedged_call(self):
+        thread = threading.Thread(target=lambda: self.results.append(retry_(lambda: "done", ValueError, hedge=Hedge(1))))
+        thread.start()
+        thread.join(5)
+
+    def it_should_not_wait_for_the_hung_attempts(self):
+        assert self.results == ["done"]
+
+    def cleanup_the_hung_attempts(self):
+        self.release.set()
+
+
+class WhenTheFirstCoroutineAttemptIsSlow:
+    def given_a_coroutine_which_hangs_the_first_time(self):
+        self.x = 0
+        self.cancelled = False
+        self.hedge = Hedge(0.01, max_ratio=1)
+
+    def when_i_make_a_hedged_call(self):
+        self.result = asyncio.run(aio.retry_(self.function_to_hedge, ValueError, hedge=self.hedge))
+
+    def it_should_return_the_result_of_the_hedged_attempt(self):
+        assert self.result == "fast"
+
+    def it_should_cancel_the_slow_attempt(self):
+        assert self.cancelled
+
+    def it_should_count_the_hedge_as_a_win(self):
+        assert self.hedge.stats()["hedge_wins"] == 1
+
+    async def function_to_hedge(self):
+        self.x += 1
+        if self.x == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return "fast"
+
+
+class WhenAdaptingTheHedgeDelayOnAVirtualClock:
+    def given_a_hedge_with_a_virtual_clock(self):
+        self.clock = VirtualClock()
+        self.hedge = Hedge(10, percentile=95, clock=self.clock)
+
+    def when_i_make_many_calls_which_take_two_seconds(self):
+        async def main():
+            for _ in range(30):
+                await aio.retry_(self.function_to_hedge, ValueError, hedge=self.hedge)
+        asyncio.run(main())
+
+    def it_should_adapt_the_delay_to_the_time_on_the_clock(self):
+        assert self.hedge.stats()["delay"] == 2
+
+    async def function_to_hedge(self):
+        self.clock.advance(2)
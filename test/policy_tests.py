@@ -0,0 +1,180 @@
+import threading
+import time
+from poll import BulkheadFullError, CircuitBrokenError
+from poll.clock import VirtualClock
+from poll.policy import Policy
+from contexts import catch
+
+
+class WhenAPolicyRetriesAndFallsBack:
+    def given_a_policy_with_retries_and_a_fallback(self):
+        self.x = 0
+        self.errors = []
+        self.policy = (Policy()
+                       .retry(ValueError, times=3, interval=0, on_error=lambda e, count: self.errors.append(count))
+                       .fallback(ValueError, lambda e: "fallback for {}".format(type(e).__name__)))
+
+    def when_i_call_a_function_which_always_fails(self):
+        self.result = self.policy(self.fail)()
+
+    def it_should_retry_the_function(self):
+        assert self.x == 3
+
+    def it_should_call_on_error_for_each_attempt(self):
+        assert self.errors == [0, 1, 2]
+
+    def it_should_return_the_fallback(self):
+        assert self.result == "fallback for ValueError"
+
+    def fail(self):
+        self.x += 1
+        raise ValueError
+
+
+class WhenTheCircuitBreaksDuringRetries:
+    def given_a_policy_with_a_circuit_breaker_inside_the_retries(self):
+        self.x = 0
+        self.policy = (Policy()
+                       .circuitbreaker(ValueError, threshold=2, reset_timeout=60)
+                       .fallback(CircuitBrokenError, lambda: "cached")
+                       .retry(ValueError, times=5, interval=0))
+
+    def when_i_call_a_function_which_always_fails(self):
+        self.result = self.policy(self.fail)()
+
+    def it_should_stop_retrying_once_the_circuit_breaks(self):
+        assert self.x == 2
+
+    def it_should_fall_back_to_the_cached_value(self):
+        assert self.result == "cached"
+
+    def fail(self):
+        self.x += 1
+        raise ValueError
+
+
+class WhenAPolicyPolls:
+    def given_a_polling_policy(self):
+        self.x = 0
+        self.clock = VirtualClock()
+        self.policy = Policy(clock=self.clock).poll(lambda x: x == 3, timeout=10, interval=2)
+
+    def when_i_call_the_function(self):
+        self.result = self.policy(self.count)()
+
+    def it_should_call_the_function_until_the_condition_is_true(self):
+        assert self.result == 3
+
+    def it_should_sleep_in_between(self):
+        assert self.clock.sleeps == [2, 2]
+
+    def count(self):
+        self.x += 1
+        return self.x
+
+
+class WhenAnAttemptUnderAPolicyTakesTooLong:
+    def given_a_policy_with_a_timeout(self):
+        self.x = 0
+        self.release = threading.Event()
+        self.policy = Policy().retry(ValueError, times=3, interval=0).timeout(0.01)
+
+    def when_i_call_a_function_which_hangs_the_first_time(self):
+        self.result = self.policy(self.hang_once)()
+        self.release.set()
+
+    def it_should_retry_the_abandoned_attempt(self):
+        assert self.result == "done"
+        assert self.x == 2
+
+    def hang_once(self):
+        self.x += 1
+        if self.x == 1:
+            self.release.wait(5)
+        return "done"
+
+
+class WhenAPolicysBulkheadIsFull:
+    def given_a_function_with_a_full_bulkhead(self):
+        self.release = threading.Event()
+        self.entered = threading.Event()
+        self.call = Policy().bulkhead(1)(self.block)
+        self.thread = threading.Thread(target=self.call)
+        self.thread.start()
+        self.entered.wait(5)
+
+    def when_i_call_the_function(self):
+        self.exception = catch(self.call)
+
+    def it_should_throw_BulkheadFullError(self):
+        assert isinstance(self.exception, BulkheadFullError)
+
+    def cleanup_the_thread(self):
+        self.release.set()
+        self.thread.join()
+
+    def block(self):
+        self.entered.set()
+        self.release.wait(5)
+
+
+class WhenAttemptsInAPolicysBulkheadAreAbandoned:
+    def given_a_policy_with_a_bulkhead_and_a_timeout(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.entered = 0
+        self.call = Policy().bulkhead(2).timeout(0.01)(self.hang)
+
+    def when_i_call_the_hung_function_many_times(self):
+        self.exceptions = [catch(self.call) for _ in range(20)]
+        self.in_flight = self.call.bulkhead.in_flight
+        self.release.set()
+        give_up = time.perf_counter() + 5
+        while self.call.bulkhead.in_flight and time.perf_counter() < give_up:
+            time.sleep(0.001)
+
+    def it_should_keep_the_abandoned_attempts_in_the_bulkhead(self):
+        assert self.in_flight == 2
+
+    def it_should_only_let_the_bulkheads_worth_of_calls_through(self):
+        assert self.entered == 2
+        assert sum(isinstance(e, BulkheadFullError) for e in self.exceptions) == 18
+
+    def it_should_free_the_bulkhead_once_they_finish(self):
+        assert self.call.bulkhead.in_flight == 0
+
+    def hang(self):
+        with self.lock:
+            self.entered += 1
+        self.release.wait(5)
+
+
+class WhenExtendingAPolicy:
+    def given_a_base_policy(self):
+        self.base = Policy().retry(ValueError, times=2, interval=0)
+
+    def when_i_add_a_fallback_to_a_copy(self):
+        self.extended = self.base.fallback(ValueError, lambda: "fallback")
+
+    def it_should_leave_the_base_policy_unchanged(self):
+        assert isinstance(catch(self.base(self.fail)), ValueError)
+
+    def it_should_add_the_fallback_to_the_copy(self):
+        assert self.extended(self.fail)() == "fallback"
+
+    def fail(self):
+        raise ValueError
+
+
+class WhenApplyingAPolicy:
+    def given_a_policy_with_several_parts(self):
+        self.policy = Policy().retry(ValueError).circuitbreaker(ValueError, 5, 60).bulkhead(10)
+
+    def when_i_apply_the_policy(self):
+        self.compiled = self.policy(self.function)
+
+    def it_should_wrap_the_function_only_once(self):
+        assert self.compiled.__wrapped__ == self.function
+
+    def function(self):
+        pass
@@ -1,5 +1,10 @@
+import os
+import select
+import threading
+import time
 from unittest import mock
-from poll import poll, poll_
+from poll import poll, poll_, Deadline
+from poll.clock import VirtualClock
 from contexts import catch
 
 
@@ -24,7 +29,7 @@ class WhenConditionIsTrueFirstTime:
     def it_should_return_the_final_answer(self):
         assert self.result is self.x
 
-    @poll(lambda x: x == 1, interval=0.001)
+    @poll(lambda x: x == 1, interval=0.001, clock=VirtualClock())
     def function_to_poll(self, *args, **kwargs):
         self.args, self.kwargs = args, kwargs
         self.x += 1
@@ -54,7 +59,7 @@ class WhenConditionIsTrueAfterAFewTries:
     def it_should_return_the_final_answer(self):
         assert self.result is self.x
 
-    @poll(lambda x: x == 3, interval=0.001)
+    @poll(lambda x: x == 3, interval=0.001, clock=VirtualClock())
     def function_to_poll(self, *args, **kwargs):
         self.args.append(args)
         self.kwargs.append(kwargs)
@@ -63,30 +68,27 @@ class WhenConditionIsTrueAfterAFewTries:
 
 
 class WhenConditionIsNotTrueInTime:
+    clock = VirtualClock()
+
     def given_a_call_counter(self):
         self.x = 0
-        self.sleep_patch = mock.patch('time.sleep')
-        self.perf_counter_patch = mock.patch('time.perf_counter', return_value=0)
-        self.sleep_patch.start()
-        self.perf_counter = self.perf_counter_patch.start()
 
     def when_i_execute_the_function_to_poll(self):
         self.exception = catch(self.function_to_poll)
 
-    def it_should_keep_trying(self):
-        assert self.x == 2
+    def it_should_not_try_again_if_the_next_attempt_would_be_too_late(self):
+        assert self.x == 1
+
+    def it_should_not_sleep(self):
+        assert self.clock.sleeps == []
 
     def it_should_throw(self):
         assert isinstance(self.exception, TimeoutError)
 
-    def cleanup_the_patches(self):
-        self.sleep_patch.stop()
-        self.perf_counter_patch.stop()
-
-    @poll(lambda x: x == 3, timeout=0.04, interval=0.03)
+    @poll(lambda x: x == 3, timeout=0.04, interval=0.03, clock=clock)
     def function_to_poll(self):
         self.x += 1
-        self.perf_counter.return_value += 0.03
+        self.clock.advance(0.03)
         return self.x
 
 
@@ -100,7 +102,7 @@ class WhenFunctionThrowsAnError:
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.to_throw
 
-    @poll(lambda x: x == 1, interval=0.001)
+    @poll(lambda x: x == 1, interval=0.001, clock=VirtualClock())
     def function_to_poll(self):
         raise self.to_throw
 
@@ -115,7 +117,7 @@ class WhenConditionThrowsAnError:
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.to_throw
 
-    @poll(lambda self: self.throw(), interval=0.001)
+    @poll(lambda self: self.throw(), interval=0.001, clock=VirtualClock())
     def function_to_poll(self):
         return self
 
@@ -130,7 +132,7 @@ class WhenPollingAtUseSiteAndConditionIsTrueFirstTime:
         self.expected_kwargs = {"foo": "bar"}
 
     def when_i_poll_the_function(self):
-        self.result = poll_(self.function_to_poll, lambda x: x == 1, 1, 0.001, *self.expected_args, **self.expected_kwargs)
+        self.result = poll_(self.function_to_poll, lambda x: x == 1, 1, 0.001, *self.expected_args, clock=VirtualClock(), **self.expected_kwargs)
 
     def it_should_run_it_once(self):
         assert self.x == 1
@@ -159,7 +161,7 @@ class WhenPollingAtUseSiteAndConditionIsTrueAfterAFewTries:
         self.kwargs = []
 
     def when_i_poll_the_function(self):
-        self.result = poll_(self.function_to_poll, lambda x: x == 3, 1, 0.001, *self.expected_args, **self.expected_kwargs)
+        self.result = poll_(self.function_to_poll, lambda x: x == 3, 1, 0.001, *self.expected_args, clock=VirtualClock(), **self.expected_kwargs)
 
     def it_should_keep_trying(self):
         assert self.x == 3
@@ -183,27 +185,23 @@ class WhenPollingAtUseSiteAndConditionIsTrueAfterAFewTries:
 class WhenPollingAtUseSiteAndConditionIsNotTrueInTime:
     def given_a_call_counter(self):
         self.x = 0
-        self.sleep_patch = mock.patch('time.sleep')
-        self.perf_counter_patch = mock.patch('time.perf_counter', return_value=0)
-        self.sleep_patch.start()
-        self.perf_counter = self.perf_counter_patch.start()
+        self.clock = VirtualClock()
 
     def when_i_poll_the_function(self):
-        self.exception = catch(poll_, self.function_to_poll, lambda x: x == 3, timeout=0.04, interval=0.03)
+        self.exception = catch(poll_, self.function_to_poll, lambda x: x == 3, timeout=0.04, interval=0.03, clock=self.clock)
 
-    def it_should_keep_trying(self):
-        assert self.x == 2
+    def it_should_not_try_again_if_the_next_attempt_would_be_too_late(self):
+        assert self.x == 1
+
+    def it_should_not_sleep(self):
+        assert self.clock.sleeps == []
 
     def it_should_throw(self):
         assert isinstance(self.exception, TimeoutError)
 
-    def cleanup_the_patches(self):
-        self.sleep_patch.stop()
-        self.perf_counter_patch.stop()
-
     def function_to_poll(self):
         self.x += 1
-        self.perf_counter.return_value += 0.03
+        self.clock.advance(0.03)
         return self.x
 
 
@@ -212,7 +210,7 @@ class WhenPollingAtUseSiteAndFunctionThrowsAnError:
         self.to_throw = Exception()
 
     def when_i_poll_the_function(self):
-        self.exception = catch(poll_, self.function_to_poll, lambda x: x == 1, interval=0.001)
+        self.exception = catch(poll_, self.function_to_poll, lambda x: x == 1, interval=0.001, clock=VirtualClock())
 
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.to_throw
@@ -226,7 +224,7 @@ class WhenPollingAtUseSiteAndConditionThrowsAnError:
         self.to_throw = Exception()
 
     def when_i_poll_the_function(self):
-        self.exception = catch(poll_, self.function_to_poll, lambda self: self.throw(), interval=0.001)
+        self.exception = catch(poll_, self.function_to_poll, lambda self: self.throw(), interval=0.001, clock=VirtualClock())
 
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.to_throw
@@ -236,3 +234,233 @@ class WhenPollingAtUseSiteAndConditionThrowsAnError:
 
     def throw(self):
         raise self.to_throw
+
+
+class WhenTheConditionIsNotTrueBeforeTheTimeout:
+    def given_a_call_counter(self):
+        self.x = 0
+        self.clock = VirtualClock()
+
+    def when_i_poll_the_function(self):
+        self.exception = catch(poll_, self.function_to_poll, lambda x: False, timeout=15, interval=10, clock=self.clock)
+
+    def it_should_only_sleep_once(self):
+        assert self.clock.sleeps == [10]
+
+    def it_should_give_up_before_the_timeout(self):
+        assert self.clock.time < 15
+
+    def it_should_throw(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def function_to_poll(self):
+        self.x += 1
+        return self.x
+
+
+class WhenSeveralPollsShareADeadline:
+    def given_a_deadline(self):
+        self.clock = VirtualClock()
+        self.deadline = Deadline(7, self.clock)
+
+    def when_i_poll_two_functions_in_turn(self):
+        self.first_result = poll_(self.count_to_three, lambda x: x == 3, self.deadline, 2, [0], clock=self.clock)
+        self.exception = catch(poll_, self.count_to_three, lambda x: x == 3, self.deadline, 2, [0], clock=self.clock)
+
+    def it_should_let_the_first_one_finish(self):
+        assert self.first_result == 3
+
+    def it_should_stop_the_second_one_at_the_shared_deadline(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_give_up_instead_of_sleeping_past_the_deadline(self):
+        assert self.clock.time == 6
+
+    def it_should_report_the_time_left(self):
+        assert self.deadline.remaining() == 1
+
+    def count_to_three(self, counter):
+        counter[0] += 1
+        return counter[0]
+
+
+class WhenAPollIsWokenByAnEvent:
+    def given_a_job_finishing_in_the_background(self):
+        self.done = False
+        self.wake = threading.Event()
+        self.thread = threading.Timer(0.05, self.finish)
+
+    def when_i_poll_the_job_with_a_long_interval(self):
+        started = time.perf_counter()
+        self.thread.start()
+        self.result = poll_(lambda: self.done, lambda x: x, 30, 10, wake=self.wake)
+        self.elapsed = time.perf_counter() - started
+
+    def it_should_return_the_result(self):
+        assert self.result is True
+
+    def it_should_check_again_as_soon_as_the_poll_is_woken(self):
+        assert self.elapsed < 5
+
+    def it_should_clear_the_event(self):
+        assert not self.wake.is_set()
+
+    def cleanup_the_thread(self):
+        self.thread.join()
+
+    def finish(self):
+        self.done = True
+        self.wake.set()
+
+
+class WhenAPollIsWokenByACondition:
+    def given_a_job_finishing_in_the_background(self):
+        self.done = False
+        self.polled = False
+        self.wake = threading.Condition()
+        self.thread = threading.Thread(target=self.finish)
+
+    def when_i_poll_the_job_with_a_long_interval(self):
+        started = time.perf_counter()
+        self.thread.start()
+        self.result = poll_(lambda: self.done, lambda x: x, 30, 10, wake=self.wake)
+        self.elapsed = time.perf_counter() - started
+        self.polled = True
+
+    def it_should_return_the_result(self):
+        assert self.result is True
+
+    def it_should_check_again_as_soon_as_the_poll_is_woken(self):
+        assert self.elapsed < 5
+
+    def cleanup_the_thread(self):
+        self.thread.join()
+
+    def finish(self):
+        time.sleep(0.05)
+        self.done = True
+        # a notification sent while the condition is being checked is missed
+        while not self.polled:
+            with self.wake:
+                self.wake.notify_all()
+            time.sleep(0.01)
+
+
+class WhenAPollIsWokenByAFileDescriptor:
+    def given_a_pipe_written_to_in_the_background(self):
+        self.status = "running"
+        self.read_end, self.write_end = os.pipe()
+        self.thread = threading.Timer(0.05, self.finish)
+
+    def when_i_poll_with_a_long_interval(self):
+        started = time.perf_counter()
+        self.thread.start()
+        self.result = poll_(lambda: self.status, lambda x: x == "done", 30, 10, wake=self.read_end)
+        self.elapsed = time.perf_counter() - started
+
+    def it_should_return_the_result(self):
+        assert self.result == "done"
+
+    def it_should_check_again_as_soon_as_the_poll_is_woken(self):
+        assert self.elapsed < 5
+
+    def it_should_drain_the_pipe(self):
+        assert not select.select([self.read_end], [], [], 0)[0]
+
+    def cleanup_the_pipe(self):
+        self.thread.join()
+        os.close(self.read_end)
+        os.close(self.write_end)
+
+    def finish(self):
+        self.status = "done"
+        os.write(self.write_end, b"x")
+
+
+class WhenAPollIsWokenByAFileDescriptorWhichIsNeverRead:
+    def given_a_pipe_with_bytes_waiting(self):
+        self.x = 0
+        self.read_end, self.write_end = os.pipe()
+        os.write(self.write_end, b"x" * 100)
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        self.exception = catch(poll_, self.check, lambda x: False, 0.3, 0.1, wake=self.read_end)
+
+    def it_should_throw_TimeoutError(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_only_be_woken_once(self):
+        assert self.x <= 5
+
+    def cleanup_the_pipe(self):
+        os.close(self.read_end)
+        os.close(self.write_end)
+
+    def check(self):
+        self.x += 1
+
+
+class WhenAPollIsWokenByAFileDescriptorAtTheEndOfTheFile:
+    def given_a_pipe_whose_write_end_is_closed(self):
+        self.x = 0
+        self.read_end, write_end = os.pipe()
+        os.close(write_end)
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        self.exception = catch(poll_, self.check, lambda x: False, 0.3, 0.1, wake=self.read_end)
+
+    def it_should_throw_TimeoutError(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_sleep_for_the_interval_instead(self):
+        assert self.x <= 4
+
+    def cleanup_the_pipe(self):
+        os.close(self.read_end)
+
+    def check(self):
+        self.x += 1
+
+
+class WhenAPollWithAWakeUpSourceIsNeverWoken:
+    def given_an_event_which_is_never_set(self):
+        self.x = 0
+        self.clock = VirtualClock()
+        self.wake = threading.Event()
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        self.exception = catch(poll_, self.check, lambda x: False, 30, 10, clock=self.clock, wake=self.wake)
+
+    def it_should_wait_for_the_whole_interval_each_time(self):
+        assert self.clock.sleeps == [10, 10]
+
+    def it_should_throw_TimeoutError(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def check(self):
+        self.x += 1
+
+
+class WhenAPolledFunctionIsReadyFirstTime:
+    def given_a_function_decorated_with_poll(self):
+        self.x = 0
+        self.clock = VirtualClock()
+        self.function = poll(lambda x: x == 1, timeout=15, interval=1, clock=self.clock)(self.count)
+
+    def when_i_call_the_function(self):
+        with mock.patch('poll._exec') as self.exec_:
+            self.result = self.function()
+
+    def it_should_return_the_result(self):
+        assert self.result == 1
+
+    def it_should_call_the_function_once(self):
+        assert self.x == 1
+
+    def it_should_not_enter_the_polling_loop(self):
+        assert not self.exec_.called
+        assert self.clock.sleeps == []
+
+    def count(self):
+        self.x += 1
+        return self.x
@@ -0,0 +1,256 @@
+import threading
+import time
+from poll.clock import VirtualClock
+from poll.poller import Poller
+from contexts import catch
+
+
+class WhenPollingManyFunctionsAtOnce:
+    def given_a_poller(self):
+        self.poller = Poller(workers=4)
+        self.counts = [0] * 200
+        self.threads_before = threading.active_count()
+
+    def when_i_submit_a_poll_for_each_function(self):
+        self.futures = [self.poller.submit(self.check, lambda x: x >= 3, 10, 0.001, i) for i in range(200)]
+        self.most_threads = self.threads_before
+        while not all(f.done() for f in self.futures):
+            self.most_threads = max(self.most_threads, threading.active_count())
+            time.sleep(0.001)
+
+    def it_should_resolve_every_future_with_the_final_result(self):
+        assert [f.result() for f in self.futures] == [3] * 200
+
+    def it_should_poll_every_function_until_the_condition_is_true(self):
+        assert self.counts == [3] * 200
+
+    def it_should_not_start_a_thread_for_each_poll(self):
+        assert self.most_threads <= self.threads_before + 5
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check(self, i):
+        self.counts[i] += 1
+        return self.counts[i]
+
+
+class WhenAPollTimesOut:
+    def given_a_poller(self):
+        self.poller = Poller()
+        self.x = 0
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        future = self.poller.submit(self.check, lambda x: False, 0.05, 0.01)
+        self.exception = future.exception(5)
+
+    def it_should_resolve_the_future_with_a_timeout_error(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_check_the_condition_more_than_once(self):
+        assert self.x > 1
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check(self):
+        self.x += 1
+
+
+class WhenAPollerRunsOnAVirtualClock:
+    def given_a_poller_with_a_virtual_clock(self):
+        self.clock = VirtualClock()
+        self.poller = Poller(clock=self.clock)
+        self.checked_at = []
+
+    def when_i_poll_a_condition_which_never_becomes_true(self):
+        future = self.poller.submit(self.check, lambda x: False, 12, 5)
+        self.exception = future.exception(5)
+
+    def it_should_wait_for_each_check_on_the_clock(self):
+        assert self.checked_at == [0, 5, 10]
+
+    def it_should_time_out_on_the_clock(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check(self):
+        self.checked_at.append(self.clock.now())
+
+
+class WhenAPolledFunctionThrows:
+    def given_a_poller(self):
+        self.poller = Poller()
+        self.expected_exception = ValueError()
+
+    def when_i_poll_the_function(self):
+        future = self.poller.submit(self.check, lambda x: False, 5, 0.01)
+        self.exception = future.exception(5)
+
+    def it_should_resolve_the_future_with_the_exception(self):
+        assert self.exception is self.expected_exception
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check(self):
+        raise self.expected_exception
+
+
+class WhenAPollIsCancelled:
+    def given_a_poll_in_progress(self):
+        self.poller = Poller()
+        self.checked = threading.Event()
+        self.x = 0
+        self.future = self.poller.submit(self.check, lambda x: False, 10, 0.01)
+        self.checked.wait(5)
+
+    def when_i_cancel_the_future(self):
+        self.cancelled = self.future.cancel()
+        time.sleep(0.05)
+        self.checks = self.x
+        time.sleep(0.05)
+
+    def it_should_cancel_the_future(self):
+        assert self.cancelled
+
+    def it_should_stop_polling(self):
+        assert self.x == self.checks
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check(self):
+        self.x += 1
+        self.checked.set()
+
+
+class WhenThePollerIsClosed:
+    def given_a_poll_in_progress(self):
+        self.poller = Poller()
+        self.future = self.poller.submit(lambda: None, lambda x: False, 10, 0.01)
+
+    def when_i_close_the_poller(self):
+        self.poller.close()
+
+    def it_should_cancel_the_poll(self):
+        assert self.future.cancelled()
+
+    def it_should_refuse_new_polls(self):
+        assert isinstance(catch(self.poller.submit, lambda: None, lambda x: True), RuntimeError)
+
+
+class WhenPollingABatch:
+    def given_a_batch(self):
+        self.poller = Poller()
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.batch_sizes = []
+        self.batch = self.poller.batch(self.check_jobs, max_size=100, max_wait=0.05)
+
+    def when_i_submit_many_polls_to_the_batch(self):
+        futures = [self.batch.submit(i, lambda x: x >= 3, 10, 0.01) for i in range(250)]
+        self.results = [f.result(10) for f in futures]
+
+    def it_should_resolve_every_future(self):
+        assert self.results == [3] * 250
+
+    def it_should_check_the_polls_in_bulk(self):
+        assert len(self.batch_sizes) <= 30
+
+    def it_should_not_exceed_the_maximum_batch_size(self):
+        assert max(self.batch_sizes) <= 100
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check_jobs(self, keys):
+        with self.lock:
+            self.batch_sizes.append(len(keys))
+            for key in keys:
+                self.counts[key] = self.counts.get(key, 0) + 1
+            return {key: self.counts[key] for key in keys}
+
+
+class WhenABatchFillsUpBeforeItsMaximumWait:
+    def given_a_batch_which_may_wait_a_long_time(self):
+        self.poller = Poller()
+        self.batch_sizes = []
+        self.batch = self.poller.batch(self.check_jobs, max_size=2, max_wait=60)
+
+    def when_i_submit_enough_polls_to_fill_a_group(self):
+        futures = [self.batch.submit(i, lambda x: True) for i in range(2)]
+        self.results = [f.result(5) for f in futures]
+
+    def it_should_check_them_straight_away(self):
+        assert self.results == [0, 1]
+
+    def it_should_check_them_together(self):
+        assert self.batch_sizes == [2]
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check_jobs(self, keys):
+        self.batch_sizes.append(len(keys))
+        return {key: key for key in keys}
+
+
+class WhenOnePollInABatchTimesOut:
+    def given_a_batch(self):
+        self.poller = Poller()
+        self.batch = self.poller.batch(lambda keys: {key: key for key in keys})
+
+    def when_i_submit_polls_with_different_conditions(self):
+        self.ready = self.batch.submit("ready", lambda x: True, 10, 0.01)
+        self.never_ready = self.batch.submit("never ready", lambda x: False, 0.05, 0.01)
+
+    def it_should_resolve_the_poll_which_succeeded(self):
+        assert self.ready.result(5) == "ready"
+
+    def it_should_time_out_the_other_poll(self):
+        assert isinstance(self.never_ready.exception(5), TimeoutError)
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+
+class WhenABatchFunctionLeavesOutAKey:
+    def given_a_batch_which_only_knows_one_key(self):
+        self.poller = Poller()
+        self.batch = self.poller.batch(lambda keys: {"known": 1})
+
+    def when_i_submit_polls_for_two_keys(self):
+        self.known = self.batch.submit("known", lambda x: True)
+        self.unknown = self.batch.submit("unknown", lambda x: True)
+
+    def it_should_resolve_the_known_key(self):
+        assert self.known.result(5) == 1
+
+    def it_should_fail_the_unknown_key(self):
+        assert isinstance(self.unknown.exception(5), KeyError)
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+
+class WhenABatchFunctionThrows:
+    def given_a_batch(self):
+        self.poller = Poller()
+        self.expected_exception = ValueError()
+        self.batch = self.poller.batch(self.check_jobs, max_wait=0.05)
+
+    def when_i_submit_some_polls(self):
+        futures = [self.batch.submit(i, lambda x: True) for i in range(3)]
+        self.exceptions = [f.exception(5) for f in futures]
+
+    def it_should_fail_every_poll_in_the_batch(self):
+        assert all(e is self.expected_exception for e in self.exceptions)
+
+    def cleanup_the_poller(self):
+        self.poller.close()
+
+    def check_jobs(self, keys):
+        raise self.expected_exception
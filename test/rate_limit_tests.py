@@ -0,0 +1,160 @@
+import asyncio
+import time
+from poll import RateLimit, RateLimitExceededError, poll_, ratelimit, retry_
+from poll import aio
+from poll.clock import VirtualClock
+from contexts import catch
+
+
+class WhenCallsArriveFasterThanTheRate:
+    def given_a_rate_limited_function(self):
+        self.clock = VirtualClock(100)
+        self.calls = []
+
+        @ratelimit(2, clock=self.clock)
+        def call():
+            self.calls.append(self.clock.time)
+        self.call = call
+
+    def when_i_call_the_function_three_times(self):
+        for _ in range(3):
+            self.call()
+
+    def it_should_space_the_calls_out(self):
+        assert self.calls == [100, 100.5, 101]
+
+    def it_should_sleep_until_each_call_is_due(self):
+        assert self.clock.sleeps == [0.5, 0.5]
+
+
+class WhenABurstOfCallsArrivesAfterAQuietSpell:
+    def given_a_rate_limit_which_allows_bursts(self):
+        self.clock = VirtualClock(100)
+        self.limit = RateLimit(1, burst=3, clock=self.clock)
+
+    def when_i_ask_for_several_calls_at_once(self):
+        self.answers = [self.limit.try_acquire() for _ in range(4)]
+
+    def it_should_allow_the_burst(self):
+        assert self.answers == [True, True, True, False]
+
+    def it_should_report_the_wait_for_the_next_call(self):
+        assert self.limit.wait_time() == 1
+
+
+class WhenACallWouldHaveToWaitTooLong:
+    def given_a_function_which_has_just_been_called(self):
+        self.clock = VirtualClock(100)
+        self.x = 0
+
+        @ratelimit(1, per=2, max_wait=1, clock=self.clock)
+        def call():
+            self.x += 1
+        self.call = call
+        self.call()
+
+    def when_i_call_the_function_again(self):
+        self.exception = catch(self.call)
+
+    def it_should_throw_RateLimitExceededError(self):
+        assert isinstance(self.exception, RateLimitExceededError)
+
+    def it_should_say_how_long_to_wait(self):
+        assert self.exception.time_remaining == 2
+
+    def it_should_not_call_the_function(self):
+        assert self.x == 1
+
+    def it_should_not_sleep(self):
+        assert self.clock.sleeps == []
+
+
+class WhenFunctionsShareARateLimit:
+    def given_two_functions_with_the_same_limit(self):
+        self.clock = VirtualClock(100)
+        shared = RateLimit(4, clock=self.clock)
+        self.one = ratelimit(shared)(lambda: None)
+        self.two = ratelimit(shared)(lambda: None)
+
+    def when_i_call_both_functions(self):
+        self.one()
+        self.two()
+
+    def it_should_count_both_calls_against_the_limit(self):
+        assert self.clock.sleeps == [0.25]
+
+
+class WhenRetryingUnderARateLimit:
+    def given_a_function_which_fails_twice(self):
+        self.clock = VirtualClock(100)
+        self.x = 0
+        self.limit = RateLimit(4, clock=self.clock)
+
+    def when_i_retry_the_function(self):
+        self.result = retry_(self.function_to_retry, ValueError, 3, 0, rate_limit=self.limit, clock=self.clock)
+
+    def it_should_succeed(self):
+        assert self.result == "done"
+
+    def it_should_count_every_attempt_against_the_limit(self):
+        assert self.clock.sleeps == [0, 0.25, 0, 0.25]
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x < 3:
+            raise ValueError
+        return "done"
+
+
+class WhenTheRateLimitWouldMakeAPollMissItsDeadline:
+    def given_a_rate_limit_with_no_turns_for_a_while(self):
+        self.clock = VirtualClock(100)
+        self.x = 0
+        self.limit = RateLimit(1, per=10, clock=self.clock)
+        self.limit.try_acquire()
+
+    def when_i_poll_with_a_short_timeout(self):
+        self.exception = catch(poll_, self.function_to_poll, lambda x: x, timeout=5, rate_limit=self.limit, clock=self.clock)
+
+    def it_should_throw_a_timeout_error(self):
+        assert isinstance(self.exception, TimeoutError)
+
+    def it_should_not_call_the_function(self):
+        assert self.x == 0
+
+    def function_to_poll(self):
+        self.x += 1
+        return True
+
+
+class WhenCoroutinesCallARateLimitedFunction:
+    def given_a_rate_limited_coroutine_function(self):
+        @aio.ratelimit(50)
+        async def call():
+            return time.perf_counter()
+        self.call = call
+
+    def when_i_call_the_function_three_times(self):
+        async def main():
+            return [await self.call() for _ in range(3)]
+        self.times = asyncio.run(main())
+
+    def it_should_space_the_calls_out(self):
+        assert self.times[2] - self.times[0] >= 0.039
+
+
+class WhenACoroutineWouldHaveToWait:
+    def given_a_coroutine_function_which_never_waits(self):
+        @aio.ratelimit(1, max_wait=0)
+        async def call():
+            return "done"
+        self.call = call
+
+    def when_i_call_the_function_twice(self):
+        async def main():
+            return await asyncio.gather(self.call(), self.call(), return_exceptions=True)
+        self.results = asyncio.run(main())
+
+    def it_should_throw_RateLimitExceededError_for_the_second(self):
+        assert self.results[0] == "done"
+        assert isinstance(self.results[1], RateLimitExceededError)
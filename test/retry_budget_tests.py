@@ -0,0 +1,99 @@
+import threading
+from poll import RetryBudget, retry, retry_
+from poll.clock import VirtualClock
+from contexts import catch
+
+
+class WhenTheRetryBudgetRunsOut:
+    def given_a_budget_with_two_retries_left(self):
+        self.x = 0
+        self.clock = VirtualClock()
+        self.budget = RetryBudget(ratio=0.5, min_per_second=0, clock=self.clock)
+        for _ in range(4):
+            self.budget.deposit()
+        self.expected_exception = ValueError()
+
+    def when_i_retry_a_function_which_always_fails(self):
+        self.exception = catch(retry_, self.function_to_retry, ValueError, 10, 1, budget=self.budget, clock=self.clock)
+
+    def it_should_only_retry_as_many_times_as_the_budget_allows(self):
+        assert self.x == 3
+
+    def it_should_bubble_the_exception_out_without_sleeping_again(self):
+        assert self.exception is self.expected_exception
+        assert self.clock.sleeps == [1, 1]
+
+    def it_should_have_nothing_left(self):
+        assert self.budget.balance() == 0
+
+    def function_to_retry(self):
+        self.x += 1
+        raise self.expected_exception
+
+
+class WhenSuccessfulCallsRefillTheRetryBudget:
+    def given_an_empty_budget(self):
+        self.budget = RetryBudget(ratio=0.25, min_per_second=0)
+
+    def when_some_calls_succeed(self):
+        @retry(ValueError, budget=self.budget)
+        def succeed():
+            pass
+
+        for _ in range(8):
+            succeed()
+
+    def it_should_allow_retries_in_proportion(self):
+        assert self.budget.balance() == 2
+
+
+class WhenThereHaveBeenNoSuccessfulCalls:
+    def given_a_budget_with_a_minimum_rate(self):
+        self.budget = RetryBudget(ratio=0.5, min_per_second=1, ttl=3)
+
+    def when_i_ask_to_retry_repeatedly(self):
+        self.answers = [self.budget.try_withdraw() for _ in range(5)]
+
+    def it_should_allow_the_minimum_number_of_retries(self):
+        assert self.answers == [True, True, True, False, False]
+
+
+class WhenSuccessfulCallsAreNoLongerRecent:
+    def given_a_budget_with_some_deposits(self):
+        self.clock = VirtualClock(100)
+        self.budget = RetryBudget(ratio=1, min_per_second=0, ttl=10, clock=self.clock)
+        for _ in range(5):
+            self.budget.deposit()
+        self.clock.advance(5)
+        self.budget.deposit()
+
+    def when_time_passes(self):
+        self.clock.advance(6)
+
+    def it_should_forget_the_old_calls(self):
+        assert self.budget.balance() == 1
+
+
+class WhenManyThreadsShareARetryBudget:
+    def given_a_budget_with_a_hundred_retries(self):
+        self.budget = RetryBudget(ratio=1, min_per_second=0)
+        for _ in range(100):
+            self.budget.deposit()
+        self.lock = threading.Lock()
+        self.granted = 0
+
+    def when_the_threads_all_ask_to_retry(self):
+        def withdraw():
+            for _ in range(50):
+                if self.budget.try_withdraw():
+                    with self.lock:
+                        self.granted += 1
+
+        threads = [threading.Thread(target=withdraw) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def it_should_grant_exactly_the_budgeted_number_of_retries(self):
+        assert self.granted == 100
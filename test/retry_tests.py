@@ -1,4 +1,12 @@
-from poll import retry, retry_
+import functools
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+import poll
+from poll import retry, retry_, set_max_attempt_workers, AttemptTimeoutError
+from poll.clock import VirtualClock
 from contexts import catch
 
 
@@ -23,7 +31,7 @@ class WhenRetryingAFunctionWhichWorksFirstTime:
     def it_should_return_the_final_answer(self):
         assert self.result is self.x
 
-    @retry(Exception, times=3, interval=0.001)
+    @retry(Exception, times=3, interval=0.001, clock=VirtualClock())
     def function_to_retry(self, *args, **kwargs):
         self.args = args
         self.kwargs = kwargs
@@ -42,7 +50,7 @@ class WhenRetryingAFunctionWhichThrowsAnExceptionAndOnErrorTakesNoArguments:
         self.exception = ValueError()
 
     def when_i_execute_the_retryable_function(self):
-        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error)
+        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error, clock=VirtualClock())
         def function_to_retry(*args, **kwargs):
             self.args.append(args)
             self.kwargs.append(kwargs)
@@ -83,7 +91,7 @@ class WhenRetryingAFunctionWhichThrowsAnExceptionAndOnErrorTakesOneArgument:
         self.exception = ValueError()
 
     def when_i_execute_the_retryable_function(self):
-        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error)
+        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error, clock=VirtualClock())
         def function_to_retry(*args, **kwargs):
             self.args.append(args)
             self.kwargs.append(kwargs)
@@ -124,7 +132,7 @@ class WhenRetryingAFunctionWhichThrowsAnExceptionOnErrorTakesTwoArguments:
         self.exception = ValueError()
 
     def when_i_execute_the_retryable_function(self):
-        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error)
+        @retry(ValueError, times=3, interval=0.001, on_error=self.on_error, clock=VirtualClock())
         def function_to_retry(*args, **kwargs):
             self.args.append(args)
             self.kwargs.append(kwargs)
@@ -154,6 +162,124 @@ class WhenRetryingAFunctionWhichThrowsAnExceptionOnErrorTakesTwoArguments:
         self.on_error_calls.append((ex, retry_count))
 
 
+class WhenRetryingAFunctionWhoseOnErrorCallbackIsAPartial:
+    def given_a_partially_applied_callback(self):
+        self.x = 0
+        self.on_error_calls = []
+        self.exception = ValueError()
+        self.on_error = functools.partial(self.record, "tag")
+
+    def when_i_execute_the_retryable_function(self):
+        self.result = retry_(self.function_to_retry, ValueError, 3, 0.001, self.on_error, clock=VirtualClock())
+
+    def it_should_pass_the_remaining_arguments(self):
+        assert self.on_error_calls == [("tag", self.exception, 0), ("tag", self.exception, 1)]
+
+    def record(self, tag, ex, retry_count):
+        self.on_error_calls.append((tag, ex, retry_count))
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x != 3:
+            raise self.exception
+        return self.x
+
+
+class WhenRetryingAFunctionWhoseOnErrorCallbackTakesVarArgs:
+    def given_a_call_counter(self):
+        self.x = 0
+        self.on_error_calls = []
+        self.exception = ValueError()
+
+    def when_i_execute_the_retryable_function(self):
+        self.result = retry_(self.function_to_retry, ValueError, 3, 0.001, self.on_error, clock=VirtualClock())
+
+    def it_should_pass_every_argument(self):
+        assert self.on_error_calls == [(self.exception, 0), (self.exception, 1)]
+
+    def on_error(self, *args):
+        self.on_error_calls.append(args)
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x != 3:
+            raise self.exception
+        return self.x
+
+
+class WhenRetryingAFunctionWhoseOnErrorCallbackHasNoSignature:
+    def given_a_builtin_callback(self):
+        self.x = 0
+        self.on_error_calls = []
+        self.exception = ValueError()
+
+    def when_i_execute_the_retryable_function(self):
+        with mock.patch('inspect.signature', side_effect=ValueError):
+            self.result = retry_(self.function_to_retry, ValueError, 3, 0.001, self.on_error, clock=VirtualClock())
+
+    def it_should_pass_every_argument(self):
+        assert self.on_error_calls == [(self.exception, 0), (self.exception, 1)]
+
+    def on_error(self, *args):
+        self.on_error_calls.append(args)
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x != 3:
+            raise self.exception
+        return self.x
+
+
+class WhenADecoratedFunctionFailsRepeatedly:
+    def given_a_decorated_function(self):
+        self.x = 0
+        self.on_error_calls = 0
+
+        @retry(ValueError, times=5, interval=0.001, on_error=self.on_error, clock=VirtualClock())
+        def function_to_retry():
+            self.x += 1
+            raise ValueError
+        self.function_to_retry = function_to_retry
+
+    def when_i_call_the_function_twice(self):
+        with mock.patch('inspect.signature') as self.signature:
+            catch(self.function_to_retry)
+            catch(self.function_to_retry)
+
+    def it_should_call_on_error_every_time_it_failed(self):
+        assert self.on_error_calls == 10
+
+    def it_should_not_inspect_the_callback_again(self):
+        assert not self.signature.called
+
+    def on_error(self):
+        self.on_error_calls += 1
+
+
+class WhenRetryingAtTheUseSiteRepeatedly:
+    def given_a_callback_which_has_been_used_once(self):
+        self.x = 0
+        self.on_error_calls = []
+        self.on_error = lambda e: self.on_error_calls.append(e)
+        retry_(self.function_to_retry, ValueError, 2, 0, self.on_error, clock=VirtualClock())
+
+    def when_i_retry_with_the_same_callback_and_with_the_default_one(self):
+        with mock.patch('inspect.signature') as self.signature:
+            retry_(self.function_to_retry, ValueError, 2, 0, self.on_error, clock=VirtualClock())
+            retry_(self.function_to_retry, ValueError, 2, 0, clock=VirtualClock())
+
+    def it_should_call_on_error_every_time_it_failed(self):
+        assert len(self.on_error_calls) == 2
+
+    def it_should_not_inspect_either_callback(self):
+        assert not self.signature.called
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x % 2:
+            raise ValueError
+
+
 class WhenRetryingAFunctionWhichThrowsAnExceptionTooManyTimes:
     def given_an_error_to_throw(self):
         self.x = 0
@@ -168,7 +294,7 @@ class WhenRetryingAFunctionWhichThrowsAnExceptionTooManyTimes:
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.expected_exception
 
-    @retry(ValueError, times=3, interval=0.001)
+    @retry(ValueError, times=3, interval=0.001, clock=VirtualClock())
     def function_to_retry(self):
         self.x += 1
         raise self.expected_exception
@@ -188,7 +314,7 @@ class WhenRetryingAFunctionWhichThrowsAnExceptionWeWereNotExpecting:
     def it_should_only_try_once(self):
         assert self.x == 1
 
-    @retry(ValueError, times=3, interval=0.001)
+    @retry(ValueError, times=3, interval=0.001, clock=VirtualClock())
     def function_to_retry(self, *args, **kwargs):
         self.x += 1
         raise self.expected_exception
@@ -217,7 +343,7 @@ class WhenRetryingAFunctionAndListeningForMultipleErrors:
     def it_should_return_the_final_answer(self):
         assert self.result is self.x
 
-    @retry([ValueError, IndexError], times=3, interval=0.001)
+    @retry([ValueError, IndexError], times=3, interval=0.001, clock=VirtualClock())
     def function_to_retry(self, *args, **kwargs):
         self.args.append(args)
         self.kwargs.append(kwargs)
@@ -243,7 +369,7 @@ class WhenRetryingAFunctionAndListeningForMultipleErrorsButItThrowsAnExceptionWe
     def it_should_only_try_once(self):
         assert self.x == 1
 
-    @retry([ValueError, IndexError], times=3, interval=0.001)
+    @retry([ValueError, IndexError], times=3, interval=0.001, clock=VirtualClock())
     def function_to_retry(self, *args, **kwargs):
         self.x += 1
         raise self.expected_exception
@@ -256,7 +382,7 @@ class WhenRetryingAFunctionAtTheUseSiteAndItWorksFirstTime:
         self.expected_kwargs = {"foo": "bar"}
 
     def when_i_retry_the_function(self):
-        self.result = retry_(self.function_to_retry, Exception, 3, 0.001, lambda e, x: None, *self.expected_args, **self.expected_kwargs)
+        self.result = retry_(self.function_to_retry, Exception, 3, 0.001, lambda e, x: None, *self.expected_args, clock=VirtualClock(), **self.expected_kwargs)
 
     def it_should_call_it_once(self):
         assert self.x == 1
@@ -286,7 +412,7 @@ class WhenRetryingAFunctionAtTheUseSiteAndItThrowsAnException:
         self.kwargs = []
 
     def when_i_retry_the_function(self):
-        self.result = retry_(self.function_to_retry, ValueError, 3, 0.001, lambda e, x: None, *self.expected_args, **self.expected_kwargs)
+        self.result = retry_(self.function_to_retry, ValueError, 3, 0.001, lambda e, x: None, *self.expected_args, clock=VirtualClock(), **self.expected_kwargs)
 
     def it_should_keep_trying_until_the_exception_goes_away(self):
         assert self.x == 3
@@ -315,7 +441,7 @@ class WhenRetryingAFunctionAtTheUseSiteAndItThrowsAnExceptionTooManyTimes:
         self.expected_exception = ValueError()
 
     def when_i_retry_the_function(self):
-        self.exception = catch(retry_, self.function_to_retry, ValueError, times=3, interval=0.001)
+        self.exception = catch(retry_, self.function_to_retry, ValueError, times=3, interval=0.001, clock=VirtualClock())
 
     def it_should_keep_trying_until_the_number_of_retries_is_exceeded(self):
         assert self.x == 3
@@ -334,7 +460,7 @@ class WhenRetryingAFunctionAtTheUseSiteAndItThrowsAnExceptionWeWereNotExpecting:
         self.expected_exception = TypeError()
 
     def when_i_retry_the_function(self):
-        self.exception = catch(retry_, self.function_to_retry, ValueError, times=3, interval=0.001)
+        self.exception = catch(retry_, self.function_to_retry, ValueError, times=3, interval=0.001, clock=VirtualClock())
 
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.expected_exception
@@ -356,7 +482,7 @@ class WhenRetryingAFunctionAtTheUseSiteAndListeningForMultipleErrors:
         self.kwargs = []
 
     def when_i_retry_the_function(self):
-        self.result = retry_(self.function_to_retry, [ValueError, IndexError], 3, 0.001, lambda e, x: None, *self.expected_args, **self.expected_kwargs)
+        self.result = retry_(self.function_to_retry, [ValueError, IndexError], 3, 0.001, lambda e, x: None, *self.expected_args, clock=VirtualClock(), **self.expected_kwargs)
 
     def it_should_keep_trying_until_the_exception_goes_away(self):
         assert self.x == 3
@@ -387,7 +513,7 @@ class WhenRetryingAFunctionAtTheUseSiteAndListeningForMultipleErrorsButItThrowsA
         self.expected_exception = TypeError()
 
     def when_i_retry_the_function(self):
-        self.exception = catch(retry_, self.function_to_retry, [ValueError, IndexError], times=3, interval=0.001)
+        self.exception = catch(retry_, self.function_to_retry, [ValueError, IndexError], times=3, interval=0.001, clock=VirtualClock())
 
     def it_should_bubble_the_exception_out(self):
         assert self.exception is self.expected_exception
@@ -398,3 +524,191 @@ class WhenRetryingAFunctionAtTheUseSiteAndListeningForMultipleErrorsButItThrowsA
     def function_to_retry(self, *args, **kwargs):
         self.x += 1
         raise self.expected_exception
+
+
+class WhenAnAttemptHangs:
+    def given_a_function_which_hangs_the_first_time(self):
+        self.x = 0
+        self.release = threading.Event()
+        self.on_error_calls = []
+
+    def when_i_retry_the_function_with_an_attempt_timeout(self):
+        self.result = retry_(self.function_to_retry, ValueError, 3, 0.001, self.on_error, attempt_timeout=0.05, clock=VirtualClock())
+        self.release.set()
+
+    def it_should_abandon_the_hung_attempt_and_try_again(self):
+        assert self.x == 2
+
+    def it_should_return_the_result_of_the_second_attempt(self):
+        assert self.result == 2
+
+    def it_should_report_the_abandoned_attempt_to_on_error(self):
+        assert len(self.on_error_calls) == 1
+        assert isinstance(self.on_error_calls[0], AttemptTimeoutError)
+
+    def on_error(self, ex):
+        self.on_error_calls.append(ex)
+
+    def function_to_retry(self):
+        self.x += 1
+        if self.x == 1:
+            self.release.wait(5)
+            return "too late"
+        return self.x
+
+
+class WhenEveryAttemptHangs:
+    def given_a_function_which_always_hangs(self):
+        self.release = threading.Event()
+        self.on_error_calls = []
+
+        @retry(ValueError, times=2, interval=0.001, on_error=self.on_error_calls.append, attempt_timeout=0.01, clock=VirtualClock())
+        def function_to_retry():
+            self.release.wait(5)
+        self.function_to_retry = function_to_retry
+
+    def when_i_call_the_function_three_times(self):
+        self.exceptions = [catch(self.function_to_retry) for _ in range(3)]
+        self.release.set()
+
+    def it_should_raise_AttemptTimeoutError(self):
+        assert all(isinstance(e, AttemptTimeoutError) for e in self.exceptions)
+
+    def it_should_make_the_specified_number_of_attempts(self):
+        assert len(self.on_error_calls) == 6
+
+
+class WhenAFunctionWithAnAttemptTimeoutRaisesTimeoutErrorItself:
+    def given_an_exception(self):
+        self.expected_exception = TimeoutError()
+
+    def when_i_retry_the_function(self):
+        self.exception = catch(retry_, self.function_to_retry, ValueError, 3, 0.001, attempt_timeout=1, clock=VirtualClock())
+
+    def it_should_bubble_the_exception_out(self):
+        assert self.exception is self.expected_exception
+
+    def function_to_retry(self):
+        raise self.expected_exception
+
+
+class WhenMakingManyCallsWithAnAttemptTimeout:
+    def given_a_set_of_threads(self):
+        self.threads = set()
+        self.daemons = []
+
+    def when_i_call_the_function_many_times(self):
+        self.results = [retry_(self.function_to_retry, ValueError, 3, 0.001, attempt_timeout=1, clock=VirtualClock()) for _ in range(200)]
+
+    def it_should_run_the_attempts_on_worker_threads(self):
+        assert threading.current_thread().name not in self.threads
+
+    def it_should_reuse_the_worker_threads(self):
+        assert len(self.threads) <= 32
+
+    def it_should_run_the_attempts_on_daemon_threads(self):
+        assert all(self.daemons)
+
+    def function_to_retry(self):
+        self.threads.add(threading.current_thread().name)
+        self.daemons.append(threading.current_thread().daemon)
+
+
+class WhenCallingAFunctionAfterManyAttemptsHaveBeenAbandoned:
+    def given_many_abandoned_attempts_which_are_still_hung(self):
+        self.release = threading.Event()
+        for _ in range(40):
+            catch(retry_, self.release.wait, ValueError, 1, attempt_timeout=0.01)
+
+    def when_i_call_a_quick_function_with_an_attempt_timeout(self):
+        self.result = retry_(lambda: "done", ValueError, 1, attempt_timeout=1)
+
+    def it_should_not_wait_for_the_hung_attempts(self):
+        assert self.result == "done"
+
+    def cleanup_the_hung_attempts(self):
+        self.release.set()
+
+
+class WhenEveryAttemptWorkerIsBusy:
+    def given_a_small_number_of_workers(self):
+        self.release = threading.Event()
+        self.max_workers = poll._workers.max_workers
+        set_max_attempt_workers(5)
+        self.threads_before = threading.active_count()
+
+    def when_i_retry_a_hung_function_many_times(self):
+        self.exception = catch(retry_, self.release.wait, AttemptTimeoutError, 200, 0, attempt_timeout=0.001)
+
+    def it_should_throw_AttemptTimeoutError(self):
+        assert isinstance(self.exception, AttemptTimeoutError)
+
+    def it_should_not_start_a_thread_for_each_attempt(self):
+        assert threading.active_count() <= self.threads_before + 5
+
+    def cleanup_the_workers(self):
+        self.release.set()
+        set_max_attempt_workers(self.max_workers)
+
+
+class WhenAProgramExitsWithAnAttemptStillHung:
+    def given_a_program_which_abandons_a_hung_attempt(self):
+        self.program = "\n".join([
+            "import threading",
+            "from poll import retry_",
+            "retry_(lambda: 'done', ValueError, 1, attempt_timeout=1)",
+            "try:",
+            "    retry_(threading.Event().wait, ValueError, 1, attempt_timeout=0.01)",
+            "except TimeoutError:",
+            "    pass",
+        ])
+
+    def when_i_run_the_program(self):
+        self.process = subprocess.run([sys.executable, "-c", self.program], timeout=30)
+
+    def it_should_exit_without_waiting_for_the_attempt(self):
+        assert self.process.returncode == 0
+
+
+class WhenManyThreadsMakeAttemptsWithATimeoutAtOnce:
+    def given_a_function_which_takes_a_tenth_of_a_second(self):
+        self.errors = []
+
+    def when_forty_threads_call_the_function_together(self):
+        threads = [threading.Thread(target=self.call) for _ in range(40)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def it_should_not_count_time_spent_waiting_for_a_worker_against_the_attempts(self):
+        assert self.errors == []
+
+    def call(self):
+        try:
+            retry_(lambda: time.sleep(0.1), ValueError, 1, attempt_timeout=0.5)
+        except AttemptTimeoutError as e:
+            self.errors.append(e)
+
+
+class WhenARetriedFunctionSucceedsFirstTime:
+    def given_a_function_decorated_with_retry(self):
+        self.x = 0
+        self.function = retry(ValueError, times=3, interval=1)(self.count)
+
+    def when_i_call_the_function(self):
+        with mock.patch('poll._exec') as self.exec_, mock.patch('time.perf_counter') as self.perf_counter:
+            self.result = self.function()
+
+    def it_should_return_the_result(self):
+        assert self.result == 1
+
+    def it_should_not_read_the_clock(self):
+        assert not self.perf_counter.called
+
+    def it_should_not_enter_the_retry_loop(self):
+        assert not self.exec_.called
+
+    def count(self):
+        self.x += 1
+        return self.x
@@ -0,0 +1,214 @@
+import multiprocessing
+import os
+import tempfile
+from unittest import mock
+from poll import circuitbreaker, CircuitBrokenError
+from poll.shared import SharedCircuitRegistry
+from contexts import catch
+
+
+def fail_in_another_process(path, times):
+    registry = SharedCircuitRegistry(path)
+
+    @circuitbreaker(ValueError, threshold=3, reset_timeout=60, name="backend", registry=registry)
+    def call():
+        raise ValueError
+
+    for _ in range(times):
+        try:
+            call()
+        except (ValueError, CircuitBrokenError):
+            pass
+
+
+class WhenAnotherProcessBreaksASharedCircuit:
+    def given_a_circuit_in_a_shared_registry(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "circuits")
+        self.registry = SharedCircuitRegistry(self.path)
+        self.x = 0
+
+        @circuitbreaker(ValueError, threshold=3, reset_timeout=60, name="backend", registry=self.registry)
+        def call():
+            self.x += 1
+        self.call = call
+
+    def when_the_other_process_fails_enough_times(self):
+        process = multiprocessing.get_context("fork").Process(target=fail_in_another_process, args=(self.path, 3))
+        process.start()
+        process.join()
+        self.exception = catch(self.call)
+
+    def it_should_break_the_circuit_in_this_process_too(self):
+        assert isinstance(self.exception, CircuitBrokenError)
+
+    def it_should_not_call_the_function(self):
+        assert self.x == 0
+
+    def cleanup_the_registry(self):
+        self.registry.close()
+        self.directory.cleanup()
+
+
+class WhenASharedCircuitRecovers:
+    def given_two_registries_on_the_same_file_with_a_broken_circuit(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "circuits")
+        self.patch = mock.patch('time.monotonic', return_value=100)
+        self.monotonic = self.patch.start()
+        self.registries = [SharedCircuitRegistry(path), SharedCircuitRegistry(path)]
+        self.fail = True
+
+        def make_call(registry):
+            @circuitbreaker(ValueError, threshold=2, reset_timeout=10, name="backend", registry=registry)
+            def call():
+                if self.fail:
+                    raise ValueError
+                return "ok"
+            return call
+
+        self.first, self.second = [make_call(r) for r in self.registries]
+        catch(self.first)
+        catch(self.first)
+
+    def when_a_trial_call_succeeds_through_one_of_them(self):
+        self.monotonic.return_value = 111
+        self.fail = False
+        self.first()
+
+    def it_should_close_the_circuit_for_the_other(self):
+        assert self.second() == "ok"
+
+    def cleanup_the_registries(self):
+        for registry in self.registries:
+            registry.close()
+        self.patch.stop()
+        self.directory.cleanup()
+
+
+class WhenTheSameFileIsOpenedTwiceInOneProcess:
+    def given_two_registries_on_the_same_file(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "circuits")
+        self.first = SharedCircuitRegistry(path)
+        self.second = SharedCircuitRegistry(path)
+        self.tables = (self.first._table, self.second._table)
+        self.exception = catch(SharedCircuitRegistry, path, slots=8)
+
+        @circuitbreaker(ValueError, threshold=1, reset_timeout=60, name="backend", registry=self.second)
+        def call():
+            raise ValueError
+        self.call = call
+
+    def when_one_of_them_is_closed(self):
+        self.first.close()
+        self.results = [catch(self.call), catch(self.call)]
+
+    def it_should_share_one_mapping_and_set_of_locks(self):
+        assert self.tables[0] is self.tables[1]
+
+    def it_should_keep_the_file_open_for_the_other(self):
+        assert isinstance(self.results[0], ValueError)
+        assert isinstance(self.results[1], CircuitBrokenError)
+
+    def it_should_refuse_to_open_the_file_with_a_different_size(self):
+        assert isinstance(self.exception, ValueError)
+
+    def cleanup_the_registry(self):
+        self.second.close()
+        self.directory.cleanup()
+
+
+class WhenTwoRegistriesUseACircuitWithDifferentThresholds:
+    def given_a_circuit_in_one_registry(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "circuits")
+        self.registries = [SharedCircuitRegistry(path, slots=1), SharedCircuitRegistry(path, slots=1)]
+        circuitbreaker(ValueError, threshold=4, reset_timeout=60, name="backend", registry=self.registries[0])(lambda: None)
+
+    def when_the_other_registry_uses_the_circuit_with_a_different_threshold(self):
+        self.exception = catch(circuitbreaker(ValueError, threshold=2, reset_timeout=60, name="backend", registry=self.registries[1]), lambda: None)
+
+    def it_should_throw_a_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+    def cleanup_the_registries(self):
+        for registry in self.registries:
+            registry.close()
+        self.directory.cleanup()
+
+
+class WhenOneRegistryUsesACircuitWithADifferentResetTimeout:
+    def given_a_circuit_in_a_registry(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = SharedCircuitRegistry(os.path.join(self.directory.name, "circuits"))
+        circuitbreaker(ValueError, threshold=2, reset_timeout=60, name="backend", registry=self.registry)(lambda: None)
+
+    def when_another_circuit_breaker_uses_the_circuit_with_a_different_reset_timeout(self):
+        self.exception = catch(circuitbreaker(ValueError, threshold=2, reset_timeout=30, name="backend", registry=self.registry), lambda: None)
+
+    def it_should_throw_a_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+    def cleanup_the_registry(self):
+        self.registry.close()
+        self.directory.cleanup()
+
+
+class WhenCircuitsHaveDifferentNames:
+    def given_a_shared_registry(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = SharedCircuitRegistry(os.path.join(self.directory.name, "circuits"))
+
+        @circuitbreaker(ValueError, threshold=1, reset_timeout=60, name="one", registry=self.registry)
+        def one():
+            raise ValueError
+
+        @circuitbreaker(ValueError, threshold=1, reset_timeout=60, name="two", registry=self.registry)
+        def two():
+            return "two"
+
+        self.one, self.two = one, two
+
+    def when_one_circuit_breaks(self):
+        catch(self.one)
+
+    def it_should_leave_the_other_closed(self):
+        assert self.two() == "two"
+
+    def cleanup_the_registry(self):
+        self.registry.close()
+        self.directory.cleanup()
+
+
+class WhenTheRegistryIsFull:
+    def given_a_registry_with_one_slot(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = SharedCircuitRegistry(os.path.join(self.directory.name, "circuits"), slots=1)
+        circuitbreaker(ValueError, 1, 60, name="one", registry=self.registry)(lambda: None)
+
+    def when_i_add_another_circuit(self):
+        self.exception = catch(circuitbreaker(ValueError, 1, 60, name="two", registry=self.registry), lambda: None)
+
+    def it_should_throw_a_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+    def cleanup_the_registry(self):
+        self.registry.close()
+        self.directory.cleanup()
+
+
+class WhenOpeningARegistryWithTheWrongSize:
+    def given_an_existing_registry(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "circuits")
+        SharedCircuitRegistry(self.path, slots=8).close()
+
+    def when_i_open_the_file_with_a_different_number_of_slots(self):
+        self.exception = catch(SharedCircuitRegistry, self.path, slots=16)
+
+    def it_should_throw_a_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+    def cleanup_the_directory(self):
+        self.directory.cleanup()
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from poll import retry, singleflight
+from poll import aio
+
+
+class ConcurrentCalls:
+    def make_concurrent_calls(self, f, args_list):
+        self.results = [None] * len(args_list)
+
+        def call(i, args):
+            try:
+                self.results[i] = f(*args)
+            except Exception as e:
+                self.results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i, args)) for i, args in enumerate(args_list)]
+        for t in threads:
+            t.start()
+        # give the other threads time to join the call in progress
+        self.entered.wait(5)
+        time.sleep(0.05)
+        self.release.set()
+        for t in threads:
+            t.join()
+
+
+class WhenManyThreadsMakeTheSameCall(ConcurrentCalls):
+    def given_a_slow_singleflight_function(self):
+        self.x = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+        @singleflight()
+        def fetch(key):
+            self.x += 1
+            self.entered.set()
+            self.release.wait(5)
+            return key.upper()
+        self.fetch = fetch
+
+    def when_ten_threads_call_the_function_at_once_followed_by_one_more_call(self):
+        self.make_concurrent_calls(self.fetch, [("a",)] * 10)
+        self.concurrent_x = self.x
+        self.fetch("a")
+
+    def it_should_only_call_the_function_once_for_the_concurrent_calls(self):
+        assert self.concurrent_x == 1
+
+    def it_should_give_every_caller_the_result(self):
+        assert self.results == ["A"] * 10
+
+    def it_should_call_the_function_afresh_for_the_later_call(self):
+        assert self.x == 2
+
+
+class WhenThreadsMakeCallsWithDifferentKeys(ConcurrentCalls):
+    def given_a_singleflight_function_with_a_key_function(self):
+        self.keys = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+        @singleflight(key=lambda key, attempt: key)
+        def fetch(key, attempt):
+            self.keys.append(key)
+            self.entered.set()
+            self.release.wait(5)
+            return key
+        self.fetch = fetch
+
+    def when_threads_call_the_function_with_two_keys(self):
+        self.make_concurrent_calls(self.fetch, [("a", 1), ("a", 2), ("b", 3), ("b", 4)])
+
+    def it_should_call_the_function_once_for_each_key(self):
+        assert sorted(self.keys) == ["a", "b"]
+
+    def it_should_give_each_caller_the_result_for_its_key(self):
+        assert self.results == ["a", "a", "b", "b"]
+
+
+class WhenTheSharedCallFails(ConcurrentCalls):
+    def given_a_singleflight_function_which_retries(self):
+        self.x = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.expected_exception = ValueError()
+
+        @singleflight()
+        @retry(ValueError, times=3, interval=0)
+        def fetch():
+            self.x += 1
+            self.entered.set()
+            self.release.wait(5)
+            raise self.expected_exception
+        self.fetch = fetch
+
+    def when_five_threads_call_the_function_at_once(self):
+        self.make_concurrent_calls(self.fetch, [()] * 5)
+
+    def it_should_share_the_retries(self):
+        assert self.x == 3
+
+    def it_should_give_every_caller_the_exception(self):
+        assert all(r is self.expected_exception for r in self.results)
+
+
+class WhenCoroutinesMakeTheSameCall:
+    def given_a_singleflight_coroutine_function(self):
+        self.x = 0
+
+        @aio.singleflight()
+        async def fetch(key):
+            self.x += 1
+            await asyncio.sleep(0.01)
+            return key.upper()
+        self.fetch = fetch
+
+    def when_ten_coroutines_call_the_function_at_once(self):
+        async def main():
+            return await asyncio.gather(*[self.fetch("a") for _ in range(10)], self.fetch("b"))
+        self.results = asyncio.run(main())
+
+    def it_should_call_the_function_once_for_each_key(self):
+        assert self.x == 2
+
+    def it_should_give_every_caller_the_result(self):
+        assert self.results == ["A"] * 10 + ["B"]
+
+
+class WhenOneOfTheCoroutinesIsCancelled:
+    def given_a_singleflight_coroutine_function(self):
+        @aio.singleflight()
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "done"
+        self.fetch = fetch
+
+    def when_the_first_caller_is_cancelled(self):
+        async def main():
+            first = asyncio.ensure_future(self.fetch())
+            second = asyncio.ensure_future(self.fetch())
+            await asyncio.sleep(0.005)
+            first.cancel()
+            return await asyncio.gather(first, second, return_exceptions=True)
+        self.results = asyncio.run(main())
+
+    def it_should_cancel_the_first_caller(self):
+        assert isinstance(self.results[0], asyncio.CancelledError)
+
+    def it_should_finish_the_call_for_the_second(self):
+        assert self.results[1] == "done"
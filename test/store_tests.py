@@ -0,0 +1,246 @@
+import os
+import tempfile
+import time
+from unittest import mock
+from poll import circuitbreaker, CircuitBrokenError
+from poll.store import CircuitState, CircuitStore, SQLiteCircuitStore, StoredCircuitRegistry
+from contexts import catch
+
+
+class HostsSharingAStore:
+    def make_hosts(self, threshold=2, sync_interval=None):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "circuits.db")
+        self.stores = [SQLiteCircuitStore(path), SQLiteCircuitStore(path)]
+        self.registries = [StoredCircuitRegistry(store, sync_interval) for store in self.stores]
+        self.fail = True
+        self.calls = 0
+
+        def make_call(registry):
+            @circuitbreaker(ValueError, threshold=threshold, reset_timeout=10, name="backend", registry=registry)
+            def call():
+                self.calls += 1
+                if self.fail:
+                    raise ValueError
+                return "ok"
+            return call
+
+        return [make_call(r) for r in self.registries]
+
+    def close_hosts(self):
+        for registry in self.registries:
+            registry.close()
+        for store in self.stores:
+            store.close()
+        self.directory.cleanup()
+
+
+class WhenAnotherHostBreaksTheCircuit(HostsSharingAStore):
+    def given_two_hosts(self):
+        self.first, self.second = self.make_hosts()
+
+    def when_the_first_host_breaks_the_circuit_and_they_both_sync(self):
+        catch(self.first)
+        catch(self.first)
+        self.registries[0].sync()
+        self.registries[1].sync()
+        self.calls = 0
+        self.exception = catch(self.second)
+
+    def it_should_break_the_circuit_on_the_second_host(self):
+        assert isinstance(self.exception, CircuitBrokenError)
+        assert self.calls == 0
+
+    def cleanup_the_hosts(self):
+        self.close_hosts()
+
+
+class WhenFailuresOnSeveralHostsAddUp(HostsSharingAStore):
+    def given_two_hosts(self):
+        self.first, self.second = self.make_hosts(threshold=2)
+
+    def when_each_host_fails_once_and_they_sync(self):
+        catch(self.first)
+        catch(self.second)
+        for registry in self.registries + self.registries:
+            registry.sync()
+        self.calls = 0
+        self.exceptions = [catch(self.first), catch(self.second)]
+
+    def it_should_break_the_circuit_on_both_hosts(self):
+        assert all(isinstance(e, CircuitBrokenError) for e in self.exceptions)
+        assert self.calls == 0
+
+    def cleanup_the_hosts(self):
+        self.close_hosts()
+
+
+class WhenAnotherHostClosesTheCircuit(HostsSharingAStore):
+    def given_two_hosts_with_a_broken_circuit(self):
+        self.patch = mock.patch('time.time', return_value=1000)
+        self.time = self.patch.start()
+        self.first, self.second = self.make_hosts()
+        catch(self.first)
+        catch(self.first)
+        self.registries[0].sync()
+        self.registries[1].sync()
+
+    def when_a_trial_call_succeeds_on_the_first_host_and_they_sync(self):
+        self.time.return_value = 1011
+        self.fail = False
+        self.first()
+        self.registries[0].sync()
+        self.registries[1].sync()
+
+    def it_should_close_the_circuit_on_the_second_host(self):
+        assert self.registries[1]._counters["backend"].state() == "ok"
+
+    def cleanup_the_hosts(self):
+        self.close_hosts()
+        self.patch.stop()
+
+
+class WhenHostsSyncInTheBackground(HostsSharingAStore):
+    def given_two_hosts_which_sync_often(self):
+        self.first, self.second = self.make_hosts(sync_interval=0.01)
+        catch(self.second)
+
+    def when_the_first_host_breaks_the_circuit(self):
+        catch(self.first)
+        catch(self.first)
+        counter = self.registries[1]._counters["backend"]
+        give_up = time.perf_counter() + 5
+        while counter.state() == "ok" and time.perf_counter() < give_up:
+            time.sleep(0.01)
+
+    def it_should_eventually_break_the_circuit_on_the_second_host(self):
+        assert isinstance(catch(self.second), CircuitBrokenError)
+
+    def cleanup_the_hosts(self):
+        self.close_hosts()
+
+
+class WhenTheStoreIsUnavailable:
+    def given_a_store_which_fails_once(self):
+        self.store = FlakyStore()
+        self.registry = StoredCircuitRegistry(self.store, sync_interval=None)
+
+        @circuitbreaker(ValueError, threshold=5, reset_timeout=10, name="backend", registry=self.registry)
+        def call():
+            raise ValueError
+        self.call = call
+
+    def when_i_sync_again_after_a_failed_sync(self):
+        catch(self.call)
+        self.exception = catch(self.registry.sync)
+        catch(self.call)
+        self.registry.sync()
+
+    def it_should_raise_the_error_from_the_store(self):
+        assert isinstance(self.exception, ConnectionError)
+
+    def it_should_write_every_failure_eventually(self):
+        assert len(self.store.written["backend"].failure_times) == 2
+
+
+class WhenTheStoreIsUnavailableForSeveralSyncs:
+    def given_a_store_which_fails_three_times(self):
+        self.store = FlakyStore(failures=3)
+        self.registry = StoredCircuitRegistry(self.store, sync_interval=None)
+        catch(circuitbreaker(ValueError, threshold=5, reset_timeout=10, name="backend", registry=self.registry)(self.fail))
+
+    def when_i_sync_until_the_store_comes_back(self):
+        self.failures = []
+        for _ in range(3):
+            catch(self.registry.sync)
+            self.failures.append(self.registry.consecutive_failures)
+        self.registry.sync()
+
+    def it_should_count_the_failures_in_a_row(self):
+        assert self.failures == [1, 2, 3]
+
+    def it_should_reset_the_count_once_a_sync_succeeds(self):
+        assert self.registry.consecutive_failures == 0
+
+    def fail(self):
+        raise ValueError
+
+
+class WhenABackgroundSyncFails:
+    def given_a_store_which_fails_twice(self):
+        self.store = FlakyStore(failures=2)
+        self.registry = StoredCircuitRegistry(self.store, sync_interval=0.01)
+        self.patch = mock.patch('poll.store._logger')
+        self.logger = self.patch.start()
+
+    def when_the_registry_syncs_in_the_background(self):
+        catch(circuitbreaker(ValueError, threshold=5, reset_timeout=10, name="backend", registry=self.registry)(self.fail))
+        give_up = time.perf_counter() + 5
+        while "backend" not in self.store.written and time.perf_counter() < give_up:
+            time.sleep(0.01)
+
+    def it_should_log_each_failure(self):
+        assert self.logger.warning.call_count == 2
+        assert [c[0][2] for c in self.logger.warning.call_args_list] == [1, 2]
+
+    def it_should_write_the_update_once_the_store_comes_back(self):
+        assert len(self.store.written["backend"].failure_times) == 1
+
+    def cleanup_the_registry(self):
+        self.registry.close()
+        self.patch.stop()
+
+    def fail(self):
+        raise ValueError
+
+
+class WhenCallingAStoredCircuit:
+    def given_a_store_which_counts_its_uses(self):
+        self.store = FlakyStore(failures=0)
+        self.registry = StoredCircuitRegistry(self.store, sync_interval=None)
+
+        @circuitbreaker(ValueError, threshold=5, reset_timeout=10, registry=self.registry)
+        def call():
+            return "ok"
+        self.call = call
+
+    def when_i_call_the_circuit_breaker(self):
+        for _ in range(10):
+            self.call()
+
+    def it_should_not_use_the_store(self):
+        assert self.store.uses == 0
+
+
+class WhenAStoreDoesNotImplementWrite:
+    def given_a_store_with_only_read(self):
+        class ReadOnlyStore(CircuitStore):
+            def read(self, names, since):
+                return {}
+        self.store_class = ReadOnlyStore
+
+    def when_i_create_the_store(self):
+        self.exception = catch(self.store_class)
+
+    def it_should_throw_a_type_error(self):
+        assert isinstance(self.exception, TypeError)
+
+
+class FlakyStore(CircuitStore):
+    def __init__(self, failures=1):
+        self.failures = failures
+        self.uses = 0
+        self.written = {}
+
+    def read(self, names, since):
+        self.uses += 1
+        return {}
+
+    def write(self, updates):
+        self.uses += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError
+        for name, update in updates.items():
+            old = self.written.get(name, CircuitState(None, None, []))
+            self.written[name] = CircuitState(update.broken_time, update.closed_time, old.failure_times + update.failure_times)